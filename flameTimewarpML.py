@@ -12,6 +12,7 @@ import importlib
 from pprint import pprint
 import threading
 import time
+import functools
 
 try:
     from PySide6 import QtWidgets, QtCore, QtGui
@@ -37,6 +38,176 @@ settings = {
     'version': 'v0.4.5 dev 004',
 }
 
+class JobStatusWatcher():
+    '''
+    Follows all running inference jobs from a single thread.
+
+    Inference processes connect to a unix socket and send JSON lines
+    with started, progress, error and finished events. Connections are
+    multiplexed with selectors, and the processes are checked once a second
+    so a job that dies without reporting is failed as well.
+    '''
+
+    def __init__(self):
+        import selectors
+        import socket
+        import tempfile
+
+        self.socket_path = os.path.join(tempfile.gettempdir(), f'twml_status_{os.getpid()}.sock')
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.socket_path)
+        self.server.listen()
+        self.server.setblocking(False)
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.server, selectors.EVENT_READ, data=None)
+
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def add_job(self, job_id, on_finished, on_error, on_preview = None, status_file = None):
+        with self.lock:
+            self.jobs[job_id] = {
+                'on_finished': on_finished,
+                'on_error': on_error,
+                'on_preview': on_preview,
+                'status_file': status_file,
+                'start_time': time.time(),
+                'process': None,
+                'exit_time': None,
+                'done': 0,
+                'total': 0,
+                'errors': []
+            }
+
+    def set_process(self, job_id, process):
+        with self.lock:
+            if job_id in self.jobs:
+                self.jobs[job_id]['process'] = process
+
+    def run(self):
+        import selectors
+
+        while True:
+            for key, mask in self.selector.select(timeout=1.0):
+                if key.data is None:
+                    connection, address = self.server.accept()
+                    connection.setblocking(False)
+                    self.selector.register(connection, selectors.EVENT_READ, data={'buffer': b''})
+                else:
+                    self.read_connection(key)
+            self.check_processes()
+
+    def read_connection(self, key):
+        import json
+
+        connection = key.fileobj
+        try:
+            chunk = connection.recv(65536)
+        except BlockingIOError:
+            return
+        except Exception:
+            chunk = b''
+        if not chunk:
+            self.selector.unregister(connection)
+            connection.close()
+            return
+
+        key.data['buffer'] += chunk
+        while b'\n' in key.data['buffer']:
+            line, key.data['buffer'] = key.data['buffer'].split(b'\n', 1)
+            try:
+                self.handle_event(json.loads(line.decode('utf-8')))
+            except Exception as e:
+                print (f'Unable to handle job status: {e}')
+
+    def handle_event(self, event):
+        with self.lock:
+            job = self.jobs.get(event.get('job'))
+        if not job:
+            return
+
+        event_type = event.get('event')
+        if event_type in ('started', 'progress'):
+            job['done'] = event.get('done', 0)
+            job['total'] = event.get('total', job['total'])
+        elif event_type == 'error':
+            job['errors'].append(event.get('message', ''))
+            print (f'{event.get("job")}: {event.get("message")}')
+        elif event_type == 'preview':
+            if job['on_preview']:
+                job['on_preview'](event.get('folder'))
+        elif event_type == 'finished':
+            with self.lock:
+                self.jobs.pop(event.get('job'), None)
+            if event.get('success'):
+                job['on_finished']()
+            else:
+                job['on_error']('\n'.join(job['errors']) if job['errors'] else 'Processing failed')
+
+    def check_processes(self):
+        with self.lock:
+            jobs = list(self.jobs.items())
+        for job_id, job in jobs:
+            if job['process'] is None or job['process'].poll() is None:
+                continue
+            # give the last events a moment to arrive through the socket
+            if job['exit_time'] is None:
+                job['exit_time'] = time.time()
+                continue
+            if time.time() - job['exit_time'] < 2:
+                continue
+            # inference writes events to status file as well, it is the only
+            # place to find them if it was unable to connect to the socket
+            finished = self.read_status_file(job_id, job)
+            if finished:
+                self.handle_event(finished)
+                continue
+            with self.lock:
+                self.jobs.pop(job_id, None)
+            job['on_error'](f'Inference process exited with code {job["process"].returncode}')
+
+    def read_status_file(self, job_id, job):
+        import json
+
+        if not job['status_file'] or not os.path.isfile(job['status_file']):
+            return None
+        finished = None
+        errors = []
+        try:
+            with open(job['status_file'], 'r') as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except Exception:
+                        continue
+                    # skip events left from earlier run of the same job
+                    if event.get('job') != job_id or event.get('time', 0) < job['start_time']:
+                        continue
+                    if event.get('event') == 'error':
+                        errors.append(event.get('message', ''))
+                    elif event.get('event') == 'finished':
+                        finished = event
+        except Exception as e:
+            print (f'Unable to read job status from {job["status_file"]}: {e}')
+            return None
+        if finished and not job['errors']:
+            job['errors'] = errors
+        return finished
+
+job_status_watcher = None
+
+def get_job_status_watcher():
+    global job_status_watcher
+    if job_status_watcher is None:
+        job_status_watcher = JobStatusWatcher()
+    return job_status_watcher
+
 class ApplyModelDialog():
 
     def __init__(self, selection, mode):
@@ -74,9 +245,6 @@ class ApplyModelDialog():
         if not self.verified_clips:
             return
 
-        self.loops = []
-        self.threads = True
-        
         self.main_window()
 
     def verify_selection(self, selection, mode):
@@ -187,6 +355,20 @@ class ApplyModelDialog():
                 return
             return verified_clips
         
+        elif mode == 'dedup':
+            verified_clips = []
+            for item in selection:
+                if isinstance(item, (flame.PyClip)):
+                    verified_clips.append(item)
+            if not verified_clips:
+                dialog = flame.messages.show_in_dialog(
+                title = f'{settings["app_name"]}',
+                message = 'Please select at least one clip',
+                type = 'error',
+                buttons = ['Ok'])
+                return
+            return verified_clips
+
         elif mode == 'finetune':
             verified_clips = []
             for item in selection:
@@ -254,12 +436,22 @@ class ApplyModelDialog():
             self.fw.prefs['half'] = self.half_button.isChecked()
             self.fw.save_prefs()
 
+        def preview():
+            self.fw.prefs['preview'] = self.preview_button.isChecked()
+            self.fw.save_prefs()
+
+        def dedup_remove():
+            self.fw.prefs['dedup_remove'] = self.dedup_remove_button.isChecked()
+            self.fw.save_prefs()
+
         # Create export and apply window
         window_title = f'{settings["app_name"]} <small>{settings["version"]}'
         if self.mode == 'timewarp':
             window_title += ' [Timewarp from Flame]'
         elif self.mode == 'fluidmorph':
             window_title += ' [Fluidmorph]'
+        elif self.mode == 'dedup':
+            window_title += ' [Fill / Remove Duplicate Frames]'
         elif self.mode == 'finetune':
             return self.main_window_finetune()
 
@@ -318,6 +510,20 @@ class ApplyModelDialog():
             connect=half
         )
 
+        self.preview_button = PyFlamePushButton(
+            text='Preview',
+            button_checked = self.fw.prefs.get('preview', False),
+            tooltip = 'Import a quick preview first, it updates to full quality as frames are rendered',
+            connect=preview
+        )
+
+        self.dedup_remove_button = PyFlamePushButton(
+            text='Remove',
+            button_checked = self.fw.prefs.get('dedup_remove', False),
+            tooltip = 'Remove duplicate frames instead of filling them with interpolated ones',
+            connect=dedup_remove
+        )
+
         self.export_and_apply_button = PyFlameButton(
             text='Export and Apply',
             connect=self.apply,
@@ -341,6 +547,10 @@ class ApplyModelDialog():
         grid_layout.setColumnMinimumWidth(3, 120)
 
         grid_layout.addWidget(self.options_label, 0, 0)
+        if self.mode == 'timewarp':
+            grid_layout.addWidget(self.preview_button, 0, 3)
+        elif self.mode == 'dedup':
+            grid_layout.addWidget(self.dedup_remove_button, 0, 3)
         grid_layout.addWidget(self.half_button, 0, 4)
         grid_layout.addWidget(self.iterative_button, 0, 5)
 
@@ -637,12 +847,16 @@ class ApplyModelDialog():
             self.apply_timewarp()
         elif self.mode == 'fluidmorph':
             self.apply_fluidmorph()
+        elif self.mode == 'dedup':
+            self.apply_dedup()
 
         # Close export and apply window
         self.window.close()
 
     def apply_timewarp(self):
         number_of_clips = 0
+        # scratch space estimated for clips already sent in this batch
+        reserved_bytes = 0
 
         for clip, tw_setup_string in self.verified_clips:
             number_of_clips += 1
@@ -678,7 +892,7 @@ class ApplyModelDialog():
                         os.path.join(
                             os.path.dirname(__file__), 
                             'presets', 
-                            'source_export32.xml'
+                            'source_export32bit.xml'
                         )
                     )
             else:
@@ -690,11 +904,35 @@ class ApplyModelDialog():
                         )
                     )
             
-            self.export_clip(clip, source_clip_folder, export_preset=export_preset)
-
             record_in = clip.versions[0].tracks[0].segments[0].record_in.relative_frame
             record_out = clip.versions[0].tracks[0].segments[0].record_out.relative_frame
 
+            # only export source frames the curve actually uses
+            source_duration = clip.duration.frame
+            source_first, source_last = self.get_source_frame_range(tw_setup_string, record_in, record_out, source_duration)
+
+            # preview pass renders each preview_step output frame to its own folder,
+            # frames in between and full quality ones replacing them are hard links
+            preview = self.fw.prefs.get('preview', False)
+            preview_step = 4
+            preview_folder = f'{result_folder}_preview'
+            preview_frames = (record_out - record_in + preview_step) // preview_step if preview else 0
+
+            required_bytes = self.estimate_scratch_bytes(clip, source_last - source_first + 1, record_out - record_in + 1, preview_frames)
+            if not self.confirm_scratch_space(clip_name, required_bytes, reserved_bytes):
+                return False
+            reserved_bytes += required_bytes
+
+            # export runs in background and inference picks up
+            # source frames as they are written
+            self.export_clip(
+                clip,
+                source_clip_folder,
+                export_preset=export_preset,
+                foreground=False,
+                frame_range=(source_first, source_last) if (source_first, source_last) != (1, source_duration) else None
+                )
+
             json_info = {}
             json_info['mode'] = 'timewarp'
             json_info['input'] = source_clip_folder
@@ -707,6 +945,17 @@ class ApplyModelDialog():
             json_info['settings'] = self.settings
             json_info['cpu'] = self.fw.prefs.get('cpu')
             json_info['half'] = self.fw.prefs.get('half')
+            job_status_watcher = get_job_status_watcher()
+            json_info['job_id'] = tw_clip_name
+            json_info['status_file'] = os.path.join(result_folder, f'{tw_clip_name}.status.jsonl')
+            json_info['status_socket'] = job_status_watcher.socket_path
+            json_info['stream_source'] = True
+            json_info['source_duration'] = source_last - source_first + 1
+            json_info['source_offset'] = source_first - 1
+            json_info['cleanup_source'] = True
+            json_info['preview'] = preview
+            json_info['preview_step'] = preview_step
+            json_info['preview_folder'] = preview_folder
 
             lockfile_path = os.path.join(
                 result_folder,
@@ -725,24 +974,15 @@ class ApplyModelDialog():
                     buttons = ['Ok'])
                 return False
 
-            # '''
             new_clip_name = clip_name + '_TWML'
-            watcher = threading.Thread(
-                target=self.import_watcher, 
-                args=(
-                    result_folder, 
-                    new_clip_name, 
-                    clip, 
-                    [source_clip_folder],
-                    lockfile_path
-                    )
-                )
-            watcher.daemon = True
-            watcher.start()
-            self.loops.append(watcher)
-            # '''
-
-            self.run_inference(lockfile_path)
+            job_status_watcher.add_job(
+                tw_clip_name,
+                on_finished = functools.partial(self.import_result, result_folder, new_clip_name, clip, [source_clip_folder, preview_folder]),
+                on_error = functools.partial(self.report_job_error, new_clip_name),
+                on_preview = functools.partial(self.import_preview, clip_name + '_TWML_preview', clip),
+                status_file = json_info['status_file']
+            )
+            job_status_watcher.set_process(tw_clip_name, self.run_inference(lockfile_path))
 
     def apply_fluidmorph(self):
             incoming_clip = self.verified_clips[0]
@@ -792,6 +1032,10 @@ class ApplyModelDialog():
             json_info['settings'] = self.settings
             json_info['cpu'] = self.fw.prefs.get('cpu')
             json_info['half'] = self.fw.prefs.get('half')
+            job_status_watcher = get_job_status_watcher()
+            json_info['job_id'] = tw_clip_name
+            json_info['status_file'] = os.path.join(result_folder, f'{tw_clip_name}.status.jsonl')
+            json_info['status_socket'] = job_status_watcher.socket_path
 
             lockfile_path = os.path.join(
                 result_folder,
@@ -810,24 +1054,106 @@ class ApplyModelDialog():
                     buttons = ['Ok'])
                 return False
 
-            # '''
             new_clip_name = clip_name + '_TWML'
-            watcher = threading.Thread(
-                target=self.import_watcher, 
-                args=(
-                    result_folder, 
-                    new_clip_name, 
-                    incoming_clip, 
-                    [incoming_folder, outgoing_folder],
-                    lockfile_path
+            job_status_watcher.add_job(
+                tw_clip_name,
+                on_finished = functools.partial(self.import_result, result_folder, new_clip_name, incoming_clip, [incoming_folder, outgoing_folder]),
+                on_error = functools.partial(self.report_job_error, new_clip_name),
+                status_file = json_info['status_file']
+            )
+            job_status_watcher.set_process(tw_clip_name, self.run_inference(lockfile_path))
+
+    def apply_dedup(self):
+        # scratch space estimated for clips already sent in this batch
+        reserved_bytes = 0
+
+        for clip in self.verified_clips:
+            clip_name = clip.name.get_value()
+            tw_clip_name = self.fw.sanitized(clip_name) + '_TWML' + '_' + self.fw.create_timestamp_uid()
+
+            result_folder = os.path.abspath(
+                os.path.join(
+                    self.working_folder, 
+                    tw_clip_name
                     )
                 )
-            watcher.daemon = True
-            watcher.start()
-            self.loops.append(watcher)
-            # '''
 
-            self.run_inference(lockfile_path)
+            clip.render()
+            source_clip_folder = os.path.join(result_folder, 'source')
+
+            if clip.bit_depth == 32:
+                export_preset = self.create_export_preset(
+                        os.path.join(
+                            os.path.dirname(__file__), 
+                            'presets', 
+                            'source_export32bit.xml'
+                        )
+                    )
+            else:
+                export_preset = self.create_export_preset(
+                        os.path.join(
+                            os.path.dirname(__file__), 
+                            'presets', 
+                            'source_export.xml'
+                        )
+                    )
+
+            source_duration = clip.duration.frame
+            required_bytes = self.estimate_scratch_bytes(clip, source_duration, source_duration)
+            if not self.confirm_scratch_space(clip_name, required_bytes, reserved_bytes):
+                return False
+            reserved_bytes += required_bytes
+
+            # duplicates are detected while the source is being exported
+            self.export_clip(
+                clip,
+                source_clip_folder,
+                export_preset=export_preset,
+                foreground=False
+                )
+
+            json_info = {}
+            json_info['mode'] = 'dedup'
+            json_info['input'] = source_clip_folder
+            json_info['output'] = result_folder
+            json_info['clip_name'] = tw_clip_name
+            json_info['model_path'] = self.fw.prefs.get('model_path')
+            json_info['settings'] = self.settings
+            json_info['cpu'] = self.fw.prefs.get('cpu')
+            json_info['half'] = self.fw.prefs.get('half')
+            json_info['dedup_action'] = 'remove' if self.fw.prefs.get('dedup_remove') else 'fill'
+            job_status_watcher = get_job_status_watcher()
+            json_info['job_id'] = tw_clip_name
+            json_info['status_file'] = os.path.join(result_folder, f'{tw_clip_name}.status.jsonl')
+            json_info['status_socket'] = job_status_watcher.socket_path
+            json_info['stream_source'] = True
+            json_info['source_duration'] = source_duration
+
+            lockfile_path = os.path.join(
+                result_folder,
+                f'{tw_clip_name}.json'
+            )
+
+            try:
+                import json
+                with open(lockfile_path, 'w') as json_file:
+                    json.dump(json_info, json_file, indent=4)
+            except Exception as e:
+                dialog = flame.messages.show_in_dialog(
+                    title = f'{settings["app_name"]}',
+                    message = f'Unable to save {lockfile_path}: {e}',
+                    type = 'error',
+                    buttons = ['Ok'])
+                return False
+
+            new_clip_name = clip_name + '_TWML'
+            job_status_watcher.add_job(
+                tw_clip_name,
+                on_finished = functools.partial(self.import_result, result_folder, new_clip_name, clip, [source_clip_folder]),
+                on_error = functools.partial(self.report_job_error, new_clip_name),
+                status_file = json_info['status_file']
+            )
+            job_status_watcher.set_process(tw_clip_name, self.run_inference(lockfile_path))
 
     def apply_finetune(self):
         self.src_model_path = self.src_model_path_entry.text()
@@ -1019,7 +1345,7 @@ class ApplyModelDialog():
         # print (f'command: {conda_python_path} {inference_script_path} {lockfile_path}')
 
         import subprocess
-        subprocess.Popen([conda_python_path, inference_script_path, lockfile_path], env=env)
+        return subprocess.Popen([conda_python_path, inference_script_path, lockfile_path], env=env)
 
         '''
         if platform.system() == 'Darwin':
@@ -1051,7 +1377,36 @@ class ApplyModelDialog():
             os.system(ml_cmd)
         '''
 
-    def import_watcher(self, import_path, new_clip_name, clip, folders_to_cleanup, lockfile):
+    def report_job_error(self, new_clip_name, message):
+        import flame
+
+        def show_error():
+            flame.messages.show_in_dialog(
+                title = f'{settings["app_name"]}',
+                message = f'Unable to render {new_clip_name}:\n{message}',
+                type = 'error',
+                buttons = ['Ok'])
+
+        print (f'{new_clip_name}: {message}')
+        flame.schedule_idle_event(show_error)
+
+    def import_preview(self, new_clip_name, clip, import_path):
+        # preview frames are replaced in place by the full quality ones,
+        # so the imported clip gets better as the render goes on
+        import flame
+
+        def import_flame_clip():
+            import flame
+            new_clips = flame.import_clips(import_path, clip.parent)
+            if len(new_clips) > 0:
+                new_clip = new_clips[0]
+                if new_clip:
+                    new_clip.name.set_value(new_clip_name)
+
+        print('Importing preview from: %s' % import_path)
+        flame.schedule_idle_event(import_flame_clip)
+
+    def import_result(self, import_path, new_clip_name, clip, folders_to_cleanup):
         flame_friendly_path = None
         destination = clip.parent
         def import_flame_clip():
@@ -1076,57 +1431,110 @@ class ApplyModelDialog():
             '''
             # End of Colour Mgmt logic for future settin
 
-        while self.threads:
-            if not os.path.isfile(lockfile):
+        # clean-up source files used
+        print(f'Cleaning up temporary files used: {folders_to_cleanup}')
+        for folder in folders_to_cleanup:
+            # preview folder is only there if preview pass has run
+            if not os.path.isdir(folder):
+                continue
+            cmd = 'rm -f "' + os.path.abspath(folder) + '/"*'
+            print('Executing command: %s' % cmd)
+            os.system(cmd)
+            try:
+                os.rmdir(folder)
+            except Exception as e:
+                print('Error removing %s: %s' % (folder, e))
 
-                # clean-up source files used
-                print(f'Cleaning up temporary files used: {folders_to_cleanup}')
-                for folder in folders_to_cleanup:
-                    cmd = 'rm -f "' + os.path.abspath(folder) + '/"*'
-                    print('Executing command: %s' % cmd)
-                    os.system(cmd)
-                    try:
-                        os.rmdir(folder)
-                    except Exception as e:
-                        print('Error removing %s: %s' % (folder, e))
-            
-                print('Importing result from: %s' % import_path)
-                flame_friendly_path = import_path
-                flame.schedule_idle_event(import_flame_clip)
-                
-                '''
-                file_names = [f for f in os.listdir(import_path) if f.endswith('.exr')]
-                print (file_names)
-
-                if file_names:
-                    file_names.sort()
-                    first_name, ext = os.path.splitext(file_names[0])
-                    last_name, ext = os.path.splitext(file_names[-1])
-                    first_frame = first_name.split('.')[-1]
-                    last_frame = last_name.split('.')[-1]
-                    flame_friendly_path = os.path.join(import_path, '[' + first_frame + '-' + last_frame + ']' + '.exr')
-
-                    print (flame_friendly_path)
-
-                    import flame
-                    flame.schedule_idle_event(import_flame_clip)
-                '''
-
-                '''
-                if os.getenv('FLAMETWML_HARDCOMMIT') == 'True':
-                    time.sleep(1)
-                    cmd = 'rm -f "' + os.path.abspath(import_path) + '/"*'
-                    print('Executing command: %s' % cmd)
-                    os.system(cmd)
-                    try:
-                        os.rmdir(import_path)
-                    except Exception as e:
-                        print('Error removing %s: %s' % (import_path, e))
-                '''
-                break
-            time.sleep(0.1)
+        print('Importing result from: %s' % import_path)
+        import flame
+        flame_friendly_path = import_path
+        flame.schedule_idle_event(import_flame_clip)
+
+        '''
+        file_names = [f for f in os.listdir(import_path) if f.endswith('.exr')]
+        print (file_names)
+
+        if file_names:
+            file_names.sort()
+            first_name, ext = os.path.splitext(file_names[0])
+            last_name, ext = os.path.splitext(file_names[-1])
+            first_frame = first_name.split('.')[-1]
+            last_frame = last_name.split('.')[-1]
+            flame_friendly_path = os.path.join(import_path, '[' + first_frame + '-' + last_frame + ']' + '.exr')
 
-    def export_clip(self, clip, export_dir, export_preset = None):
+            print (flame_friendly_path)
+
+            import flame
+            flame.schedule_idle_event(import_flame_clip)
+        '''
+
+        '''
+        if os.getenv('FLAMETWML_HARDCOMMIT') == 'True':
+            time.sleep(1)
+            cmd = 'rm -f "' + os.path.abspath(import_path) + '/"*'
+            print('Executing command: %s' % cmd)
+            os.system(cmd)
+            try:
+                os.rmdir(import_path)
+            except Exception as e:
+                print('Error removing %s: %s' % (import_path, e))
+        '''
+
+    def estimate_scratch_bytes(self, clip, source_frames, output_frames, preview_frames = 0):
+        # uncompressed RGB exr: source is exported as half or full float
+        # depending on clip bit depth, inference writes half float
+        pixels = clip.width * clip.height * 3
+        source_bytes = pixels * (4 if clip.bit_depth == 32 else 2) * source_frames
+        output_bytes = pixels * 2 * (output_frames + preview_frames)
+        return source_bytes + output_bytes
+
+    def confirm_scratch_space(self, clip_name, required_bytes, reserved_bytes):
+        # asks to continue if scratch space left after clips already
+        # queued in this run is not enough for the given clip
+        import flame
+
+        free_bytes = self.get_free_bytes(self.working_folder) - reserved_bytes
+        if required_bytes <= free_bytes:
+            return True
+        dialog = flame.messages.show_in_dialog(
+            title = f'{settings["app_name"]}',
+            message = f'{clip_name} needs about {required_bytes / (1024 ** 3):.1f} GB of scratch space, '
+                      f'{max(free_bytes, 0) / (1024 ** 3):.1f} GB available in {self.working_folder}',
+            type = 'question',
+            buttons = ['Continue'],
+            cancel_button = 'Cancel')
+        return dialog != 'Cancel'
+
+    def get_free_bytes(self, folder):
+        import shutil
+        try:
+            return shutil.disk_usage(folder).free
+        except Exception as e:
+            print (f'Unable to get free space for {folder}: {e}')
+            return float('inf')
+
+    def get_source_frame_range(self, tw_setup_string, record_in, record_out, source_duration):
+        # bake timewarp curve with the same code inference uses
+        # and return first and last source frames it references
+        import importlib.util
+
+        inference_script_path = os.path.join(
+            os.path.dirname(__file__),
+            'pytorch',
+            'flameTimewarpML_inference.py'
+        )
+
+        try:
+            spec = importlib.util.spec_from_file_location('flameTimewarpML_inference', inference_script_path)
+            inference_module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(inference_module)
+            frame_value_map = inference_module.bake_flame_tw_setup(tw_setup_string, record_in, record_out)
+            return inference_module.get_source_frame_range(frame_value_map, record_in, record_out, source_duration)
+        except Exception as e:
+            print (f'Unable to bake timewarp setup, exporting full clip: {e}')
+            return 1, source_duration
+
+    def export_clip(self, clip, export_dir, export_preset = None, foreground = True, frame_range = None):
         import flame
 
         if not os.path.isdir(export_dir):
@@ -1160,7 +1568,7 @@ class ApplyModelDialog():
                 return "overwrite"
 
         exporter = flame.PyExporter()
-        exporter.foreground = True
+        exporter.foreground = foreground
 
         if not export_preset:
             for visibility in range(4):
@@ -1170,7 +1578,32 @@ class ApplyModelDialog():
                 if os.path.isfile(export_preset):
                     break
 
-        exporter.export(clip, export_preset, export_dir, hooks=ExportHooks())
+        if frame_range:
+            # marks are set temporarily to export only given
+            # source frames, out mark is exclusive.
+            # unset marks read back as None
+            saved_marks = []
+            for mark_name in ('in_mark', 'out_mark'):
+                try:
+                    saved_marks.append(getattr(clip, mark_name).get_value())
+                except Exception:
+                    saved_marks.append(None)
+
+        try:
+            if frame_range:
+                clip.in_mark = frame_range[0]
+                clip.out_mark = frame_range[1] + 1
+                exporter.export_between_marks = True
+            exporter.export(clip, export_preset, export_dir, hooks=ExportHooks())
+        finally:
+            if frame_range:
+                # restore user marks even if export fails,
+                # marks that were not set before are cleared
+                for mark_name, saved_value in zip(('in_mark', 'out_mark'), saved_marks):
+                    try:
+                        setattr(clip, mark_name, saved_value)
+                    except Exception as e:
+                        print (f'Warning: unable to restore {mark_name} on exported clip: {e}')
 
     def create_export_preset(self, export_preset_path):
         import flame
@@ -1283,11 +1716,7 @@ def get_media_panel_custom_ui_actions():
         ApplyModelDialog(selection, mode='finetune')
 
     def deduplicate(selection):
-        dialog = flame.messages.show_in_dialog(
-            title = f'{settings["app_name"]}',
-            message = f'Not yet implemented in {settings["version"]}',
-            type = 'error',
-            buttons = ['Ok'])
+        ApplyModelDialog(selection, mode='dedup')
 
     menu = [
         {
@@ -0,0 +1,298 @@
+import os
+import sys
+import argparse
+import platform
+import json
+import time
+import shutil
+import tempfile
+
+try:
+    import numpy as np
+    import torch
+except:
+    python_executable_path = sys.executable
+    if '.miniconda' in python_executable_path:
+        print ('Unable to import Numpy and PyTorch libraries')
+        print (f'Using {python_executable_path} python interpreter')
+        sys.exit()
+
+from flameTimewarpML_inference import Timewarp, write_exr, read_openexr_file
+
+tw_setup_template = '''<Setup>
+    <Base>
+        <Version>21.020000</Version>
+        <NAME>Timewarp</NAME>
+        <Range Enable="False" Before="1" After="1" Start="1" End="{end_frame}" SpanEnable="False" Span="100"/>
+    </Base>
+    <State>
+        <TW_RetimerMode>1</TW_RetimerMode>
+        <TW_Timing>
+            <Channel Name="Timing">
+                <Extrap>linear</Extrap>
+                <Value>1</Value>
+                <Size>{size}</Size>
+                <KeyVersion>2</KeyVersion>
+                <KFrames>
+{keys}
+                </KFrames>
+                <Uncollapsed/>
+            </Channel>
+        </TW_Timing>
+    </State>
+</Setup>
+'''
+
+tw_key_template = '''                    <Key Index="{index}">
+                        <Frame>{frame}</Frame>
+                        <Value>{value}</Value>
+                        <RHandle_dX>0.250000</RHandle_dX>
+                        <RHandle_dY>0.250000</RHandle_dY>
+                        <LHandle_dX>-0.250000</LHandle_dX>
+                        <LHandle_dY>-0.250000</LHandle_dY>
+                        <CurveMode>linear</CurveMode>
+                        <CurveOrder>linear</CurveOrder>
+                    </Key>'''
+
+def generate_sequence(folder, width, height, length, seed=42):
+    """
+    Writes a deterministic synthetic EXR sequence of moving patterns.
+
+    A tiled noise texture scrolls diagonally across the frame while a few
+    solid discs travel over it at different speeds, so there is both global
+    and local motion for the flow to pick up.
+
+    :param folder: Destination folder.
+    :param width: Frame width.
+    :param height: Frame height.
+    :param length: Number of frames.
+    :param seed: Random seed for the texture and disc layout.
+    :return: Sorted list of written file paths.
+    """
+
+    rng = np.random.RandomState(seed)
+
+    texture = rng.rand(height // 8 + 1, width // 8 + 1, 3).astype(np.float32)
+    texture = np.repeat(np.repeat(texture, 8, axis=0), 8, axis=1)[:height, :width]
+    gradient = np.linspace(0.1, 0.9, width, dtype=np.float32)[np.newaxis, :, np.newaxis]
+    background = 0.5 * texture + 0.5 * gradient
+
+    discs = []
+    for _ in range(5):
+        discs.append({
+            'x': rng.uniform(0, width),
+            'y': rng.uniform(0, height),
+            'dx': rng.uniform(-12, 12),
+            'dy': rng.uniform(-6, 6),
+            'r': rng.uniform(0.04, 0.12) * min(width, height),
+            'color': rng.uniform(0, 2, 3).astype(np.float32)
+        })
+
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+
+    file_paths = []
+    for frame_index in range(length):
+        image = np.roll(background, (frame_index * 3, frame_index * 5), axis=(0, 1)).copy()
+        for disc in discs:
+            cx = (disc['x'] + disc['dx'] * frame_index) % width
+            cy = (disc['y'] + disc['dy'] * frame_index) % height
+            inside = ((xx - cx) ** 2 + (yy - cy) ** 2) < disc['r'] ** 2
+            image[inside] = disc['color']
+        file_path = os.path.join(folder, f'benchmark_source.{frame_index + 1:08}.exr')
+        write_exr(image.astype(np.float16), file_path)
+        file_paths.append(file_path)
+
+    return file_paths
+
+def build_tw_setup(length, speeds):
+    """
+    Builds a Flame timewarp setup with a piecewise linear timing curve.
+
+    The source range is split evenly between the given speeds, each
+    segment playing back at its own speed in percent.
+
+    :param length: Source sequence length.
+    :param speeds: List of speeds in percent.
+    :return: Tuple of setup string and output duration.
+    """
+
+    segment_length = (length - 1) / len(speeds)
+    frame = 1
+    value = 1.
+    keys = [tw_key_template.format(index=0, frame=frame, value=value)]
+    for index, speed in enumerate(speeds, start=1):
+        segment_duration = max(1, int(round(segment_length * 100 / speed)))
+        frame += segment_duration
+        value += segment_duration * speed / 100
+        keys.append(tw_key_template.format(index=index, frame=frame, value=round(value, 6)))
+
+    tw_setup_string = tw_setup_template.format(
+        end_frame = frame,
+        size = len(keys),
+        keys = '\n'.join(keys)
+    )
+    return tw_setup_string, frame
+
+def get_process_peak_rss():
+    # high-water mark since process start (ru_maxrss), it can not be
+    # reset so it covers model loading, warmup and all previous runs
+    import resource
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    if platform.system() == 'Darwin':
+        return max_rss / (1024 ** 2)
+    return max_rss / 1024
+
+def reset_device_memory(device):
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+        torch.cuda.reset_peak_memory_stats(device)
+
+def get_device_memory(device):
+    if device.type == 'cuda':
+        return torch.cuda.max_memory_allocated(device) / (1024 ** 2)
+    elif device.type == 'mps':
+        # there is no peak counter for mps, report what the driver holds now
+        return torch.mps.driver_allocated_memory() / (1024 ** 2)
+    return 0.
+
+def append_csv(csv_path, rows):
+    import csv
+    write_header = not os.path.isfile(csv_path)
+    with open(csv_path, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        if write_header:
+            writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end inference benchmark on a synthetic EXR sequence.')
+    parser.add_argument('--model_path', type=str, default=None, help='Path to model state file (default: models/flownet4.pth)')
+    parser.add_argument('--frame_size', type=str, default='1920x1080', help='Frame size (default: 1920x1080)')
+    parser.add_argument('--length', type=int, default=24, help='Source sequence length in frames (default: 24)')
+    parser.add_argument('--speed', type=str, default='50', help='Speed in percent, comma separated for a piecewise curve (default: 50)')
+    parser.add_argument('--device', type=str, default=None, help='Torch device, i.e. cuda:0, mps or cpu (default: mps on macOS, cuda otherwise)')
+    parser.add_argument('--half', action='store_true', default=False, help='Use half precision')
+    parser.add_argument('--warmup', type=int, default=2, help='Number of untimed warmup predictions (default: 2)')
+    parser.add_argument('--runs', type=int, default=1, help='Number of timed runs (default: 1)')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for the synthetic sequence (default: 42)')
+    parser.add_argument('--work_folder', type=str, default=None, help='Folder for source and rendered frames (default: temporary folder)')
+    parser.add_argument('--keep', action='store_true', default=False, help='Keep rendered frames')
+    parser.add_argument('--output', type=str, default='benchmark', help='Results file name without extension (default: benchmark)')
+    parser.add_argument('--adaptive_exit', type=float, default=None, help='Enable adaptive cascade exit with given flow threshold in pixels')
+    parser.add_argument('--sparse_tiles', action='store_true', default=False, help='Run model only on changing tiles')
+    parser.add_argument('--profile', action='store_true', default=False, help='Profile model blocks and warps')
+    parser.add_argument('--label', type=str, default='', help='Free-form label stored with results, i.e. release version')
+
+    args = parser.parse_args()
+
+    w, h = args.frame_size.split('x')
+    h, w = int(h), int(w)
+    speeds = [float(x) for x in args.speed.split(',')]
+
+    model_path = args.model_path
+    if not model_path:
+        model_path = os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            'models',
+            'flownet4.pth'
+        )
+
+    work_folder = args.work_folder if args.work_folder else tempfile.mkdtemp(prefix='twml_benchmark_')
+    source_folder = os.path.join(work_folder, 'source')
+    result_folder = os.path.join(work_folder, 'result')
+    os.makedirs(source_folder, exist_ok=True)
+    os.makedirs(result_folder, exist_ok=True)
+
+    print (f'Generating {args.length} frames {w}x{h} in {source_folder}')
+    src_files = generate_sequence(source_folder, w, h, args.length, seed=args.seed)
+    tw_setup_string, duration = build_tw_setup(args.length, speeds)
+
+    json_info = {
+        'mode': 'timewarp',
+        'input': source_folder,
+        'output': result_folder,
+        'clip_name': 'benchmark_result',
+        'model_path': model_path,
+        'setup': tw_setup_string,
+        'record_in': 1,
+        'record_out': duration,
+        'settings': {},
+        'cpu': args.device == 'cpu',
+        'device': args.device,
+        'half': args.half,
+        'profile': args.profile,
+        'sparse_tiles': args.sparse_tiles
+    }
+    if args.adaptive_exit is not None:
+        json_info['adaptive_exit'] = True
+        json_info['adaptive_exit_threshold'] = args.adaptive_exit
+
+    load_start = time.time()
+    tw = Timewarp(json_info)
+    load_time = time.time() - load_start
+    if not tw.model:
+        print (f'Unable to load model from {model_path}')
+        return
+    device = tw.device
+
+    img0 = read_openexr_file(src_files[0])['image_data']
+    img1 = read_openexr_file(src_files[1])['image_data']
+    for _ in range(args.warmup):
+        tw.predict(img0, img1, ratio = 0.5)
+    del img0, img1
+    if tw.block_profiler:
+        tw.block_profiler.reset()
+
+    results = []
+    for run in range(args.runs):
+        for file_name in os.listdir(result_folder):
+            os.remove(os.path.join(result_folder, file_name))
+        tw.stage_times = {'read': 0., 'predict': 0., 'write': 0.}
+        reset_device_memory(device)
+
+        start_time = time.time()
+        if not tw.process():
+            print ('Benchmark run failed')
+            return
+        elapsed_time = time.time() - start_time
+
+        results.append({
+            'label': args.label,
+            'run': run + 1,
+            'model': os.path.basename(model_path),
+            'device': str(device),
+            'half': args.half,
+            'frame_size': f'{w}x{h}',
+            'source_frames': args.length,
+            'rendered_frames': duration,
+            'speed': args.speed,
+            'load_time': round(load_time, 4),
+            'total_time': round(elapsed_time, 4),
+            'fps': round(duration / elapsed_time, 4),
+            'read_time': round(tw.stage_times['read'], 4),
+            'predict_time': round(tw.stage_times['predict'], 4),
+            'write_time': round(tw.stage_times['write'], 4),
+            'process_peak_rss_mb': round(get_process_peak_rss(), 1),
+            'device_memory_mb': round(get_device_memory(device), 1),
+            'platform': platform.platform(),
+            'torch': torch.__version__,
+        })
+
+    print ('\nResults:')
+    for result in results:
+        print (f'run {result["run"]}: {result["fps"]:.2f} fps for {result["frame_size"]} on {result["device"]}')
+        print (f'  read {result["read_time"]:.2f}s, predict {result["predict_time"]:.2f}s, write {result["write_time"]:.2f}s, total {result["total_time"]:.2f}s')
+        print (f'  process peak RSS {result["process_peak_rss_mb"]:.1f} MB, device memory {result["device_memory_mb"]:.1f} MB')
+
+    with open(f'{args.output}.json', 'w') as f:
+        json.dump(results, f, indent=4)
+    append_csv(f'{args.output}.csv', results)
+    print (f'Results saved to {args.output}.json and {args.output}.csv')
+
+    if not (args.keep or args.work_folder):
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
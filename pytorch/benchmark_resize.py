@@ -0,0 +1,101 @@
+import sys
+import time
+import argparse
+
+try:
+    import numpy as np
+except:
+    python_executable_path = sys.executable
+    if '.miniconda' in python_executable_path:
+        print ('Unable to import Numpy')
+        print (f'Using "{python_executable_path}" as python interpreter')
+        sys.exit()
+
+from frame_cache import get_scale_levels, get_scaled_size, resize_lanczos
+
+def resize_pil(frames, new_h, new_w):
+    # reference: each channel of each frame resized separately,
+    # as the dataset did before vectorized resampler
+    from PIL import Image
+
+    result = []
+    for frame in frames:
+        channels = [Image.fromarray(np.ascontiguousarray(frame[:, :, i]), mode='F') for i in range(frame.shape[2])]
+        resized_channels = [channel.resize((new_w, new_h), resample=Image.LANCZOS) for channel in channels]
+        result.append(np.stack([np.array(channel) for channel in resized_channels], axis=-1))
+    return np.stack(result)
+
+def generate_frames(h, w, seed=42):
+    """
+    Returns 3xHxWx3 float32 stack of HDR-like test frames: smooth
+    gradients with a few hard edges, fine noise and highlights above 1.
+    """
+
+    rng = np.random.RandomState(seed)
+    yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+    frames = []
+    for index in range(3):
+        frame = np.empty((h, w, 3), dtype=np.float32)
+        for c in range(3):
+            frame[:, :, c] = 0.5 + 0.4 * np.sin(xx / (17 + 5 * c) + index) * np.cos(yy / (23 + 3 * c))
+        frame[(xx // 64 + yy // 64) % 2 == 0] *= 0.25
+        frame += rng.rand(h, w, 3).astype(np.float32) * 0.05
+        frame[rng.rand(h, w) > 0.999] = 8.
+        frames.append(frame)
+    return np.stack(frames)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare vectorized Lanczos resampler with PIL for training scale augmentation.')
+    parser.add_argument('--source_size', type=str, default='1920x1080', help='Source frame size (default: 1920x1080)')
+    parser.add_argument('--frame_size', type=int, default=448, help='Training frame size in pixels (default: 448)')
+    parser.add_argument('--runs', type=int, default=5, help='Number of timed runs per scale level (default: 5)')
+    parser.add_argument('--tolerance', type=float, default=1e-4, help='Max error relative to peak value (default: 1e-4)')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for the test frames (default: 42)')
+
+    args = parser.parse_args()
+
+    w, h = args.source_size.split('x')
+    h, w = int(h), int(w)
+    frames = generate_frames(h, w, seed=args.seed)
+    print (f'Resizing 3 frames {w}x{h} to {len(get_scale_levels(args.frame_size))} scale levels of {args.frame_size}')
+
+    parity = True
+    faster = True
+    for h_scaled in get_scale_levels(args.frame_size):
+        new_h, new_w = get_scaled_size(h, w, h_scaled)
+
+        # first call builds weight tables, not timed
+        result = resize_lanczos(frames, new_h, new_w)
+        reference = resize_pil(frames, new_h, new_w)
+
+        abs_error = float(np.abs(result - reference).max())
+        rel_error = abs_error / float(np.abs(reference).max())
+        passed = rel_error <= args.tolerance
+        parity = parity and passed
+
+        start_time = time.time()
+        for _ in range(args.runs):
+            resize_pil(frames, new_h, new_w)
+        pil_time = (time.time() - start_time) / args.runs
+
+        start_time = time.time()
+        for _ in range(args.runs):
+            resize_lanczos(frames, new_h, new_w)
+        vectorized_time = (time.time() - start_time) / args.runs
+
+        speedup = pil_time / vectorized_time
+        faster = faster and speedup > 1.
+
+        print (f'{new_w}x{new_h}: PIL {pil_time * 1000:.1f} ms, vectorized {vectorized_time * 1000:.1f} ms '
+               f'({speedup:.2f}x of PIL speed{"" if speedup > 1. else ", SLOWER"}), '
+               f'max error {abs_error:.2e} ({rel_error:.2e} of peak) {"ok" if passed else "FAILED"}')
+
+    if not parity:
+        print (f'Vectorized resampler differs from PIL by more than {args.tolerance:.0e} of peak value')
+    if not faster:
+        print ('Vectorized resampler is slower than PIL')
+    if not (parity and faster):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+import time
+
+class BlockProfiler:
+    """
+    Opt-in timing and memory instrumentation for cascaded Flownet models.
+
+    Attaches forward hooks to the named submodules of a loaded model
+    (encode, block0, block1 etc.) and wraps grid_sample so the warps are
+    timed as well. Stats are aggregated by submodule, input frame size and
+    the scale the submodule was called with, so repeated calls over a job
+    or a training run end up in the same bucket.
+
+    The device is synchronized around every hooked call to get correct
+    timings, so it slows things down and should only be enabled when needed.
+    Warps called from inside a block are reported separately as "blockN/warp"
+    and are also included in the block time. Backward pass is not measured.
+
+    Usage:
+        profiler = BlockProfiler(model, device)
+        profiler.start()
+        ...
+        profiler.stop()
+        profiler.print_report()
+        profiler.save('profile.json')
+    """
+
+    def __init__(self, model, device, module_names=None):
+        self.model = model
+        self.device = device
+        if module_names is None:
+            module_names = [name for name, _ in model.named_children()]
+        self.module_names = module_names
+        self.stats = {}
+        self.handles = []
+        self.stack = []
+        self.original_grid_sample = None
+
+    def sync(self):
+        import torch
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize(self.device)
+        elif self.device.type == 'mps':
+            torch.mps.synchronize()
+
+    def memory_allocated(self):
+        import torch
+        if self.device.type == 'cuda':
+            return torch.cuda.memory_allocated(self.device)
+        elif self.device.type == 'mps':
+            return torch.mps.current_allocated_memory()
+        return 0
+
+    def max_memory_allocated(self):
+        import torch
+        if self.device.type == 'cuda':
+            return torch.cuda.max_memory_allocated(self.device)
+        return self.memory_allocated()
+
+    def reset_peak(self):
+        import torch
+        if self.device.type == 'cuda':
+            torch.cuda.reset_peak_memory_stats(self.device)
+
+    def enter(self, name, args, kwargs):
+        import torch
+
+        size = ''
+        for arg in args:
+            if isinstance(arg, torch.Tensor) and arg.dim() == 4:
+                size = f'{arg.shape[3]}x{arg.shape[2]}'
+                break
+        scale = kwargs.get('scale', '')
+
+        self.sync()
+        # keep parent's peak before resetting the counter for this call
+        if self.stack:
+            self.stack[-1]['peak'] = max(self.stack[-1]['peak'], self.max_memory_allocated())
+        self.reset_peak()
+        base = self.memory_allocated()
+        self.stack.append({
+            'name': name,
+            'size': size,
+            'scale': scale,
+            'base': base,
+            'peak': base,
+            'start': time.perf_counter()
+        })
+
+    def leave(self):
+        self.sync()
+        elapsed = time.perf_counter() - self.stack[-1]['start']
+        entry = self.stack.pop()
+        peak = max(entry['peak'], self.max_memory_allocated())
+        if self.stack:
+            self.stack[-1]['peak'] = max(self.stack[-1]['peak'], peak)
+
+        key = (entry['name'], entry['size'], str(entry['scale']))
+        if key not in self.stats:
+            self.stats[key] = {'calls': 0, 'time': 0., 'max_time': 0., 'peak_memory': 0}
+        stat = self.stats[key]
+        stat['calls'] += 1
+        stat['time'] += elapsed
+        stat['max_time'] = max(stat['max_time'], elapsed)
+        stat['peak_memory'] = max(stat['peak_memory'], peak - entry['base'])
+
+    def start(self):
+        import torch
+
+        if self.handles:
+            return
+
+        for name in self.module_names:
+            module = getattr(self.model, name, None)
+            if module is None:
+                continue
+
+            def pre_hook(module, args, kwargs, name=name):
+                self.enter(name, args, kwargs)
+
+            def post_hook(module, args, kwargs, output):
+                self.leave()
+
+            self.handles.append(module.register_forward_pre_hook(pre_hook, with_kwargs=True))
+            self.handles.append(module.register_forward_hook(post_hook, with_kwargs=True))
+
+        # warp functions in models call torch.nn.functional.grid_sample
+        # at runtime so wrapping it here catches all of them
+        self.original_grid_sample = torch.nn.functional.grid_sample
+        original_grid_sample = self.original_grid_sample
+
+        def grid_sample(input, grid, *args, **kwargs):
+            name = f'{self.stack[-1]["name"]}/warp' if self.stack else 'warp'
+            self.enter(name, (input, ), {})
+            try:
+                return original_grid_sample(input, grid, *args, **kwargs)
+            finally:
+                self.leave()
+
+        torch.nn.functional.grid_sample = grid_sample
+
+    def stop(self):
+        import torch
+
+        for handle in self.handles:
+            handle.remove()
+        self.handles = []
+        if self.original_grid_sample is not None:
+            torch.nn.functional.grid_sample = self.original_grid_sample
+            self.original_grid_sample = None
+
+    def reset(self):
+        self.stats = {}
+
+    def report(self):
+        rows = []
+        for (name, size, scale), stat in self.stats.items():
+            rows.append({
+                'module': name,
+                'size': size,
+                'scale': scale,
+                'calls': stat['calls'],
+                'total_ms': round(stat['time'] * 1000, 3),
+                'mean_ms': round(stat['time'] * 1000 / stat['calls'], 3),
+                'max_ms': round(stat['max_time'] * 1000, 3),
+                'peak_mb': round(stat['peak_memory'] / (1024 ** 2), 1),
+            })
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+    def print_report(self):
+        rows = self.report()
+        if not rows:
+            print ('Block profiler: no calls recorded')
+            return
+        columns = list(rows[0].keys())
+        widths = {c: max(len(c), max(len(str(row[c])) for row in rows)) for c in columns}
+        print ('Block profiler:')
+        print (' '.join(f'{c:>{widths[c]}}' for c in columns))
+        for row in rows:
+            print (' '.join(f'{str(row[c]):>{widths[c]}}' for c in columns))
+
+    def save(self, file_path):
+        import json
+        with open(file_path, 'w') as f:
+            json.dump(self.report(), f, indent=4)
+
+def measure_checkpointing(model, device, batch_size, frame_size, runs=3, amp_dtype=None):
+    """
+    Compares a training step of a model built with activation checkpointing
+    (get_training_model(checkpoint_blocks=...)) against the same model with
+    checkpointing switched off, on random input of given size.
+    Forward runs under autocast with amp_dtype when given, same as training.
+
+    :return: Dict with 'checkpointing' and 'plain' results, each is None if it
+        ran out of memory or a dict with mean step time in seconds and peak
+        memory in bytes (peak memory is only measured on CUDA).
+    """
+
+    import torch
+
+    meter = BlockProfiler(model, device, module_names=[])
+
+    def step():
+        img0 = torch.rand(batch_size, 3, frame_size, frame_size, device=device)
+        img1 = torch.rand(batch_size, 3, frame_size, frame_size, device=device)
+        img2 = torch.rand(batch_size, 3, frame_size, frame_size, device=device)
+        with torch.autocast(device_type=device.type, dtype=amp_dtype, enabled=amp_dtype is not None):
+            result = model(img0, img2, 0.5, scale=[8, 4, 2, 1], iterations=1, gt=img1)
+        loss = sum(flow.float().abs().mean() for flow in result['flow_list'] if flow is not None)
+        loss.backward()
+        model.zero_grad(set_to_none=True)
+
+    model.train()
+    results = {}
+    for mode, checkpointing in (('checkpointing', True), ('plain', False)):
+        model.checkpointing = checkpointing
+        try:
+            # first step allocates caches and is not measured
+            step()
+            meter.sync()
+            meter.reset_peak()
+            base = meter.memory_allocated()
+            start = time.perf_counter()
+            for _ in range(runs):
+                step()
+            meter.sync()
+            results[mode] = {
+                'time': (time.perf_counter() - start) / runs,
+                'peak_memory': meter.max_memory_allocated() - base if device.type == 'cuda' else None
+            }
+        except RuntimeError as e:
+            if 'out of memory' not in str(e):
+                raise
+            results[mode] = None
+            model.zero_grad(set_to_none=True)
+            if device.type == 'cuda':
+                torch.cuda.empty_cache()
+
+    model.checkpointing = True
+    return results
+
+def print_checkpointing_report(results, blocks, batch_size, frame_size):
+    def describe(result):
+        if result is None:
+            return 'out of memory'
+        if result['peak_memory'] is None:
+            return f'{result["time"]:.3f}s per step'
+        return f'{result["time"]:.3f}s per step, peak {result["peak_memory"] / (1024 ** 3):.2f} GB'
+
+    checkpointing, plain = results['checkpointing'], results['plain']
+    print (f'Activation checkpointing of {", ".join(blocks)} at {batch_size}x{frame_size}x{frame_size}:')
+    print (f'  checkpointing: {describe(checkpointing)}')
+    print (f'  plain: {describe(plain)}')
+    if checkpointing and plain:
+        overhead = (checkpointing['time'] / plain['time'] - 1) * 100
+        if checkpointing['peak_memory'] is not None and plain['peak_memory']:
+            saved = (1 - checkpointing['peak_memory'] / plain['peak_memory']) * 100
+            print (f'  memory saved {saved:.1f}%, recompute overhead {overhead:.1f}%')
+        else:
+            print (f'  recompute overhead {overhead:.1f}%')
@@ -0,0 +1,13 @@
+def load_checkpoint(file_path):
+    """
+    Reads a saved checkpoint to CPU once, memory-mapped where torch supports it.
+    Weights are copied to the device later by load_state_dict.
+    """
+
+    import torch
+
+    try:
+        return torch.load(file_path, map_location='cpu', mmap=True)
+    except (TypeError, RuntimeError):
+        # older torch without mmap or legacy non-zip checkpoint
+        return torch.load(file_path, map_location='cpu')
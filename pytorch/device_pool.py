@@ -0,0 +1,151 @@
+import os
+import sys
+import time
+import queue
+
+def parse_devices(devices):
+    """
+    Converts device list from command line or job json into torch device names.
+
+    Accepts a list or a comma separated string. Plain integers are treated
+    as CUDA device indices, so "0,1" and "cuda:0,cuda:1" are the same.
+    The same device can be listed more than once, i.e. "cpu,cpu,cpu,cpu"
+    runs four CPU workers.
+    """
+
+    if not devices:
+        return []
+    if isinstance(devices, str):
+        devices = devices.split(',')
+    device_names = []
+    for device in devices:
+        device = str(device).strip()
+        if not device:
+            continue
+        if device.isdigit():
+            device = f'cuda:{device}'
+        device_names.append(device)
+    return device_names
+
+def shard_by_pairs(frames, pair_key, num_shards):
+    """
+    Splits render plan into contiguous shards without breaking runs of frames
+    that share the same source pair, so each worker reads a contiguous range
+    of source frames and keeps its caches warm.
+
+    :param frames: List of frame descriptions in render order.
+    :param pair_key: Function returning source pair key for a frame.
+    :param num_shards: Number of shards.
+    :return: List of lists, some may be empty if there are less runs than shards.
+    """
+
+    runs = []
+    for frame in frames:
+        key = pair_key(frame)
+        if runs and runs[-1][0] == key:
+            runs[-1][1].append(frame)
+        else:
+            runs.append((key, [frame]))
+
+    shards = [[] for _ in range(num_shards)]
+    target = len(frames) / max(num_shards, 1)
+    shard_index = 0
+    for key, run_frames in runs:
+        # move on once current shard has its share,
+        # last shard takes whatever is left
+        if shards[shard_index] and len(shards[shard_index]) + len(run_frames) / 2 > target and shard_index < num_shards - 1:
+            shard_index += 1
+            target = (len(frames) - sum(len(s) for s in shards)) / (num_shards - shard_index)
+        shards[shard_index].extend(run_frames)
+    return shards
+
+def pool_worker(worker, worker_index, device, shard, progress_queue, worker_args, cpu_threads):
+    # runs in a spawned process
+    def report(count=1):
+        progress_queue.put({'type': 'progress', 'worker': worker_index, 'count': count})
+
+    try:
+        if device.startswith('cpu') and cpu_threads:
+            import torch
+            torch.set_num_threads(cpu_threads)
+        result = worker(device, shard, report, *worker_args)
+        progress_queue.put({'type': 'done', 'worker': worker_index, 'result': result})
+    except Exception as e:
+        progress_queue.put({'type': 'error', 'worker': worker_index, 'message': f'{e}'})
+
+def run_device_pool(worker, devices, shards, worker_args=(), desc='', on_progress=None):
+    """
+    Runs worker(device, shard, report, *worker_args) in a separate spawned
+    process for each device and shows the merged progress in a single bar.
+    Worker calls report(n) after each n frames done and may return a
+    picklable result. on_progress(n) is called in this process for merged progress.
+
+    :return: Tuple of success flag and list of worker results in device order.
+    """
+
+    import multiprocessing
+    from tqdm import tqdm
+
+    context = multiprocessing.get_context('spawn')
+    progress_queue = context.Queue()
+
+    # share CPU cores between CPU workers instead of oversubscribing
+    cpu_workers = len([d for d in devices if d.startswith('cpu')])
+    cpu_threads = max(1, (os.cpu_count() or 1) // cpu_workers) if cpu_workers else None
+
+    processes = {}
+    for worker_index, (device, shard) in enumerate(zip(devices, shards)):
+        if not shard:
+            continue
+        print (f'{device}: {len(shard)} frames')
+        process = context.Process(
+            target=pool_worker,
+            args=(worker, worker_index, device, shard, progress_queue, worker_args, cpu_threads)
+        )
+        process.daemon = True
+        process.start()
+        processes[worker_index] = process
+
+    pbar = tqdm(total=sum(len(s) for s in shards),
+                desc=desc,
+                unit='frame',
+                file=sys.stdout,
+                bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]',
+                ascii=f' {chr(0x2588)}',
+                ncols=80
+                )
+
+    results = [None] * len(devices)
+    pending = set(processes.keys())
+    success = True
+    while pending:
+        try:
+            message = progress_queue.get(timeout=0.1)
+        except queue.Empty:
+            for worker_index in list(pending):
+                if not processes[worker_index].is_alive():
+                    # give the queue a moment in case the final message is in flight
+                    time.sleep(0.5)
+                    if progress_queue.empty():
+                        pbar.write(f'{devices[worker_index]}: worker exited with code {processes[worker_index].exitcode}')
+                        pending.discard(worker_index)
+                        success = False
+            continue
+
+        worker_index = message['worker']
+        if message['type'] == 'progress':
+            pbar.update(message['count'])
+            if on_progress:
+                on_progress(message['count'])
+        elif message['type'] == 'done':
+            results[worker_index] = message['result']
+            pending.discard(worker_index)
+        elif message['type'] == 'error':
+            pbar.write(f'{devices[worker_index]}: {message["message"]}')
+            pending.discard(worker_index)
+            success = False
+
+    pbar.close()
+    for process in processes.values():
+        process.join(timeout=5)
+    return success, results
@@ -0,0 +1,65 @@
+import os
+import sys
+import argparse
+
+try:
+    import torch
+except:
+    python_executable_path = sys.executable
+    if '.miniconda' in python_executable_path:
+        print ('Unable to import PyTorch library')
+        print (f'Using {python_executable_path} python interpreter')
+        sys.exit()
+
+def main():
+    parser = argparse.ArgumentParser(description='Export training state file as a slim inference checkpoint.')
+    parser.add_argument('state_file', type=str, help='Path to the training state file')
+    parser.add_argument('output', type=str, nargs='?', default=None, help='Output file (default: <state_file>.inference.pth)')
+    parser.add_argument('--half', action='store_true', default=False, help='Store weights in half precision')
+
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.state_file):
+        print (f'State file {args.state_file} does not exist')
+        return
+
+    output_path = args.output
+    if not output_path:
+        output_path = f'{os.path.splitext(args.state_file)[0]}.inference.pth'
+
+    try:
+        checkpoint = torch.load(args.state_file, map_location='cpu')
+    except Exception as e:
+        print (f'Unable to load {args.state_file}: {e}')
+        return
+
+    model_info = checkpoint.get('model_info')
+    state_dict = checkpoint.get('flownet_state_dict')
+    if model_info is None or state_dict is None:
+        print (f'{args.state_file} does not have model info and flownet state')
+        return
+
+    flownet_state_dict = {}
+    for key, value in state_dict.items():
+        # strip prefixes left by nn.DataParallel and torch.compile
+        key = key.replace('module.', '', 1) if key.startswith('module.') else key
+        key = key.replace('_orig_mod.', '', 1) if key.startswith('_orig_mod.') else key
+        if args.half and value.is_floating_point():
+            value = value.half()
+        flownet_state_dict[key] = value.contiguous()
+
+    torch.save(
+        {
+            'model_info': model_info,
+            'flownet_state_dict': flownet_state_dict
+        },
+        output_path
+    )
+
+    source_size = os.path.getsize(args.state_file) / (1024 ** 2)
+    output_size = os.path.getsize(output_path) / (1024 ** 2)
+    print (f'Model: {model_info.get("name")}, step: {checkpoint.get("step")}, epoch: {checkpoint.get("epoch")}')
+    print (f'Saved {output_path} ({source_size:.1f} MB -> {output_size:.1f} MB)')
+
+if __name__ == "__main__":
+    main()
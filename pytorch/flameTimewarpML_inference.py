@@ -300,6 +300,251 @@ def read_openexr_file(file_path, header_only = False):
         del source_reader
     return result
 
+def get_exr_expected_size(file_path):
+    """
+    Returns size in bytes of a complete uncompressed exr file computed from its header,
+    or None if the header can not be parsed yet or the file is compressed.
+    """
+
+    import numpy as np
+    try:
+        with open(file_path, 'rb') as sfp:
+            reader = MinExrReader(sfp, header_only = True)
+    except Exception:
+        return None
+    H, C, W = reader.shape
+    DS = np.dtype(reader.channel_types[0]).itemsize
+    # each scan line has 4 bytes of y coordinate and 4 bytes of data size
+    return reader.first_offset + H * (8 + DS * W * C)
+
+def read_openexr_subsampled(file_path, step = 8):
+    """
+    Reads each step-th scan line and pixel of an uncompressed exr file.
+
+    Scan lines are at constant offsets so only the lines needed are read
+    from disk, which is step times less data than reading the whole frame.
+    Channels are returned in the same order as read_openexr_file does.
+
+    :param file_path: Path to the exr file.
+    :param step: Subsampling step in pixels.
+    :return: HxWxC numpy array of subsampled image data.
+    """
+
+    import numpy as np
+    with open(file_path, 'rb') as sfp:
+        reader = MinExrReader(sfp, header_only = True)
+        H, C, W = reader.shape
+        dtype = reader.channel_types[0]
+        DS = np.dtype(dtype).itemsize
+        SOFF = 8 + DS * W * C
+        lines = []
+        for y in range(0, H, step):
+            # skip y coordinate and data size of the scan line
+            sfp.seek(reader.first_offset + y * SOFF + 8)
+            line = np.frombuffer(sfp.read(DS * W * C), dtype = dtype).reshape(C, W)
+            lines.append(line[:, ::step])
+    image = np.stack(lines, axis = 0)
+    return image.transpose(0, 2, 1)[:, :, ::-1]
+
+class DuplicateDetector():
+    '''
+    Flags repeated frames in a single streaming pass over a sequence.
+
+    Each frame is reduced to a low resolution log luma signature built from
+    a subsampled read of the file. A frame is a duplicate if both mean and
+    max absolute differences of its signature against the last unique frame
+    are below thresholds, so a long hold is compared to the frame it holds
+    and a slow drift is not mistaken for a hold.
+    '''
+
+    def __init__(self, threshold = 1e-3, max_threshold = 1e-2, step = 8, size = 32):
+        self.threshold = threshold
+        self.max_threshold = max_threshold
+        self.step = step
+        self.size = size
+        self.reference = None
+
+    def signature(self, file_path):
+        import numpy as np
+
+        image = read_openexr_subsampled(file_path, step = self.step).astype(np.float32)
+        if image.shape[2] >= 3:
+            luma = 0.2126 * image[:, :, 0] + 0.7152 * image[:, :, 1] + 0.0722 * image[:, :, 2]
+        else:
+            luma = image.mean(axis = 2)
+        luma = np.log1p(np.maximum(luma, 0))
+
+        # area average to a fixed grid
+        h, w = luma.shape
+        gh, gw = min(self.size, h), min(self.size, w)
+        luma = luma[:gh * (h // gh), :gw * (w // gw)]
+        return luma.reshape(gh, h // gh, gw, w // gw).mean(axis = (1, 3))
+
+    def add(self, signature):
+        """
+        Compares signature with the last unique frame.
+
+        :return: Tuple of duplicate flag, mean and max absolute difference.
+        """
+
+        import numpy as np
+
+        if self.reference is None or self.reference.shape != signature.shape:
+            self.reference = signature
+            return False, None, None
+
+        diff = np.abs(signature - self.reference)
+        mean_diff = float(diff.mean())
+        max_diff = float(diff.max())
+        duplicate = mean_diff < self.threshold and max_diff < self.max_threshold
+        if not duplicate:
+            self.reference = signature
+        return duplicate, mean_diff, max_diff
+
+class SourceWatcher():
+    '''
+    Admits source frames to the render plan while they are still being exported.
+
+    Flame writes the export sequentially, so frame N of the clip is the N-th file
+    in sorted order once at least N files are there. A file is complete when its
+    size matches the size expected from the uncompressed exr header. If the header
+    can not be parsed the file is admitted once its size has not changed for
+    stable_time seconds. Waiting fails if export has made no progress for timeout seconds.
+    '''
+
+    def __init__(self, folder, expected_count, timeout = 600, stable_time = 1.0, poll_interval = 0.1):
+        self.folder = folder
+        self.expected_count = expected_count
+        self.timeout = timeout
+        self.stable_time = stable_time
+        self.poll_interval = poll_interval
+        self.file_names = []
+        self.admitted = 0
+        self.last_sizes = {}
+        self.last_progress = time.time()
+
+    def scan(self):
+        if not os.path.isdir(self.folder):
+            return
+        # admitted frames can be deleted by progressive cleanup
+        # so names seen before are kept to preserve frame positions
+        file_names = set([f for f in os.listdir(self.folder) if f.endswith('.exr')])
+        file_names = sorted(file_names.union(self.file_names))
+        if len(file_names) != len(self.file_names):
+            self.last_progress = time.time()
+        self.file_names = file_names
+
+    def is_complete(self, file_path):
+        size = os.path.getsize(file_path)
+        now = time.time()
+        last_size, since = self.last_sizes.get(file_path, (None, now))
+        if size != last_size:
+            self.last_sizes[file_path] = (size, now)
+            self.last_progress = now
+            since = now
+
+        expected_size = get_exr_expected_size(file_path)
+        if expected_size is not None:
+            return size >= expected_size
+        return size > 0 and now - since >= self.stable_time
+
+    def wait_for_frame(self, frame_number):
+        # frame_number is 1-based position in the exported sequence
+        if frame_number > self.expected_count:
+            raise Exception(f'Source frame {frame_number} is out of expected range 1-{self.expected_count}')
+
+        while self.admitted < frame_number:
+            if len(self.file_names) <= self.admitted:
+                self.scan()
+            if len(self.file_names) > self.admitted:
+                file_path = os.path.join(self.folder, self.file_names[self.admitted])
+                if self.is_complete(file_path):
+                    self.last_sizes.pop(file_path, None)
+                    self.admitted += 1
+                    continue
+            if time.time() - self.last_progress > self.timeout:
+                raise Exception(f'Timed out waiting for source frame {frame_number} in {self.folder}')
+            time.sleep(self.poll_interval)
+
+        return os.path.join(self.folder, self.file_names[frame_number - 1])
+
+class JobStatus():
+    '''
+    Publishes job status as JSON lines: started, progress, error and finished events.
+
+    Each event is appended to status_file if given and sent to status_socket,
+    a unix socket the flame hook listens on, so the hook gets it immediately.
+    If the socket goes away the events are still written to the file.
+    Progress events are sent at most every progress_interval seconds.
+    '''
+
+    def __init__(self, job_id, status_file = None, status_socket = None, progress_interval = 0.5):
+        self.job_id = job_id
+        self.status_file = status_file
+        self.socket = None
+        self.progress_interval = progress_interval
+        self.total = 0
+        self.done = 0
+        self.errors = 0
+        self.last_progress_time = 0
+        self.lock = threading.Lock()
+
+        if status_socket:
+            import socket
+            try:
+                self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.socket.connect(status_socket)
+            except Exception as e:
+                print (f'Unable to connect to status socket {status_socket}: {e}')
+                self.socket = None
+
+    def emit(self, event, **kwargs):
+        import json
+
+        if not (self.status_file or self.socket):
+            return
+        message = {'job': self.job_id, 'event': event, 'time': time.time()}
+        message.update(kwargs)
+        line = json.dumps(message) + '\n'
+
+        with self.lock:
+            if self.status_file:
+                try:
+                    with open(self.status_file, 'a') as f:
+                        f.write(line)
+                except Exception as e:
+                    print (f'Unable to write status to {self.status_file}: {e}')
+                    self.status_file = None
+            if self.socket:
+                try:
+                    self.socket.sendall(line.encode('utf-8'))
+                except Exception:
+                    self.socket.close()
+                    self.socket = None
+
+    def start(self, total, **kwargs):
+        self.total = total
+        self.done = 0
+        self.emit('started', total = total, **kwargs)
+
+    def progress(self, count = 1):
+        self.done += count
+        now = time.time()
+        if now - self.last_progress_time < self.progress_interval and self.done < self.total:
+            return
+        self.last_progress_time = now
+        self.emit('progress', done = self.done, total = self.total)
+
+    def error(self, message):
+        self.errors += 1
+        self.emit('error', message = message)
+
+    def finish(self, success):
+        self.emit('finished', success = bool(success), done = self.done, total = self.total)
+        if self.socket:
+            self.socket.close()
+            self.socket = None
+
 def write_exr(image_data, filename, half_float = False, pixelAspectRatio = 1.0):
     import struct
     import numpy as np
@@ -397,18 +642,185 @@ class Timewarp():
         self.json_info = json_info
         print('Initializing TimewarpML from Flame setup...')
         import torch
-
-        self.device = torch.device("mps") if platform.system() == 'Darwin' else torch.device('cuda')
+        from device_pool import parse_devices
+
+        # timewarp job can be split between several devices,
+        # each one rendering its share of frames in a separate process
+        self.devices = parse_devices(self.json_info.get('devices'))
+        if len(self.devices) > 1 and self.json_info.get('mode') != 'timewarp':
+            print (f'Multiple devices are only supported in timewarp mode, using {self.devices[0]}')
+            self.devices = self.devices[:1]
+        if len(self.devices) == 1:
+            self.json_info['device'] = self.devices[0]
+            self.devices = []
+
+        if self.devices:
+            self.device = torch.device(self.devices[0])
+        elif self.json_info.get('device'):
+            self.device = torch.device(self.json_info.get('device'))
+        elif self.json_info.get('cpu'):
+            self.device = torch.device('cpu')
+        else:
+            self.device = torch.device("mps") if platform.system() == 'Darwin' else torch.device('cuda')
+
+        # accumulated wall time spent in each pipeline stage, seconds
+        self.stage_times = {'read': 0., 'predict': 0., 'write': 0.}
+        self.status = JobStatus(
+            self.json_info.get('job_id', self.json_info.get('clip_name')),
+            status_file = self.json_info.get('status_file'),
+            status_socket = self.json_info.get('status_socket')
+        )
         self.model_path = self.json_info.get('model_path')
-        self.model = self.find_and_import_model(self.model_path)
-        self.model_info = self.load_model_info(self.model_path)
-
-    def find_and_import_model(self, model_file_path):
+        if self.devices:
+            # each worker process loads its own copy of the model
+            print (f'Using devices: {", ".join(self.devices)}')
+            self.model = None
+            self.model_info = None
+        else:
+            from checkpoint_io import load_checkpoint
+            try:
+                checkpoint = load_checkpoint(self.model_path)
+            except Exception as e:
+                print (f'Unable to load {self.model_path}: {e}')
+                checkpoint = None
+            self.model = self.find_and_import_model(checkpoint)
+            self.model_info = self.load_model_info(checkpoint)
+            del checkpoint
+
+        self.decision_log = []
+        self.init_warm_start()
+        self.init_adaptive_exit()
+        self.init_sparse_tiles()
+        self.init_flow_reuse()
+        self.init_preview()
+
+        self.block_profiler = None
+        if self.json_info.get('profile') and self.model:
+            from block_profiler import BlockProfiler
+            self.block_profiler = BlockProfiler(self.model, self.device)
+            self.block_profiler.start()
+
+    def init_warm_start(self):
+        # Seed the flow cascade with the flow of previous frame
+        # when rendering the same or the next source pair.
+        import inspect
+
+        self.warm_start = False
+        self.warm_start_state = None
+        self.warm_start_stats = {'cold': 0, 'warm': 0, 'cut': 0, 'fallback': 0, 'refresh': 0}
+
+        if not (self.json_info.get('warm_start') and self.model):
+            return
+        if 'flow_init' not in inspect.signature(self.model.forward).parameters:
+            print (f'Model {self.model_info.get("name")} does not support warm start, running full cascade')
+            return
+
+        self.warm_start = True
+        # mean abs difference of 1/16 downscaled pair above which it is considered a cut
+        self.warm_start_cut_threshold = self.json_info.get('warm_start_cut_threshold', 0.2)
+        # fall back to full cascade if warm started residual is this many times worse than last cold one
+        self.warm_start_residual_factor = self.json_info.get('warm_start_residual_factor', 1.5)
+        # run full cascade at least each N frames to avoid drift
+        self.warm_start_refresh = self.json_info.get('warm_start_refresh', 12)
+        print ('Using flow warm start')
+
+    def init_adaptive_exit(self):
+        # Stop the flow cascade early on static or slow moving
+        # shots where further refinement levels change nothing.
+        import inspect
+
+        self.adaptive_exit = False
+        self.adaptive_exit_stats = {0: 0, 1: 0, 2: 0, 3: 0}
+
+        if not (self.json_info.get('adaptive_exit') and self.model):
+            return
+        if 'exit_threshold' not in inspect.signature(self.model.forward).parameters:
+            print (f'Model {self.model_info.get("name")} does not support adaptive exit, running full cascade')
+            return
+
+        self.adaptive_exit = True
+        # flow change in pixels below which next refinement levels are skipped
+        self.adaptive_exit_threshold = self.json_info.get('adaptive_exit_threshold', 0.5)
+        # mean mask change below which next refinement levels are skipped
+        self.adaptive_exit_mask_threshold = self.json_info.get('adaptive_exit_mask_threshold', 0.02)
+        print ('Using adaptive cascade exit')
+
+    def init_sparse_tiles(self):
+        # Run the model only on tiles that change between the
+        # source frames, static tiles get the ratio blend of sources.
+        self.sparse_tiles = False
+        self.sparse_stats = {'area': 0, 'skipped': 0, 'full': 0}
+
+        if not (self.json_info.get('sparse_tiles') and self.model):
+            return
+
+        self.sparse_tiles = True
+        # tile and crop sizes have to stay divisible by 64 for the model
+        self.sparse_tile_size = max(64, (int(self.json_info.get('sparse_tile_size', 256)) // 64) * 64)
+        self.sparse_tile_margin = max(32, (int(self.json_info.get('sparse_tile_margin', 64)) // 32) * 32)
+        # mean abs difference of 8x8 blocks above which tile is processed
+        self.sparse_threshold = self.json_info.get('sparse_threshold', 0.01)
+        # process full frame if more than this fraction of tiles is moving
+        self.sparse_max_fraction = self.json_info.get('sparse_max_fraction', 0.5)
+        self.sparse_batch_size = int(self.json_info.get('sparse_batch_size', 8))
+
+        if self.warm_start:
+            print ('Warm start is not used together with sparse tiles')
+            self.warm_start = False
+        print (f'Using sparse tiles {self.sparse_tile_size}px with {self.sparse_tile_margin}px margin')
+
+    def init_flow_reuse(self):
+        # Fast mode for slow speeds: flow and mask are computed once per
+        # source pair at ratio 0.5 and scaled to other ratios assuming linear motion.
+        self.flow_reuse = False
+        self.flow_reuse_state = None
+        self.flow_reuse_stats = {'computed': 0, 'reused': 0}
+
+        if not (self.json_info.get('flow_reuse') and self.model):
+            return
+
+        self.flow_reuse = True
+        if self.warm_start:
+            print ('Warm start is not used together with flow reuse')
+            self.warm_start = False
+        print ('Using flow reuse')
+
+    def init_preview(self):
+        # Fast first pass with flow computed on a downscaled proxy for each
+        # Nth output frame, written to a separate folder that can be imported
+        # while the full quality pass is still running.
+        self.preview = False
+
+        if not self.json_info.get('preview'):
+            return
+        if self.json_info.get('mode') != 'timewarp':
+            print ('Preview pass is only supported in timewarp mode')
+            return
+        if self.devices:
+            print ('Preview pass is not used with multiple devices')
+            return
+
+        self.preview = True
+        # render each Nth output frame, frames in between hold the last rendered one
+        self.preview_step = max(1, int(self.json_info.get('preview_step', 4)))
+        # flow is computed at this fraction of the source resolution
+        self.preview_scale = min(1., max(0.125, float(self.json_info.get('preview_scale', 0.5))))
+        self.preview_folder = self.json_info.get(
+            'preview_folder',
+            f'{os.path.abspath(self.json_info.get("output"))}_preview'
+        )
+        # 'preview_first' renders full quality of the preview frames before the rest,
+        # 'sequential' keeps the plan order
+        self.preview_order = self.json_info.get('preview_order', 'preview_first')
+        print (f'Using preview pass: each {self.preview_step} frames at {self.preview_scale} flow scale')
+
+    def find_and_import_model(self, checkpoint):
         import importlib
-        import torch
+
+        if checkpoint is None:
+            return None
 
         try:
-            checkpoint = torch.load(model_file_path, map_location=self.device)
             model_info = checkpoint.get('model_info')
             model_file = model_info.get('file')
             module_name = model_file[:-3]  # Remove '.py' from filename to get module name
@@ -426,34 +838,110 @@ class Timewarp():
             print ({e})
             return None
 
-    def load_model_info(self, model_file_path):
-        import importlib
-        import torch
-
-        try:
-            checkpoint = torch.load(model_file_path, map_location=self.device)
-            model_info = checkpoint.get('model_info')
-            return model_info
-        except Exception as e:
-            print ({e})
+    def load_model_info(self, checkpoint):
+        if checkpoint is None:
             return None
+        return checkpoint.get('model_info')
 
     def process(self):
         mode = self.json_info.get('mode')
 
         if mode == 'timewarp':
-            return self.process_timewarp()
+            result = self.process_timewarp()
         elif mode == 'fluidmorph':
-            return self.process_fluidmorph()
+            result = self.process_fluidmorph()
+        elif mode == 'dedup':
+            result = self.process_dedup()
         else:
             print (f'Unknown processing mode: {mode}')
+            self.status.error(f'Unknown processing mode: {mode}')
+            self.status.finish(False)
             return False
 
+        if not (result or self.status.errors):
+            self.status.error('Processing failed, see log for details')
+        self.status.finish(result)
+
+        if self.block_profiler:
+            self.save_block_profile()
+
+        if self.warm_start:
+            stats = self.warm_start_stats
+            print (f'Warm start: {stats["warm"]} warm, {stats["cold"]} cold, {stats["cut"]} cuts, {stats["fallback"]} fallbacks, {stats["refresh"]} refreshes')
+
+        if self.sparse_tiles and self.sparse_stats['area']:
+            skipped = self.sparse_stats['skipped'] / self.sparse_stats['area']
+            print (f'Sparse tiles: skipped {skipped * 100:.1f}% of frame area, {self.sparse_stats["full"]} frames processed in full')
+
+        if self.flow_reuse:
+            stats = self.flow_reuse_stats
+            print (f'Flow reuse: {stats["computed"]} flows computed for {stats["computed"] + stats["reused"]} frames')
+
+        if self.adaptive_exit:
+            stats = self.adaptive_exit_stats
+            print (f'Adaptive exit: after block0 {stats[0]}, block1 {stats[1]}, block2 {stats[2]}, full cascade {stats[3]}')
+
+        if self.decision_log:
+            self.save_decision_log()
+
+        return result
+
+    def save_decision_log(self):
+        output_folder = os.path.abspath(self.json_info.get('output'))
+        log_path = os.path.join(
+            os.path.dirname(output_folder),
+            f'{self.json_info.get("clip_name")}.decisions.log'
+        )
+        try:
+            with open(log_path, 'w') as f:
+                f.write('\n'.join(self.decision_log) + '\n')
+            print (f'Per-frame decisions saved to {log_path}')
+        except Exception as e:
+            print (f'Unable to save decisions log to {log_path}: {e}')
+
+    def save_block_profile(self):
+        self.block_profiler.print_report()
+        output_folder = os.path.abspath(self.json_info.get('output'))
+        profile_path = os.path.join(
+            os.path.dirname(output_folder),
+            f'{self.json_info.get("clip_name")}.profile.json'
+        )
+        try:
+            self.block_profiler.save(profile_path)
+            print (f'Block profile saved to {profile_path}')
+        except Exception as e:
+            print (f'Unable to save block profile to {profile_path}: {e}')
+
     def process_timewarp(self):
-        if not self.model:
+        if not (self.model or self.devices):
             print (f'Unable to import model from file {self.model_path}')
+            self.status.error(f'Unable to import model from file {self.model_path}')
+            return False
+
+        frame_info_list = self.build_timewarp_plan()
+        if frame_info_list is None:
             return False
 
+        print(f'rendering {len(frame_info_list)} frames to:\n{self.target_folder}')
+        self.status.start(len(frame_info_list), output = self.target_folder)
+
+        if self.preview and self.render_preview(frame_info_list):
+            if self.preview_order == 'preview_first':
+                # preview frames get their final quality first, so the
+                # imported preview clip sharpens up evenly along its length
+                frame_info_list = frame_info_list[::self.preview_step] + [
+                    frame_info for index, frame_info in enumerate(frame_info_list) if index % self.preview_step
+                ]
+
+        if self.json_info.get('cleanup_source'):
+            self.mark_source_release(frame_info_list)
+
+        if self.devices:
+            return self.render_pool(frame_info_list)
+        return self.render_frames(frame_info_list)
+
+    def build_timewarp_plan(self):
+
         tw_setup_string = self.json_info.get('setup')
         '''
         for k in self.json_info.keys():
@@ -466,11 +954,23 @@ class Timewarp():
         self.clip_name = self.json_info.get('clip_name')
         self.settings = self.json_info.get('settings')
 
-        src_files_list = [file for file in os.listdir(self.source_folder) if file.endswith('.exr')]
-        input_duration = len(src_files_list)
+        if self.json_info.get('stream_source'):
+            # source is still being exported, frames are picked up
+            # by SourceWatcher when rendering and only the count is known here
+            src_files_list = []
+            input_duration = int(self.json_info.get('source_duration', 0))
+        else:
+            src_files_list = [file for file in os.listdir(self.source_folder) if file.endswith('.exr')]
+            input_duration = len(src_files_list)
         if not input_duration:
             print(f'no input frames found in: "{self.source_folder}"')
-            return False
+            return None
+
+        # hook may export only the range of source frames referenced by the curve,
+        # first exported file is source frame source_offset + 1 then
+        self.source_offset = int(self.json_info.get('source_offset', 0))
+        input_duration += self.source_offset
+
         self.record_in = self.json_info.get('record_in', 1)
         self.record_out = self.json_info.get('record_out', input_duration)
 
@@ -478,9 +978,9 @@ class Timewarp():
             frame_value_map = self.bake_flame_tw_setup(tw_setup_string)
         except Exception as e:
             print ({e})
-            return False
+            return None
 
-        start_frame = 1
+        start_frame = 1 + self.source_offset
         src_files_list.sort()
         src_files = {x:os.path.join(self.source_folder, file_path) for x, file_path in enumerate(src_files_list, start=start_frame)}
 
@@ -494,6 +994,8 @@ class Timewarp():
             if incoming_frame_number < 1:
                 frame_info['incoming'] = src_files.get(1)
                 frame_info['outgoing'] = src_files.get(1)
+                frame_info['incoming_frame'] = 1
+                frame_info['outgoing_frame'] = 1
                 frame_info['ratio'] = 0
                 frame_info['output'] = os.path.join(self.target_folder, f'{self.clip_name}.{output_frame_number:08}.exr')
                 frame_info_list.append(frame_info)
@@ -503,6 +1005,8 @@ class Timewarp():
             if incoming_frame_number >= input_duration:
                 frame_info['incoming'] = src_files.get(input_duration)
                 frame_info['outgoing'] = src_files.get(input_duration)
+                frame_info['incoming_frame'] = input_duration
+                frame_info['outgoing_frame'] = input_duration
                 frame_info['ratio'] = 0
                 frame_info['output'] = os.path.join(self.target_folder, f'{self.clip_name}.{output_frame_number:08}.exr')
                 frame_info_list.append(frame_info)
@@ -511,6 +1015,8 @@ class Timewarp():
 
             frame_info['incoming'] = src_files.get(incoming_frame_number)
             frame_info['outgoing'] = src_files.get(incoming_frame_number + 1)
+            frame_info['incoming_frame'] = incoming_frame_number
+            frame_info['outgoing_frame'] = incoming_frame_number + 1
             frame_info['ratio'] = frame_value_map[frame_number] - int(frame_value_map[frame_number])
             frame_info['output'] = os.path.join(self.target_folder, f'{self.clip_name}.{output_frame_number:08}.exr')
             frame_info_list.append(frame_info)
@@ -519,10 +1025,137 @@ class Timewarp():
 
             output_frame_number += 1
 
+        return frame_info_list
+
+    def mark_source_release(self, frame_info_list):
+        # source frames are deleted as soon as the last frame using them is read,
+        # has to run on the final render order
+        last_use = {}
+        for index, frame_info in enumerate(frame_info_list):
+            frame_info.pop('release', None)
+            last_use[frame_info['incoming_frame']] = index
+            last_use[frame_info['outgoing_frame']] = index
+        for source_frame, index in last_use.items():
+            frame_info_list[index].setdefault('release', []).append(source_frame)
+
+    def render_preview(self, frame_info_list):
+        try:
+            os.makedirs(self.preview_folder, exist_ok = True)
+        except Exception as e:
+            print (f'Unable to create preview folder {self.preview_folder}: {e}')
+            return False
+
+        preview_list = []
+        for index, frame_info in enumerate(frame_info_list):
+            # full quality pass replaces preview frames as it goes
+            frame_info['preview'] = os.path.join(self.preview_folder, os.path.basename(frame_info['output']))
+            if index % self.preview_step == 0:
+                preview_info = dict(frame_info)
+                preview_info['output'] = frame_info['preview']
+                preview_info.pop('preview')
+                preview_info.pop('release', None)
+                preview_list.append(preview_info)
+
+        print (f'rendering {len(preview_list)} preview frames to:\n{self.preview_folder}')
+        preview_start = time.time()
+        pbar = tqdm(total=len(preview_list),
+                    desc='preview',
+                    unit='frame',
+                    file=sys.stdout,
+                    bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]',
+                    ascii=f' {chr(0x2588)}',
+                    ncols=80
+                    )
+        try:
+            success = self.render_frames(preview_list, progress = pbar.update, flow_scale = self.preview_scale)
+        finally:
+            pbar.close()
+        if not success:
+            print ('Preview pass failed, continuing with full quality')
+            for frame_info in frame_info_list:
+                frame_info.pop('preview', None)
+            return False
+
+        # frames in between hold the last rendered preview frame
+        for index, frame_info in enumerate(frame_info_list):
+            if index % self.preview_step == 0:
+                held_frame = frame_info['preview']
+            elif not os.path.isfile(frame_info['preview']):
+                self.link_frame(held_frame, frame_info['preview'])
+
+        self.status.emit('preview', folder = self.preview_folder)
+        print (f'Preview done in {time.time() - preview_start:.2f}s')
+        return True
+
+    def link_frame(self, source_path, target_path):
+        # hard link where possible, renamed into place so Flame
+        # never reads a partially written frame
+        import shutil
+
+        temp_path = f'{target_path}.tmp'
+        try:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            try:
+                os.link(source_path, temp_path)
+            except OSError:
+                shutil.copyfile(source_path, temp_path)
+            os.replace(temp_path, target_path)
+        except Exception as e:
+            print (f'unable to link frame {target_path}: {e}')
+
+    def copy_frame(self, source_path, target_path):
+        # decoded and written as half float the same way interpolated
+        # frames are, so a sequence mixing both has one bit depth and header
+        import numpy as np
+
+        temp_path = f'{target_path}.tmp'
+        try:
+            read_start = time.time()
+            image_data = read_openexr_file(source_path)['image_data']
+            self.stage_times['read'] += time.time() - read_start
+            write_start = time.time()
+            write_exr(image_data.astype(np.float16), temp_path)
+            os.replace(temp_path, target_path)
+            self.stage_times['write'] += time.time() - write_start
+        except Exception as e:
+            print (f'unable to copy frame {target_path}: {e}')
+
+    def render_frames(self, frame_info_list, progress = None, flow_scale = 1.):
+        # progress is a callback used by pool workers and preview pass,
+        # frames are counted in local progress bar otherwise
+
+        source_watcher = None
+        source_offset = int(self.json_info.get('source_offset', 0))
+        if self.json_info.get('stream_source'):
+            source_watcher = SourceWatcher(
+                self.json_info.get('input'),
+                int(self.json_info.get('source_duration')),
+                timeout = self.json_info.get('stream_timeout', 600)
+            )
+
         def read_images(read_image_queue, frame_info_list):
+            source_paths = {}
             for frame_info in frame_info_list:
-                frame_info['incoming_image_data'] = read_openexr_file(frame_info['incoming'])
-                frame_info['outgoing_image_data'] = read_openexr_file(frame_info['outgoing'])
+                try:
+                    if source_watcher:
+                        frame_info['incoming'] = source_watcher.wait_for_frame(frame_info['incoming_frame'] - source_offset)
+                        frame_info['outgoing'] = source_watcher.wait_for_frame(frame_info['outgoing_frame'] - source_offset)
+                    read_start = time.time()
+                    frame_info['incoming_image_data'] = read_openexr_file(frame_info['incoming'])
+                    frame_info['outgoing_image_data'] = read_openexr_file(frame_info['outgoing'])
+                    self.stage_times['read'] += time.time() - read_start
+                except Exception as e:
+                    frame_info['error'] = f'{e}'
+                    read_image_queue.put(frame_info)
+                    return
+                source_paths[frame_info['incoming_frame']] = frame_info['incoming']
+                source_paths[frame_info['outgoing_frame']] = frame_info['outgoing']
+                for source_frame in frame_info.get('release', []):
+                    try:
+                        os.remove(source_paths.pop(source_frame))
+                    except Exception as e:
+                        print (f'unable to remove source frame {source_frame}: {e}')
                 read_image_queue.put(frame_info)
 
         read_image_queue = queue.Queue(maxsize=9)
@@ -530,14 +1163,14 @@ class Timewarp():
         read_thread.daemon = True
         read_thread.start()
 
-        print(f'rendering {len(frame_info_list)} frames to:\n{self.target_folder}')
-        self.pbar = tqdm(total=len(frame_info_list), 
-                         unit='frame',
-                         file=sys.stdout,
-                         bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]',
-                         ascii=f' {chr(0x2588)}',
-                         ncols=80
-                         )
+        if not progress:
+            self.pbar = tqdm(total=len(frame_info_list), 
+                            unit='frame',
+                            file=sys.stdout,
+                            bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]',
+                            ascii=f' {chr(0x2588)}',
+                            ncols=80
+                            )
 
         def write_images(write_image_queue):
             while True:
@@ -549,8 +1182,16 @@ class Timewarp():
                     if image_data is None:
                         # print ('finishing write thread')
                         break
+                    write_start = time.time()
                     write_exr(image_data, image_path)
-                    self.pbar.update(1)
+                    self.stage_times['write'] += time.time() - write_start
+                    if write_data.get('preview_path'):
+                        self.link_frame(image_path, write_data['preview_path'])
+                    if progress:
+                        progress(1)
+                    else:
+                        self.pbar.update(1)
+                        self.status.progress(1)
                 except queue.Empty:
                     time.sleep(1e-4)
                 except Exception as e:
@@ -563,6 +1204,10 @@ class Timewarp():
 
         for idx in range(len(frame_info_list)):
             frame_info = read_image_queue.get()
+            if frame_info.get('error'):
+                print (f'error reading source frames: {frame_info["error"]}')
+                self.status.error(f'error reading source frames: {frame_info["error"]}')
+                return False
             # print (f'frame {idx + 1} of {len(frame_info_list)}')
             img0 = frame_info['incoming_image_data']['image_data']
             img1 = frame_info['outgoing_image_data']['image_data']
@@ -582,18 +1227,111 @@ class Timewarp():
                         print (f'{e}')
                         return False
             try:
-                result = self.predict(img0, img1, ratio = ratio, iterations = 1)
-                write_image_queue.put({'image_data': result.copy(), 'image_path': image_path})
+                predict_start = time.time()
+                warm_start_key = (frame_info['incoming'], frame_info['outgoing']) if flow_scale == 1 else None
+                result = self.predict(img0, img1, ratio = ratio, iterations = 1, warm_start_key = warm_start_key, flow_scale = flow_scale)
+                self.stage_times['predict'] += time.time() - predict_start
+                # decoded sources are not needed any more
+                frame_info.pop('incoming_image_data')
+                frame_info.pop('outgoing_image_data')
+                write_image_queue.put({'image_data': result.copy(), 'image_path': image_path, 'preview_path': frame_info.get('preview')})
                 del result
             except Exception as e:
                 print (f'{e}')
+                self.status.error(f'{e}')
                 return False
 
         write_image_queue.put({'image_data': None, 'image_path': None})
         write_thread.join()
-        self.pbar.close()
+        if not progress:
+            self.pbar.close()
         return True
 
+    def render_pool(self, frame_info_list):
+        # Frames are split into contiguous shards, one per device, without
+        # breaking runs that share a source pair so warm start and flow
+        # reuse still work inside each shard. Output file names come from
+        # the plan so the frames are written in place by the workers.
+        from device_pool import shard_by_pairs, run_device_pool
+
+        shards = shard_by_pairs(
+            frame_info_list,
+            lambda frame_info: (frame_info['incoming_frame'], frame_info['outgoing_frame']),
+            len(self.devices)
+        )
+        worker_info = dict(self.json_info)
+        worker_info['devices'] = None
+        # status is published by the main process only
+        worker_info['status_file'] = None
+        worker_info['status_socket'] = None
+        worker_info['preview'] = False
+
+        if self.json_info.get('stream_source'):
+            # each worker's SourceWatcher maps frame numbers to sorted file
+            # positions, frames deleted by another worker before its first
+            # scan would shift them, so everything is left for the final cleanup
+            for frame_info in frame_info_list:
+                frame_info.pop('release', None)
+
+        # source frames used by more than one shard are left
+        # for the final cleanup, workers do not know each other's progress
+        shard_frames = []
+        for shard in shards:
+            frames = set()
+            for frame_info in shard:
+                frames.update((frame_info['incoming_frame'], frame_info['outgoing_frame']))
+            shard_frames.append(frames)
+        for shard_index, shard in enumerate(shards):
+            shared_frames = set()
+            for other_index, frames in enumerate(shard_frames):
+                if other_index != shard_index:
+                    shared_frames.update(shard_frames[shard_index].intersection(frames))
+            for frame_info in shard:
+                if frame_info.get('release'):
+                    frame_info['release'] = [f for f in frame_info['release'] if f not in shared_frames]
+
+        success, results = run_device_pool(
+            timewarp_pool_worker,
+            self.devices,
+            shards,
+            worker_args = (worker_info, ),
+            on_progress = self.status.progress
+        )
+
+        # merge worker stats so summaries and logs in process() cover the whole job,
+        # stage times are summed over workers
+        profile_rows = []
+        for device, result in zip(self.devices, results):
+            if not result:
+                continue
+            for row in result.pop('block_profile', []):
+                profile_rows.append(dict(row, device=device))
+            for name, value in result.items():
+                current = getattr(self, name)
+                if isinstance(value, bool):
+                    setattr(self, name, current or value)
+                elif isinstance(value, list):
+                    current.extend(value)
+                elif isinstance(value, dict):
+                    for key, item in value.items():
+                        current[key] = current.get(key, 0) + item
+
+        if profile_rows:
+            import json
+            output_folder = os.path.abspath(self.json_info.get('output'))
+            profile_path = os.path.join(
+                os.path.dirname(output_folder),
+                f'{self.json_info.get("clip_name")}.profile.json'
+            )
+            try:
+                with open(profile_path, 'w') as f:
+                    json.dump(profile_rows, f, indent=4)
+                print (f'Block profile saved to {profile_path}')
+            except Exception as e:
+                print (f'Unable to save block profile to {profile_path}: {e}')
+
+        return success
+
     def process_fluidmorph(self):
         if not self.model:
             print (f'Unable to import model from file {self.model_path}')
@@ -646,8 +1384,10 @@ class Timewarp():
 
         def read_images(read_image_queue, frame_info_list):
             for frame_info in frame_info_list:
+                read_start = time.time()
                 frame_info['incoming_image_data'] = read_openexr_file(frame_info['incoming'])
                 frame_info['outgoing_image_data'] = read_openexr_file(frame_info['outgoing'])
+                self.stage_times['read'] += time.time() - read_start
                 read_image_queue.put(frame_info)
 
         read_image_queue = queue.Queue(maxsize=9)
@@ -656,6 +1396,7 @@ class Timewarp():
         read_thread.start()
 
         print(f'rendering {len(frame_info_list)} frames to:\n{self.target_folder}')
+        self.status.start(len(frame_info_list), output = self.target_folder)
         self.pbar = tqdm(total=len(frame_info_list), 
                          unit='frame',
                          file=sys.stdout,
@@ -674,8 +1415,11 @@ class Timewarp():
                     if image_data is None:
                         # print ('finishing write thread')
                         break
+                    write_start = time.time()
                     write_exr(image_data, image_path)
+                    self.stage_times['write'] += time.time() - write_start
                     self.pbar.update(1)
+                    self.status.progress(1)
                 except queue.Empty:
                     time.sleep(1e-4)
                 except Exception as e:
@@ -707,7 +1451,9 @@ class Timewarp():
                         print (f'{e}')
                         return False
             try:
+                predict_start = time.time()
                 result = self.predict(img0, img1, ratio = ratio, iterations = 1)
+                self.stage_times['predict'] += time.time() - predict_start
                 write_image_queue.put({'image_data': result.copy(), 'image_path': image_path})
                 del result
             except Exception as e:
@@ -719,7 +1465,156 @@ class Timewarp():
         self.pbar.close()
         return True
 
-    def predict(self, incoming_data, outgoing_data, ratio = 0.5, iterations = 1):
+    def process_dedup(self):
+        # Finds held frames in one pass over the source and either
+        # fills them with frames interpolated between the unique frames
+        # around each hold or removes them from the sequence.
+        self.target_folder = self.json_info.get('output')
+        self.clip_name = self.json_info.get('clip_name')
+        action = self.json_info.get('dedup_action', 'fill')
+        source_folder = self.json_info.get('input')
+
+        if action == 'fill' and not self.model:
+            print (f'Unable to import model from file {self.model_path}')
+            self.status.error(f'Unable to import model from file {self.model_path}')
+            return False
+
+        if self.json_info.get('stream_source'):
+            source_watcher = SourceWatcher(
+                source_folder,
+                int(self.json_info.get('source_duration')),
+                timeout = self.json_info.get('stream_timeout', 600)
+            )
+            source_count = int(self.json_info.get('source_duration'))
+            get_source_path = lambda index: source_watcher.wait_for_frame(index + 1)
+        else:
+            source_files = sorted([os.path.join(source_folder, f) for f in os.listdir(source_folder) if f.endswith('.exr')])
+            source_count = len(source_files)
+            get_source_path = lambda index: source_files[index]
+
+        detector = DuplicateDetector(
+            threshold = self.json_info.get('dedup_threshold', 1e-3),
+            max_threshold = self.json_info.get('dedup_max_threshold', 1e-2),
+            step = int(self.json_info.get('dedup_step', 8)),
+            size = int(self.json_info.get('dedup_size', 32))
+        )
+
+        def read_signatures(signature_queue):
+            for index in range(source_count):
+                try:
+                    file_path = get_source_path(index)
+                    read_start = time.time()
+                    signature = detector.signature(file_path)
+                    self.stage_times['read'] += time.time() - read_start
+                except Exception as e:
+                    signature_queue.put({'error': f'{e}'})
+                    return
+                signature_queue.put({'path': file_path, 'signature': signature})
+
+        signature_queue = queue.Queue(maxsize=32)
+        read_thread = threading.Thread(target=read_signatures, args=(signature_queue, ))
+        read_thread.daemon = True
+        read_thread.start()
+
+        print (f'scanning {source_count} frames for duplicates')
+        pbar = tqdm(total=source_count,
+                    desc='scan',
+                    unit='frame',
+                    file=sys.stdout,
+                    bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]',
+                    ascii=f' {chr(0x2588)}',
+                    ncols=80
+                    )
+        source_paths = []
+        duplicates = []
+        for index in range(source_count):
+            signature_data = signature_queue.get()
+            if signature_data.get('error'):
+                pbar.close()
+                print (f'error reading source frames: {signature_data["error"]}')
+                self.status.error(f'error reading source frames: {signature_data["error"]}')
+                return False
+            duplicate, mean_diff, max_diff = detector.add(signature_data['signature'])
+            source_paths.append(signature_data['path'])
+            duplicates.append(duplicate)
+            if duplicate:
+                self.decision_log.append(f'{os.path.basename(signature_data["path"])}: duplicate, difference mean {mean_diff:.6f} max {max_diff:.6f}')
+            pbar.update(1)
+        pbar.close()
+        print (f'found {sum(duplicates)} duplicate frames of {source_count}')
+
+        if action == 'remove':
+            unique_paths = [path for path, duplicate in zip(source_paths, duplicates) if not duplicate]
+            self.status.start(len(unique_paths), output = self.target_folder)
+            for output_index, source_path in enumerate(unique_paths):
+                self.link_frame(source_path, os.path.join(self.target_folder, f'{self.clip_name}.{output_index + 1:08}.exr'))
+                self.status.progress(1)
+            return True
+
+        # source frames are rewritten rather than linked, export can be
+        # full float and fills are always written as half float
+        self.status.start(source_count, output = self.target_folder)
+        frame_info_list = []
+        previous_unique = None
+        for index in range(source_count):
+            output_path = os.path.join(self.target_folder, f'{self.clip_name}.{index + 1:08}.exr')
+            if not duplicates[index]:
+                self.copy_frame(source_paths[index], output_path)
+                self.status.progress(1)
+                previous_unique = index
+                continue
+            next_unique = next((i for i in range(index + 1, source_count) if not duplicates[i]), None)
+            if previous_unique is None or next_unique is None:
+                # hold at the end of clip has nothing to interpolate to
+                self.copy_frame(source_paths[index], output_path)
+                self.status.progress(1)
+                continue
+            frame_info_list.append({
+                'incoming': source_paths[previous_unique],
+                'outgoing': source_paths[next_unique],
+                'incoming_frame': previous_unique + 1,
+                'outgoing_frame': next_unique + 1,
+                'ratio': (index - previous_unique) / (next_unique - previous_unique),
+                'output': output_path
+            })
+
+        if not frame_info_list:
+            return True
+
+        print(f'filling {len(frame_info_list)} frames to:\n{self.target_folder}')
+        # all source frames are there after the scan
+        self.json_info['stream_source'] = False
+        return self.render_frames(frame_info_list)
+
+    def warp(self, tenInput, tenFlow):
+        import torch
+
+        input_device = tenInput.device
+        input_dtype = tenInput.dtype
+        if 'mps' in str(input_device):
+            tenInput = tenInput.detach().to(device=torch.device('cpu'), dtype=torch.float32)
+            tenFlow = tenFlow.detach().to(device=torch.device('cpu'), dtype=torch.float32)
+
+        backwarp_tenGrid = {}
+        k = (str(tenFlow.device), str(tenFlow.size()))
+        if k not in backwarp_tenGrid:
+            tenHorizontal = torch.linspace(-1.0, 1.0, tenFlow.shape[3]).view(1, 1, 1, tenFlow.shape[3]).expand(tenFlow.shape[0], -1, tenFlow.shape[2], -1)
+            tenVertical = torch.linspace(-1.0, 1.0, tenFlow.shape[2]).view(1, 1, tenFlow.shape[2], 1).expand(tenFlow.shape[0], -1, -1, tenFlow.shape[3])
+            backwarp_tenGrid[k] = torch.cat([ tenHorizontal, tenVertical ], 1).to(device=tenInput.device, dtype=tenInput.dtype)
+        tenFlow = torch.cat([ tenFlow[:, 0:1, :, :] / ((tenInput.shape[3] - 1.0) / 2.0), tenFlow[:, 1:2, :, :] / ((tenInput.shape[2] - 1.0) / 2.0) ], 1)
+
+        g = (backwarp_tenGrid[k] + tenFlow).permute(0, 2, 3, 1)
+        result = torch.nn.functional.grid_sample(
+            input=tenInput, 
+            grid=g, 
+            mode='bilinear', 
+            padding_mode='reflection', 
+            align_corners=True
+            )
+
+        return result.detach().to(device=input_device, dtype=input_dtype)
+
+    def predict(self, incoming_data, outgoing_data, ratio = 0.5, iterations = 1, warm_start_key = None, flow_scale = 1.):
         import numpy as np
         import torch
 
@@ -740,32 +1635,6 @@ class Timewarp():
             image_array = (image_array + 1) / 2
             return image_array
 
-        def warp(tenInput, tenFlow):
-            input_device = tenInput.device
-            input_dtype = tenInput.dtype
-            if 'mps' in str(input_device):
-                tenInput = tenInput.detach().to(device=torch.device('cpu'), dtype=torch.float32)
-                tenFlow = tenFlow.detach().to(device=torch.device('cpu'), dtype=torch.float32)
-
-            backwarp_tenGrid = {}
-            k = (str(tenFlow.device), str(tenFlow.size()))
-            if k not in backwarp_tenGrid:
-                tenHorizontal = torch.linspace(-1.0, 1.0, tenFlow.shape[3]).view(1, 1, 1, tenFlow.shape[3]).expand(tenFlow.shape[0], -1, tenFlow.shape[2], -1)
-                tenVertical = torch.linspace(-1.0, 1.0, tenFlow.shape[2]).view(1, 1, tenFlow.shape[2], 1).expand(tenFlow.shape[0], -1, -1, tenFlow.shape[3])
-                backwarp_tenGrid[k] = torch.cat([ tenHorizontal, tenVertical ], 1).to(device=tenInput.device, dtype=tenInput.dtype)
-            tenFlow = torch.cat([ tenFlow[:, 0:1, :, :] / ((tenInput.shape[3] - 1.0) / 2.0), tenFlow[:, 1:2, :, :] / ((tenInput.shape[2] - 1.0) / 2.0) ], 1)
-
-            g = (backwarp_tenGrid[k] + tenFlow).permute(0, 2, 3, 1)
-            result = torch.nn.functional.grid_sample(
-                input=tenInput, 
-                grid=g, 
-                mode='bilinear', 
-                padding_mode='reflection', 
-                align_corners=True
-                )
-
-            return result.detach().to(device=input_device, dtype=input_dtype)
-
         with torch.no_grad():
             if ratio == 0:
                 return incoming_data
@@ -801,585 +1670,868 @@ class Timewarp():
 
                 # print (f'img0 dtype{img0.dtype} img1 dtype{img1.dtype}')
 
-                flow_list, mask_list, merged = self.model(
+                if flow_scale < 1:
+                    flow, mask = self.predict_proxy_flow(img0_ref, img1_ref, ratio, flow_scale, iterations = iterations)
+                    result = self.warp(img0, flow[:, :2, :h, :w]) * mask[:, :, :h, :w] + self.warp(img1, flow[:, 2:4, :h, :w]) * (1 - mask[:, :, :h, :w])
+                    return result[0].clone().cpu().detach().numpy().transpose(1, 2, 0).astype(np.float16)
+
+                if self.sparse_tiles:
+                    result = self.predict_sparse(img0, img1, img0_ref, img1_ref, ratio, iterations = iterations)
+                    if result is not None:
+                        return result[0].clone().cpu().detach().numpy().transpose(1, 2, 0).astype(np.float16)
+
+                flow, mask = self.predict_flow(
                     img0_ref,
                     img1_ref,
                     ratio,
-                    iterations = iterations
+                    iterations = iterations,
+                    warm_start_key = warm_start_key
                     )
 
-                result = warp(img0, flow_list[3][:, :2, :h, :w]) * mask_list[3][:, :, :h, :w] + warp(img1, flow_list[3][:, 2:4, :h, :w]) * (1 - mask_list[3][:, :, :h, :w])
+                result = self.warp(img0, flow[:, :2, :h, :w]) * mask[:, :, :h, :w] + self.warp(img1, flow[:, 2:4, :h, :w]) * (1 - mask[:, :, :h, :w])
                 # result = merged[0][:, :3, :h, :w]
                 return result[0].clone().cpu().detach().numpy().transpose(1, 2, 0).astype(np.float16)
                 # del img0, img1, img0_ref, img1_ref, flow_list, mask_list, merged, incoming_data, outgoing_data, result_torch
                 # return result
 
+    def predict_flow(self, img0_ref, img1_ref, ratio, iterations = 1, warm_start_key = None):
+        # returns final flow and mask (after sigmoid) for a padded normalized pair,
+        # warm-starting the cascade from the previous frame if enabled
+        import torch
+
+        def run_model(flow_init = None, mask_init = None, model_ratio = ratio):
+            model_kwargs = {}
+            if flow_init is not None:
+                model_kwargs['flow_init'] = flow_init
+                model_kwargs['mask_init'] = mask_init
+            if self.adaptive_exit:
+                model_kwargs['exit_threshold'] = self.adaptive_exit_threshold
+                model_kwargs['exit_mask_threshold'] = self.adaptive_exit_mask_threshold
+
+            flow_list, mask_list, merged = self.model(
+                img0_ref,
+                img1_ref,
+                model_ratio,
+                iterations = iterations,
+                **model_kwargs
+                )
+
+            if self.adaptive_exit:
+                exit_level = self.model.exit_level
+                self.adaptive_exit_stats[exit_level] += 1
+                if warm_start_key:
+                    frame_name = f'{os.path.basename(warm_start_key[0])} -> {os.path.basename(warm_start_key[1])}'
+                else:
+                    frame_name = 'frame'
+                if exit_level < 3:
+                    self.decision_log.append(f'{frame_name} ratio {model_ratio:.4f}: exit after block{exit_level}')
+                else:
+                    self.decision_log.append(f'{frame_name} ratio {model_ratio:.4f}: full cascade')
+
+            return flow_list[3], mask_list[3]
+
+        if self.flow_reuse and warm_start_key:
+            state = self.flow_reuse_state
+            if state is None or state['key'] != warm_start_key or state['flow'].shape[2:] != img0_ref.shape[2:]:
+                flow, mask = run_model(model_ratio = 0.5)
+                self.flow_reuse_state = {'key': warm_start_key, 'flow': flow, 'mask': mask}
+                self.flow_reuse_stats['computed'] += 1
+            else:
+                self.flow_reuse_stats['reused'] += 1
+            return self.retime_half_flow(self.flow_reuse_state['flow'], self.flow_reuse_state['mask'], ratio)
+
+        if not (self.warm_start and warm_start_key):
+            return run_model()
+
+        state = self.warm_start_state
+        decision = 'cold'
+        if state is not None and state['flow'].shape[2:] == img0_ref.shape[2:]:
+            if state['key'] == warm_start_key:
+                decision = 'warm'
+            elif state['key'][1] == warm_start_key[0]:
+                decision = 'warm'
+            if decision == 'warm' and state['warm_count'] >= self.warm_start_refresh:
+                decision = 'refresh'
+            if decision == 'warm':
+                small0 = torch.nn.functional.interpolate(img0_ref, scale_factor = 1 / 16, mode='area')
+                small1 = torch.nn.functional.interpolate(img1_ref, scale_factor = 1 / 16, mode='area')
+                if float((small0 - small1).abs().mean()) > self.warm_start_cut_threshold:
+                    decision = 'cut'
+
+        residual = None
+        if decision == 'warm':
+            # previous flow re-timed to current ratio assuming linear motion
+            motion = state['flow'][:, 2:4] - state['flow'][:, :2]
+            flow_init = torch.cat((-ratio * motion, (1 - ratio) * motion), 1)
+            if state['key'] == warm_start_key:
+                mask_init = state['mask']
+            else:
+                # occlusions are different for the next pair, start neutral
+                mask_init = None
+            flow, mask = run_model(flow_init, mask_init)
+            residual = self.flow_residual(img0_ref, img1_ref, flow)
+            if residual > state['residual'] * self.warm_start_residual_factor + 5e-3:
+                decision = 'fallback'
+
+        if decision != 'warm':
+            flow, mask = run_model()
+            cold_residual = self.flow_residual(img0_ref, img1_ref, flow)
+            warm_count = 0
+        else:
+            cold_residual = state['residual']
+            warm_count = state['warm_count'] + 1
+
+        self.warm_start_stats[decision] += 1
+        log_line = f'{os.path.basename(warm_start_key[0])} -> {os.path.basename(warm_start_key[1])} ratio {ratio:.4f}: warm start {decision}'
+        if residual is not None:
+            log_line += f', residual {residual:.5f} (cold {state["residual"]:.5f})'
+        self.decision_log.append(log_line)
+
+        self.warm_start_state = {
+            'key': warm_start_key,
+            'flow': flow,
+            'mask': torch.logit(mask.float().clamp(1e-4, 1 - 1e-4)).to(dtype = mask.dtype),
+            'residual': cold_residual,
+            'warm_count': warm_count
+        }
+
+        return flow, mask
+
+    def predict_proxy_flow(self, img0_ref, img1_ref, ratio, flow_scale, iterations = 1):
+        # flow and mask computed on a downscaled copy of the padded pair
+        # and brought back to full size, flow vectors scaled accordingly
+        import torch
+
+        _, _, ph, pw = img0_ref.shape
+        sh = max(64, int(ph * flow_scale) // 64 * 64)
+        sw = max(64, int(pw * flow_scale) // 64 * 64)
+        small0 = torch.nn.functional.interpolate(img0_ref, size = (sh, sw), mode = 'area')
+        small1 = torch.nn.functional.interpolate(img1_ref, size = (sh, sw), mode = 'area')
+
+        flow, mask = self.predict_flow(small0, small1, ratio, iterations = iterations)
+
+        flow = torch.nn.functional.interpolate(flow, size = (ph, pw), mode = 'bilinear', align_corners = False)
+        mask = torch.nn.functional.interpolate(mask, size = (ph, pw), mode = 'bilinear', align_corners = False)
+        flow = torch.cat((
+            flow[:, 0:1] * (pw / sw),
+            flow[:, 1:2] * (ph / sh),
+            flow[:, 2:3] * (pw / sw),
+            flow[:, 3:4] * (ph / sh)
+        ), 1)
+        return flow, mask
+
+    def predict_sparse(self, img0, img1, img0_ref, img1_ref, ratio, iterations = 1):
+        # Splits padded frame into tiles and runs the model in batches only
+        # on the moving ones, each with a margin of context around it.
+        # Returns None if the whole frame should be processed instead.
+        import torch
+
+        n, c, h, w = img0.shape
+        _, _, ph, pw = img0_ref.shape
+        tile = self.sparse_tile_size
+        margin = self.sparse_tile_margin
+        crop = tile + 2 * margin
+        if ph < crop or pw < crop:
+            return None
+
+        tiles_y = (ph - 1) // tile + 1
+        tiles_x = (pw - 1) // tile + 1
+
+        diff = (img0_ref - img1_ref).abs().float().mean(1, keepdim=True)
+        diff = torch.nn.functional.avg_pool2d(diff, 8)
+        diff = torch.nn.functional.pad(diff, (0, tiles_x * tile // 8 - diff.shape[3], 0, tiles_y * tile // 8 - diff.shape[2]))
+        moving = torch.nn.functional.max_pool2d(diff, tile // 8) > self.sparse_threshold
+        # grow by one tile so motion crossing into a static tile is covered
+        moving = torch.nn.functional.max_pool2d(moving.float(), 3, stride=1, padding=1) > 0
+        moving = moving[0, 0].cpu()
+
+        frame_area = h * w
+        moving_tiles = []
+        static_area = 0
+        for ty in range(tiles_y):
+            for tx in range(tiles_x):
+                tile_area = max(0, min(tile, h - ty * tile)) * max(0, min(tile, w - tx * tile))
+                if moving[ty, tx]:
+                    moving_tiles.append((ty, tx))
+                else:
+                    static_area += tile_area
+
+        self.sparse_stats['area'] += frame_area
+        if len(moving_tiles) > self.sparse_max_fraction * tiles_y * tiles_x:
+            self.sparse_stats['full'] += 1
+            self.decision_log.append(f'ratio {ratio:.4f}: sparse tiles {len(moving_tiles)}/{tiles_y * tiles_x} moving, full frame')
+            return None
+        self.sparse_stats['skipped'] += static_area
+        self.decision_log.append(f'ratio {ratio:.4f}: sparse tiles {len(moving_tiles)}/{tiles_y * tiles_x} moving, skipped {static_area / frame_area * 100:.1f}%')
+
+        padding = (0, pw - w, 0, ph - h)
+        img0_padded = torch.nn.functional.pad(img0, padding)
+        img1_padded = torch.nn.functional.pad(img1, padding)
+        result = img0_padded * (1 - ratio) + img1_padded * ratio
+
+        crops = []
+        for ty, tx in moving_tiles:
+            cy = min(max(ty * tile - margin, 0), ph - crop)
+            cx = min(max(tx * tile - margin, 0), pw - crop)
+            crops.append((ty * tile, tx * tile, cy, cx))
+
+        for batch_start in range(0, len(crops), self.sparse_batch_size):
+            batch = crops[batch_start:batch_start + self.sparse_batch_size]
+            batch0_ref = torch.cat([img0_ref[:, :, cy:cy + crop, cx:cx + crop] for _, _, cy, cx in batch])
+            batch1_ref = torch.cat([img1_ref[:, :, cy:cy + crop, cx:cx + crop] for _, _, cy, cx in batch])
+            batch0 = torch.cat([img0_padded[:, :, cy:cy + crop, cx:cx + crop] for _, _, cy, cx in batch])
+            batch1 = torch.cat([img1_padded[:, :, cy:cy + crop, cx:cx + crop] for _, _, cy, cx in batch])
+
+            flow, mask = self.predict_flow(batch0_ref, batch1_ref, ratio, iterations = iterations)
+            batch_result = self.warp(batch0, flow[:, :2]) * mask + self.warp(batch1, flow[:, 2:4]) * (1 - mask)
+
+            for index, (y0, x0, cy, cx) in enumerate(batch):
+                result[:, :, y0:y0 + tile, x0:x0 + tile] = batch_result[index:index + 1, :, y0 - cy:y0 - cy + tile, x0 - cx:x0 - cx + tile]
+
+        return result[:, :, :h, :w]
+
+    def retime_half_flow(self, flow, mask, ratio):
+        # flow and mask estimated at ratio 0.5 rescaled to given ratio,
+        # mask is weighted towards the temporally closer source
+        import torch
+
+        flow = torch.cat((flow[:, :2] * (ratio / 0.5), flow[:, 2:4] * ((1 - ratio) / 0.5)), 1)
+        weight0 = (1 - ratio) * mask
+        weight1 = ratio * (1 - mask)
+        mask = weight0 / (weight0 + weight1 + 1e-6)
+        return flow, mask
+
+    def flow_residual(self, img0_ref, img1_ref, flow):
+        # mean photometric difference of both sources warped to the
+        # intermediate frame, at quarter resolution to keep it cheap
+        import torch
+
+        img0_small = torch.nn.functional.interpolate(img0_ref, scale_factor = 1 / 4, mode='area')
+        img1_small = torch.nn.functional.interpolate(img1_ref, scale_factor = 1 / 4, mode='area')
+        flow_small = torch.nn.functional.interpolate(flow, scale_factor = 1 / 4, mode='area') / 4
+        warped0 = self.warp(img0_small, flow_small[:, :2])
+        warped1 = self.warp(img1_small, flow_small[:, 2:4])
+        return float((warped0 - warped1).abs().mean())
+
     def bake_flame_tw_setup(self, tw_setup_string):
-        # parses tw setup from flame and returns dictionary
-        # with baked frame - value pairs
-        
-        def dictify(r, root=True):
-            def string_to_value(s):
-                if (s.find('-') <= 0) and s.replace('-', '', 1).isdigit():
-                    return int(s)
-                elif (s.find('-') <= 0) and (s.count('.') < 2) and \
-                        (s.replace('-', '', 1).replace('.', '', 1).isdigit()):
-                    return float(s)
-                elif s == 'True':
-                    return True
-                elif s == 'False':
-                    return False
+        return bake_flame_tw_setup(tw_setup_string, self.record_in, self.record_out)
+
+def bake_flame_tw_setup(tw_setup_string, record_in, record_out):
+    # parses tw setup from flame and returns dictionary
+    # with baked frame - value pairs.
+    # Kept at module level and only needs numpy
+    # so the flame hook can bake the curve before export
+    
+    def dictify(r, root=True):
+        def string_to_value(s):
+            if (s.find('-') <= 0) and s.replace('-', '', 1).isdigit():
+                return int(s)
+            elif (s.find('-') <= 0) and (s.count('.') < 2) and \
+                    (s.replace('-', '', 1).replace('.', '', 1).isdigit()):
+                return float(s)
+            elif s == 'True':
+                return True
+            elif s == 'False':
+                return False
+            else:
+                return s
+
+        from copy import copy
+
+        if root:
+            return {r.tag: dictify(r, False)}
+
+        d = copy(r.attrib)
+        if r.text:
+            # d["_text"] = r.text
+            d = r.text
+        for x in r.findall('./*'):
+            if x.tag not in d:
+                v = dictify(x, False)
+                if not isinstance (d, dict):
+                    d = {}
+                if isinstance (v, str):
+                    d[x.tag] = string_to_value(v)
                 else:
-                    return s
-
-            from copy import copy
-
-            if root:
-                return {r.tag: dictify(r, False)}
-
-            d = copy(r.attrib)
-            if r.text:
-                # d["_text"] = r.text
-                d = r.text
-            for x in r.findall('./*'):
-                if x.tag not in d:
-                    v = dictify(x, False)
-                    if not isinstance (d, dict):
-                        d = {}
-                    if isinstance (v, str):
-                        d[x.tag] = string_to_value(v)
-                    else:
-                        d[x.tag] = []
-                if isinstance(d[x.tag], list):
-                    d[x.tag].append(dictify(x, False))
-            return d
-
-        class FlameChannellInterpolator:
-            # An attempt of a python rewrite of Julit Tarkhanov's original
-            # Flame Channel Parsr written in Ruby.
-
-            class ConstantSegment:
-                def __init__(self, from_frame, to_frame, value):
-                    self._mode = 'constant'
-                    self.start_frame = from_frame
-                    self.end_frame = to_frame
-                    self.v1 = value
-
-                def mode(self):
-                    return self._mode
-
-                def defines(self, frame):
-                    return (frame < self.end_frame) and (frame >= self.start_frame)
-
-                def value_at(self, frame):
-                    return self.v1
-
-            class LinearSegment(ConstantSegment):
-                def __init__(self, from_frame, to_frame, value1, value2):
-                    self.vint = (value2 - value1)
-                    super().__init__(from_frame, to_frame, value1)
-                    self._mode = 'linear'
-
-                def value_at(self, frame):
-                    on_t_interval = (frame - self.start_frame) / (self.end_frame - self.start_frame)
-                    return self.v1 + (on_t_interval * self.vint)
-                
-                '''
+                    d[x.tag] = []
+            if isinstance(d[x.tag], list):
+                d[x.tag].append(dictify(x, False))
+        return d
+
+    class FlameChannellInterpolator:
+        # An attempt of a python rewrite of Julit Tarkhanov's original
+        # Flame Channel Parsr written in Ruby.
+
+        class ConstantSegment:
+            def __init__(self, from_frame, to_frame, value):
+                self._mode = 'constant'
+                self.start_frame = from_frame
+                self.end_frame = to_frame
+                self.v1 = value
+
+            def mode(self):
+                return self._mode
+
+            def defines(self, frame):
+                return (frame < self.end_frame) and (frame >= self.start_frame)
+
+            def value_at(self, frame):
+                return self.v1
+
+        class LinearSegment(ConstantSegment):
+            def __init__(self, from_frame, to_frame, value1, value2):
+                self.vint = (value2 - value1)
+                super().__init__(from_frame, to_frame, value1)
+                self._mode = 'linear'
+
+            def value_at(self, frame):
+                on_t_interval = (frame - self.start_frame) / (self.end_frame - self.start_frame)
+                return self.v1 + (on_t_interval * self.vint)
+            
+            '''
+            self.HERMATRIX = np.array([
+                [2,  -2,  1,  1],
+                [-3, 3,   -2, -1],
+                [0,   0,  1,  0],
+                [1,   0,  0,  0]
+            ])
+            '''
+
+        class HermiteSegment(LinearSegment):
+            def __init__(self, from_frame, to_frame, value1, value2, tangent1, tangent2):
+                self.start_frame, self.end_frame = from_frame, to_frame
+                frame_interval = self.end_frame - self.start_frame
+                self._mode = 'hermite'
+
                 self.HERMATRIX = np.array([
-                    [2,  -2,  1,  1],
-                    [-3, 3,   -2, -1],
-                    [0,   0,  1,  0],
-                    [1,   0,  0,  0]
-                ])
-                '''
-
-            class HermiteSegment(LinearSegment):
-                def __init__(self, from_frame, to_frame, value1, value2, tangent1, tangent2):
-                    self.start_frame, self.end_frame = from_frame, to_frame
-                    frame_interval = self.end_frame - self.start_frame
-                    self._mode = 'hermite'
-
-                    self.HERMATRIX = np.array([
-                        [2, -3,  0,  1],
-                        [-2, 3,  0,  0],
-                        [1, -2,  1,  0],
-                        [1, -1,  0,  0]
-                    ]).T
-
-                    #self.HERMATRIX = np.array([
-                    #    [0,  0,  0,  1],
-                    #    [1,  1,  1,  1],
-                    #    [0,  0,  1,  0],
-                    #    [3,  2,  1,  0]
-                    #])
-                    #self.HERMATRIX = np.linalg.inv(self.HERMATRIX)
-
-                    # Default tangents in flame are 0, so when we do None.to_f this is what we will get
-                    # CC = {P1, P2, T1, T2}
-                    p1, p2, t1, t2 = value1, value2, tangent1 * frame_interval, tangent2 * frame_interval
-                    self.hermite = np.array([p1, p2, t1, t2])
-                    self.basis = np.dot(self.HERMATRIX, self.hermite)
-
-                def value_at(self, frame):
-                    if frame == self.start_frame:
-                        return self.hermite[0]
-
-                    # Get the 0 < T < 1 interval we will interpolate on
-                    # Q[frame_] = P[ ( frame - 149 ) / (time_to - time_from)]
-                    t = (frame - self.start_frame) / (self.end_frame - self.start_frame)
-
-                    # S[s_] = {s^3, s^2, s^1, s^0}
-                    multipliers_vec = np.array([t ** 3, t ** 2, t ** 1, t ** 0])
-
-                    # P[s_] = S[s].h.CC
-                    interpolated_scalar = np.dot(self.basis, multipliers_vec)
-                    return interpolated_scalar
-
-            class BezierSegment(LinearSegment):
-                class Pt:
-                    def __init__(self, x, y, tanx, tany):
-                        self.x = x
-                        self.y = y
-                        self.tanx = tanx
-                        self.tany = tany
-                
-                def __init__(self, x1, x2, y1, y2, t1x, t1y, t2x, t2y):
-                    super().__init__(x1, x2, y1, y2)
-                    self.a = self.Pt(x1, y1, t1x, t1y)
-                    self.b = self.Pt(x2, y2, t2x, t2y)
-                    self._mode = 'bezier'
-
-                def value_at(self, frame):
-                    if frame == self.start_frame:
-                        return self.a.y
-                    
-                    t = self.approximate_t(frame, self.a.x, self.a.tanx, self.b.tanx, self.b.x)
-                    vy = self.bezier(t, self.a.y, self.a.tany, self.b.tany, self.b.y)
-                    return vy
+                    [2, -3,  0,  1],
+                    [-2, 3,  0,  0],
+                    [1, -2,  1,  0],
+                    [1, -1,  0,  0]
+                ]).T
+
+                #self.HERMATRIX = np.array([
+                #    [0,  0,  0,  1],
+                #    [1,  1,  1,  1],
+                #    [0,  0,  1,  0],
+                #    [3,  2,  1,  0]
+                #])
+                #self.HERMATRIX = np.linalg.inv(self.HERMATRIX)
+
+                # Default tangents in flame are 0, so when we do None.to_f this is what we will get
+                # CC = {P1, P2, T1, T2}
+                p1, p2, t1, t2 = value1, value2, tangent1 * frame_interval, tangent2 * frame_interval
+                self.hermite = np.array([p1, p2, t1, t2])
+                self.basis = np.dot(self.HERMATRIX, self.hermite)
+
+            def value_at(self, frame):
+                if frame == self.start_frame:
+                    return self.hermite[0]
+
+                # Get the 0 < T < 1 interval we will interpolate on
+                # Q[frame_] = P[ ( frame - 149 ) / (time_to - time_from)]
+                t = (frame - self.start_frame) / (self.end_frame - self.start_frame)
+
+                # S[s_] = {s^3, s^2, s^1, s^0}
+                multipliers_vec = np.array([t ** 3, t ** 2, t ** 1, t ** 0])
+
+                # P[s_] = S[s].h.CC
+                interpolated_scalar = np.dot(self.basis, multipliers_vec)
+                return interpolated_scalar
+
+        class BezierSegment(LinearSegment):
+            class Pt:
+                def __init__(self, x, y, tanx, tany):
+                    self.x = x
+                    self.y = y
+                    self.tanx = tanx
+                    self.tany = tany
+            
+            def __init__(self, x1, x2, y1, y2, t1x, t1y, t2x, t2y):
+                super().__init__(x1, x2, y1, y2)
+                self.a = self.Pt(x1, y1, t1x, t1y)
+                self.b = self.Pt(x2, y2, t2x, t2y)
+                self._mode = 'bezier'
+
+            def value_at(self, frame):
+                if frame == self.start_frame:
+                    return self.a.y
                 
-                def bezier(self, t, a, b, c, d):
-                    return a + (a*(-3) + b*3)*(t) + (a*3 - b*6 + c*3)*(t**2) + (-a + b*3 - c*3 + d)*(t**3)
+                t = self.approximate_t(frame, self.a.x, self.a.tanx, self.b.tanx, self.b.x)
+                vy = self.bezier(t, self.a.y, self.a.tany, self.b.tany, self.b.y)
+                return vy
+            
+            def bezier(self, t, a, b, c, d):
+                return a + (a*(-3) + b*3)*(t) + (a*3 - b*6 + c*3)*(t**2) + (-a + b*3 - c*3 + d)*(t**3)
+            
+            def clamp(self, value):
+                if value < 0:
+                    return 0.0
+                elif value > 1:
+                    return 1.0
+                else:
+                    return value
+            
+            APPROXIMATION_EPSILON = 1.0e-09
+            VERYSMALL = 1.0e-20
+            MAXIMUM_ITERATIONS = 100
+            
+            def approximate_t(self, atX, p0x, c0x, c1x, p1x):
+                if atX - p0x < self.VERYSMALL:
+                    return 0.0
+                elif p1x - atX < self.VERYSMALL:
+                    return 1.0
+
+                u, v = 0.0, 1.0
                 
-                def clamp(self, value):
-                    if value < 0:
-                        return 0.0
-                    elif value > 1:
-                        return 1.0
+                for i in range(self.MAXIMUM_ITERATIONS):
+                    a = (p0x + c0x) / 2.0
+                    b = (c0x + c1x) / 2.0
+                    c = (c1x + p1x) / 2.0
+                    d = (a + b) / 2.0
+                    e = (b + c) / 2.0
+                    f = (d + e) / 2.0
+                    
+                    if abs(f - atX) < self.APPROXIMATION_EPSILON:
+                        return self.clamp((u + v) * 0.5)
+                    
+                    if f < atX:
+                        p0x = f
+                        c0x = e
+                        c1x = c
+                        u = (u + v) / 2.0
                     else:
-                        return value
-                
-                APPROXIMATION_EPSILON = 1.0e-09
-                VERYSMALL = 1.0e-20
-                MAXIMUM_ITERATIONS = 100
+                        c0x = a
+                        c1x = d
+                        p1x = f
+                        v = (u + v) / 2.0
                 
-                def approximate_t(self, atX, p0x, c0x, c1x, p1x):
-                    if atX - p0x < self.VERYSMALL:
-                        return 0.0
-                    elif p1x - atX < self.VERYSMALL:
-                        return 1.0
+                return self.clamp((u + v) / 2.0)
 
-                    u, v = 0.0, 1.0
-                    
-                    for i in range(self.MAXIMUM_ITERATIONS):
-                        a = (p0x + c0x) / 2.0
-                        b = (c0x + c1x) / 2.0
-                        c = (c1x + p1x) / 2.0
-                        d = (a + b) / 2.0
-                        e = (b + c) / 2.0
-                        f = (d + e) / 2.0
-                        
-                        if abs(f - atX) < self.APPROXIMATION_EPSILON:
-                            return self.clamp((u + v) * 0.5)
-                        
-                        if f < atX:
-                            p0x = f
-                            c0x = e
-                            c1x = c
-                            u = (u + v) / 2.0
-                        else:
-                            c0x = a
-                            c1x = d
-                            p1x = f
-                            v = (u + v) / 2.0
-                    
-                    return self.clamp((u + v) / 2.0)
+        class ConstantPrepolate(ConstantSegment):
+            def __init__(self, to_frame, base_value):
+                super().__init__(float('-inf'), to_frame, base_value)
+                self._mode = 'ConstantPrepolate'
 
-            class ConstantPrepolate(ConstantSegment):
-                def __init__(self, to_frame, base_value):
-                    super().__init__(float('-inf'), to_frame, base_value)
-                    self._mode = 'ConstantPrepolate'
+            def value_at(self, frame):
+                return self.v1
 
-                def value_at(self, frame):
-                    return self.v1
+        class ConstantExtrapolate(ConstantSegment):
+            def __init__(self, from_frame, base_value):
+                super().__init__(from_frame, float('inf'), base_value)
+                self._mode = 'ConstantExtrapolate'
 
-            class ConstantExtrapolate(ConstantSegment):
-                def __init__(self, from_frame, base_value):
-                    super().__init__(from_frame, float('inf'), base_value)
-                    self._mode = 'ConstantExtrapolate'
+            def value_at(self, frame):
+                return self.v1
+            
+        class LinearPrepolate(ConstantPrepolate):
+            def __init__(self, to_frame, base_value, tangent):
+                self.tangent = float(tangent)
+                super().__init__(to_frame, base_value)
+                self._mode = 'LinearPrepolate'
+
+            def value_at(self, frame):
+                frame_diff = (self.end_frame - frame)
+                return self.v1 + (self.tangent * frame_diff)
+            
+        class LinearExtrapolate(ConstantExtrapolate):
+            def __init__(self, from_frame, base_value, tangent):
+                self.tangent = float(tangent)
+                super().__init__(from_frame, base_value)
+                self._mode = 'LinearExtrapolate'
+
+            def value_at(self, frame):
+                frame_diff = (frame - self.start_frame)
+                return self.v1 + (self.tangent * frame_diff)
+
+        class ConstantFunction(ConstantSegment):
+            def __init__(self, value):
+                super().__init__(float('-inf'), float('inf'), value)
+                self._mode = 'ConstantFunction'
+
+            def defines(self, frame):
+                return True
+
+            def value_at(self, frame):
+                return self.v1
+
+        def __init__(self, channel):
+            self.segments = []
+            self.extrap = channel.get('Extrap', 'constant')
+
+            if channel.get('Size', 0) == 0:
+                self.segments = [FlameChannellInterpolator.ConstantFunction(channel.get('Value', 0))]
+            elif channel.get('Size') == 1 and self.extrap == 'constant':
+                self.segments = [FlameChannellInterpolator.ConstantFunction(channel.get('Value', 0))]
+            elif channel.get('Size') == 1 and self.extrap == 'linear':
+                kframes = channel.get('KFrames')
+                frame = list(kframes.keys())[0]
+                base_value = kframes[frame].get('Value')
+                left_tangent = kframes[frame].get('LHandle_dY') / kframes[frame].get('LHandle_dX') * -1
+                right_tangent = kframes[frame].get('RHandle_dY') / kframes[frame].get('RHandle_dX')
+                self.segments = [
+                    FlameChannellInterpolator.LinearPrepolate(frame, base_value, left_tangent),
+                    FlameChannellInterpolator.LinearExtrapolate(frame, base_value, right_tangent)
+                ]
+            else:
+                self.segments = self.create_segments_from_channel(channel)
 
-                def value_at(self, frame):
-                    return self.v1
-                
-            class LinearPrepolate(ConstantPrepolate):
-                def __init__(self, to_frame, base_value, tangent):
-                    self.tangent = float(tangent)
-                    super().__init__(to_frame, base_value)
-                    self._mode = 'LinearPrepolate'
-
-                def value_at(self, frame):
-                    frame_diff = (self.end_frame - frame)
-                    return self.v1 + (self.tangent * frame_diff)
-                
-            class LinearExtrapolate(ConstantExtrapolate):
-                def __init__(self, from_frame, base_value, tangent):
-                    self.tangent = float(tangent)
-                    super().__init__(from_frame, base_value)
-                    self._mode = 'LinearExtrapolate'
-
-                def value_at(self, frame):
-                    frame_diff = (frame - self.start_frame)
-                    return self.v1 + (self.tangent * frame_diff)
-
-            class ConstantFunction(ConstantSegment):
-                def __init__(self, value):
-                    super().__init__(float('-inf'), float('inf'), value)
-                    self._mode = 'ConstantFunction'
-
-                def defines(self, frame):
-                    return True
-
-                def value_at(self, frame):
-                    return self.v1
-
-            def __init__(self, channel):
-                self.segments = []
-                self.extrap = channel.get('Extrap', 'constant')
-
-                if channel.get('Size', 0) == 0:
-                    self.segments = [FlameChannellInterpolator.ConstantFunction(channel.get('Value', 0))]
-                elif channel.get('Size') == 1 and self.extrap == 'constant':
-                    self.segments = [FlameChannellInterpolator.ConstantFunction(channel.get('Value', 0))]
-                elif channel.get('Size') == 1 and self.extrap == 'linear':
-                    kframes = channel.get('KFrames')
-                    frame = list(kframes.keys())[0]
-                    base_value = kframes[frame].get('Value')
-                    left_tangent = kframes[frame].get('LHandle_dY') / kframes[frame].get('LHandle_dX') * -1
-                    right_tangent = kframes[frame].get('RHandle_dY') / kframes[frame].get('RHandle_dX')
-                    self.segments = [
-                        FlameChannellInterpolator.LinearPrepolate(frame, base_value, left_tangent),
-                        FlameChannellInterpolator.LinearExtrapolate(frame, base_value, right_tangent)
-                    ]
+        def sample_at(self, frame):
+            if self.extrap == 'cycle':
+                return self.sample_from_segments(self.frame_number_in_cycle(frame))
+            elif self.extrap == 'revcycle':
+                return self.sample_from_segments(self.frame_number_in_revcycle(frame))
+            else:
+                return self.sample_from_segments(frame)
+
+        def first_defined_frame(self):
+            first_f = self.segments[0].end_frame
+            if first_f == float('-inf'):
+                return 1
+            return first_f
+
+        def last_defined_frame(self):
+            last_f = self.segments[-1].start_frame
+            if last_f == float('inf'):
+                return 100
+            return last_f
+
+        def frame_number_in_revcycle(self, frame):
+            animated_across = self.last_defined_frame() - self.first_defined_frame()
+            offset = abs(frame - self.first_defined_frame())
+            absolute_unit = offset % animated_across
+            cycles = offset // animated_across
+            if cycles % 2 == 0:
+                return self.first_defined_frame() + absolute_unit
+            else:
+                return self.last_defined_frame() - absolute_unit
+
+        def frame_number_in_cycle(self, frame):
+            animated_across = self.last_defined_frame() - self.first_defined_frame()
+            offset = frame - self.first_defined_frame()
+            modulo = offset % animated_across
+            return self.first_defined_frame() + modulo
+
+        def create_segments_from_channel(self, channel):
+            kframes = channel.get('KFrames')
+            index_frames = list(kframes.keys())
+            # First the prepolating segment
+            segments = [self.pick_prepolation(channel.get('Extrap', 'constant'), kframes[index_frames[0]], kframes[index_frames[1]])]
+
+            # Then all the intermediate segments, one segment between each pair of keys
+            for index, key in enumerate(index_frames[:-1]):
+                segments.append(self.key_pair_to_segment(kframes[key], kframes[index_frames[index + 1]]))
+
+            # and the extrapolator
+            segments.append(self.pick_extrapolation(channel.get('Extrap', 'constant'), kframes[index_frames[-2]], kframes[index_frames[-1]]))
+            return segments
+
+        def sample_from_segments(self, at_frame):
+            for segment in self.segments:
+                if segment.defines(at_frame):
+                    return segment.value_at(at_frame)
+            raise ValueError(f'No segment on this curve that can interpolate the value at {at_frame}')
+        
+        def segment_mode(self, at_frame):
+            for segment in self.segments:
+                if segment.defines(at_frame):
+                    return segment.mode()
+            raise ValueError(f'No segment on this curve that can interpolate the value at {at_frame}')
+        
+        def get_segment(self, at_frame):
+            for segment in self.segments:
+                if segment.defines(at_frame):
+                    return segment
+            raise ValueError(f'No segment on this curve that can interpolate the value at {at_frame}')
+
+        def pick_prepolation(self, extrap_symbol, first_key, second_key):
+            if extrap_symbol == 'linear' and second_key:
+                if first_key.get('CurveMode') != 'linear':
+                    first_key_left_slope = first_key.get('LHandle_dY') / first_key.get('LHandle_dX') * -1
+                    return FlameChannellInterpolator.LinearPrepolate(
+                        first_key.get('Frame'), 
+                        first_key.get('Value'), 
+                        first_key_left_slope)
                 else:
-                    self.segments = self.create_segments_from_channel(channel)
-
-            def sample_at(self, frame):
-                if self.extrap == 'cycle':
-                    return self.sample_from_segments(self.frame_number_in_cycle(frame))
-                elif self.extrap == 'revcycle':
-                    return self.sample_from_segments(self.frame_number_in_revcycle(frame))
+                    # For linear keys the tangent actually does not do anything, so we need to look a frame
+                    # ahead and compute the increment
+                    increment = (second_key.get('Value') - first_key.get('Value')) / (second_key.get('Frame') - first_key.get('Frame'))
+                    return FlameChannellInterpolator.LinearPrepolate(first_key.get('Frame'), first_key.get('Value'), increment)
+            else:
+                return FlameChannellInterpolator.ConstantPrepolate(first_key.get('Frame'), first_key.get('Value'))
+        
+        def pick_extrapolation(self, extrap_symbol, previous_key, last_key):
+            if extrap_symbol != 'constant':
+                if previous_key and (last_key.get('CurveMode')  == 'linear' or last_key.get('CurveOrder')  == 'linear'):
+                    # For linear keys the tangent actually does not do anything, so we need to look a frame
+                    # ahead and compute the increment
+                    increment = (last_key.get('Value') - previous_key.get('Value')) / (last_key.get('Frame') - previous_key.get('Frame'))
+                    return FlameChannellInterpolator.LinearExtrapolate(last_key.get('Frame'), last_key.get('Value'), increment)
                 else:
-                    return self.sample_from_segments(frame)
-
-            def first_defined_frame(self):
-                first_f = self.segments[0].end_frame
-                if first_f == float('-inf'):
-                    return 1
-                return first_f
-
-            def last_defined_frame(self):
-                last_f = self.segments[-1].start_frame
-                if last_f == float('inf'):
-                    return 100
-                return last_f
-
-            def frame_number_in_revcycle(self, frame):
-                animated_across = self.last_defined_frame() - self.first_defined_frame()
-                offset = abs(frame - self.first_defined_frame())
-                absolute_unit = offset % animated_across
-                cycles = offset // animated_across
-                if cycles % 2 == 0:
-                    return self.first_defined_frame() + absolute_unit
+                    last_key_right_slope = last_key.get('LHandle_dY') / last_key.get('LHandle_dX')
+                    return FlameChannellInterpolator.LinearExtrapolate(last_key.get('Frame'), last_key.get('Value'), last_key_right_slope)
+            else:
+                return FlameChannellInterpolator.ConstantExtrapolate(last_key.get('Frame'), last_key.get('Value'))
+
+        def key_pair_to_segment(self, key, next_key):
+            key_left_tangent = key.get('LHandle_dY') / key.get('LHandle_dX') * -1
+            key_right_tangent = key.get('RHandle_dY') / key.get('RHandle_dX')
+            next_key_left_tangent = next_key.get('LHandle_dY') / next_key.get('LHandle_dX') # * -1
+            next_key_right_tangent = next_key.get('RHandle_dY') / next_key.get('RHandle_dX')
+
+            if key.get('CurveMode') == 'bezier':
+                return FlameChannellInterpolator.BezierSegment(
+                    key.get('Frame'), 
+                    next_key.get('Frame'),
+                    key.get('Value'), 
+                    next_key.get('Value'),
+                    float(key.get('Frame')) + float(key.get('RHandle_dX')), 
+                    float(key.get('Value')) + float(key.get('RHandle_dY')),
+                    float(next_key.get('Frame')) + float(next_key.get('LHandle_dX')),
+                    float(next_key.get('Value')) + float(next_key.get('LHandle_dY'))
+                    )
+            
+            elif (key.get('CurveMode') in ['natural', 'hermite']) and (key.get('CurveOrder') == 'cubic'):
+                return FlameChannellInterpolator.HermiteSegment(
+                    key.get('Frame'), 
+                    next_key.get('Frame'), 
+                    key.get('Value'), 
+                    next_key.get('Value'),
+                    key_right_tangent, 
+                    next_key_left_tangent
+                    )
+            elif (key.get('CurveMode') in ['natural', 'hermite']) and (key.get('CurveOrder') == 'quartic'):
+                return FlameChannellInterpolator.HermiteSegment(
+                    key.get('Frame'), 
+                    next_key.get('Frame'), 
+                    key.get('Value'), 
+                    next_key.get('Value'),
+                    key_right_tangent, 
+                    next_key_left_tangent
+                    )
+            elif key.get('CurveMode') == 'constant':
+                return FlameChannellInterpolator.ConstantSegment(
+                    key.get('Frame'), 
+                    next_key.get('Frame'), 
+                    key.get('Value')
+                    )
+            else:  # Linear and safe
+                return FlameChannellInterpolator.LinearSegment(
+                    key.get('Frame'), 
+                    next_key.get('Frame'), 
+                    key.get('Value'), 
+                    next_key.get('Value')
+                    )
+
+    def approximate_speed_curve(tw_setup_string, start, end, tw_channel):
+        from xml.dom import minidom
+        xml = minidom.parseString(tw_setup_string)  
+        tw_speed_timing = {}
+        TW_SpeedTiming = xml.getElementsByTagName('TW_SpeedTiming')
+        keys = TW_SpeedTiming[0].getElementsByTagName('Key')
+        for key in keys:
+            index = key.getAttribute('Index') 
+            frame = key.getElementsByTagName('Frame')
+            if frame:
+                frame = (frame[0].firstChild.nodeValue)
+            value = key.getElementsByTagName('Value')
+            if value:
+                value = (value[0].firstChild.nodeValue)
+            tw_speed_timing[int(index)] = {'frame': int(frame), 'value': float(value)}
+
+        if tw_speed_timing[0]['frame'] > start:
+            # we need to extrapolate backwards from the first 
+            # keyframe in SpeedTiming channel
+
+            anchor_frame_value = tw_speed_timing[0]['value']
+            for frame_number in range(tw_speed_timing[0]['frame'] - 1, start - 1, -1):
+                if frame_number + 1 not in tw_channel.keys() or frame_number not in tw_channel.keys():
+                    step_back = tw_channel[min(list(tw_channel.keys()))] / 100
                 else:
-                    return self.last_defined_frame() - absolute_unit
+                    step_back = (tw_channel[frame_number + 1] + tw_channel[frame_number]) / 200
+                frame_value_map[frame_number] = anchor_frame_value - step_back
+                anchor_frame_value = frame_value_map[frame_number]
+
+        # build up frame values between keyframes of SpeedTiming channel
+        for key_frame_index in range(0, len(tw_speed_timing.keys()) - 1):
+            # The value from my gess algo is close to the one in flame but not exact
+            # and error is accumulated. SO quick and dirty way is to do forward
+            # and backward pass and mix them rationally
+
+            range_start = tw_speed_timing[key_frame_index]['frame']
+            range_end = tw_speed_timing[key_frame_index + 1]['frame']
+            
+            if range_end == range_start + 1:
+            # keyframes on next frames, no need to interpolate
+                frame_value_map[range_start] = tw_speed_timing[key_frame_index]['value']
+                frame_value_map[range_end] = tw_speed_timing[key_frame_index + 1]['value']
+                continue
 
-            def frame_number_in_cycle(self, frame):
-                animated_across = self.last_defined_frame() - self.first_defined_frame()
-                offset = frame - self.first_defined_frame()
-                modulo = offset % animated_across
-                return self.first_defined_frame() + modulo
+            forward_pass = {}
+            anchor_frame_value = tw_speed_timing[key_frame_index]['value']
+            forward_pass[range_start] = anchor_frame_value
 
-            def create_segments_from_channel(self, channel):
-                kframes = channel.get('KFrames')
-                index_frames = list(kframes.keys())
-                # First the prepolating segment
-                segments = [self.pick_prepolation(channel.get('Extrap', 'constant'), kframes[index_frames[0]], kframes[index_frames[1]])]
-
-                # Then all the intermediate segments, one segment between each pair of keys
-                for index, key in enumerate(index_frames[:-1]):
-                    segments.append(self.key_pair_to_segment(kframes[key], kframes[index_frames[index + 1]]))
-
-                # and the extrapolator
-                segments.append(self.pick_extrapolation(channel.get('Extrap', 'constant'), kframes[index_frames[-2]], kframes[index_frames[-1]]))
-                return segments
-
-            def sample_from_segments(self, at_frame):
-                for segment in self.segments:
-                    if segment.defines(at_frame):
-                        return segment.value_at(at_frame)
-                raise ValueError(f'No segment on this curve that can interpolate the value at {at_frame}')
+            for frame_number in range(range_start + 1, range_end):
+                if frame_number + 1 not in tw_channel.keys() or frame_number not in tw_channel.keys():
+                    step = tw_channel[max(list(tw_channel.keys()))] / 100
+                else:
+                    step = (tw_channel[frame_number] + tw_channel[frame_number + 1]) / 200
+                forward_pass[frame_number] = anchor_frame_value + step
+                anchor_frame_value = forward_pass[frame_number]
+            forward_pass[range_end] = tw_speed_timing[key_frame_index + 1]['value']
             
-            def segment_mode(self, at_frame):
-                for segment in self.segments:
-                    if segment.defines(at_frame):
-                        return segment.mode()
-                raise ValueError(f'No segment on this curve that can interpolate the value at {at_frame}')
+            backward_pass = {}
+            anchor_frame_value = tw_speed_timing[key_frame_index + 1]['value']
+            backward_pass[range_end] = anchor_frame_value
             
-            def get_segment(self, at_frame):
-                for segment in self.segments:
-                    if segment.defines(at_frame):
-                        return segment
-                raise ValueError(f'No segment on this curve that can interpolate the value at {at_frame}')
-
-            def pick_prepolation(self, extrap_symbol, first_key, second_key):
-                if extrap_symbol == 'linear' and second_key:
-                    if first_key.get('CurveMode') != 'linear':
-                        first_key_left_slope = first_key.get('LHandle_dY') / first_key.get('LHandle_dX') * -1
-                        return FlameChannellInterpolator.LinearPrepolate(
-                            first_key.get('Frame'), 
-                            first_key.get('Value'), 
-                            first_key_left_slope)
-                    else:
-                        # For linear keys the tangent actually does not do anything, so we need to look a frame
-                        # ahead and compute the increment
-                        increment = (second_key.get('Value') - first_key.get('Value')) / (second_key.get('Frame') - first_key.get('Frame'))
-                        return FlameChannellInterpolator.LinearPrepolate(first_key.get('Frame'), first_key.get('Value'), increment)
+            for frame_number in range(range_end - 1, range_start -1, -1):
+                if frame_number + 1 not in tw_channel.keys() or frame_number not in tw_channel.keys():
+                    step_back = tw_channel[min(list(tw_channel.keys()))] / 100
                 else:
-                    return FlameChannellInterpolator.ConstantPrepolate(first_key.get('Frame'), first_key.get('Value'))
+                    step_back = (tw_channel[frame_number + 1] + tw_channel[frame_number]) / 200
+                backward_pass[frame_number] = anchor_frame_value - step_back
+                anchor_frame_value = backward_pass[frame_number]
             
-            def pick_extrapolation(self, extrap_symbol, previous_key, last_key):
-                if extrap_symbol != 'constant':
-                    if previous_key and (last_key.get('CurveMode')  == 'linear' or last_key.get('CurveOrder')  == 'linear'):
-                        # For linear keys the tangent actually does not do anything, so we need to look a frame
-                        # ahead and compute the increment
-                        increment = (last_key.get('Value') - previous_key.get('Value')) / (last_key.get('Frame') - previous_key.get('Frame'))
-                        return FlameChannellInterpolator.LinearExtrapolate(last_key.get('Frame'), last_key.get('Value'), increment)
-                    else:
-                        last_key_right_slope = last_key.get('LHandle_dY') / last_key.get('LHandle_dX')
-                        return FlameChannellInterpolator.LinearExtrapolate(last_key.get('Frame'), last_key.get('Value'), last_key_right_slope)
+            backward_pass[range_start] = tw_speed_timing[key_frame_index]['value']
+
+            def hermite_curve(t):
+                P0, P1 = 0, 1
+                T0, T1 = 0, 0
+                h00 = 2*t**3 - 3*t**2 + 1  # Compute basis function 1
+                h10 = t**3 - 2*t**2 + t    # Compute basis function 2
+                h01 = -2*t**3 + 3*t**2     # Compute basis function 3
+                h11 = t**3 - t**2          # Compute basis function 4
+
+                return h00 * P0 + h10 * T0 + h01 * P1 + h11 * T1
+
+
+            work_range = list(forward_pass.keys())
+            ratio = 0
+            rstep = 1 / len(work_range)
+            for frame_number in sorted(work_range):
+                frame_value_map[frame_number] = forward_pass[frame_number] * (1 - hermite_curve(ratio)) + backward_pass[frame_number] * hermite_curve(ratio)
+                ratio += rstep
+
+        last_key_index = list(sorted(tw_speed_timing.keys()))[-1]
+        if tw_speed_timing[last_key_index]['frame'] < end:
+            # we need to extrapolate further on from the 
+            # last keyframe in SpeedTiming channel
+            anchor_frame_value = tw_speed_timing[last_key_index]['value']
+            frame_value_map[tw_speed_timing[last_key_index]['frame']] = anchor_frame_value
+
+            for frame_number in range(tw_speed_timing[last_key_index]['frame'] + 1, end + 1):
+                if frame_number + 1 not in tw_channel.keys() or frame_number not in tw_channel.keys():
+                    step = tw_channel[max(list(tw_channel.keys()))] / 100
                 else:
-                    return FlameChannellInterpolator.ConstantExtrapolate(last_key.get('Frame'), last_key.get('Value'))
-
-            def key_pair_to_segment(self, key, next_key):
-                key_left_tangent = key.get('LHandle_dY') / key.get('LHandle_dX') * -1
-                key_right_tangent = key.get('RHandle_dY') / key.get('RHandle_dX')
-                next_key_left_tangent = next_key.get('LHandle_dY') / next_key.get('LHandle_dX') # * -1
-                next_key_right_tangent = next_key.get('RHandle_dY') / next_key.get('RHandle_dX')
-
-                if key.get('CurveMode') == 'bezier':
-                    return FlameChannellInterpolator.BezierSegment(
-                        key.get('Frame'), 
-                        next_key.get('Frame'),
-                        key.get('Value'), 
-                        next_key.get('Value'),
-                        float(key.get('Frame')) + float(key.get('RHandle_dX')), 
-                        float(key.get('Value')) + float(key.get('RHandle_dY')),
-                        float(next_key.get('Frame')) + float(next_key.get('LHandle_dX')),
-                        float(next_key.get('Value')) + float(next_key.get('LHandle_dY'))
-                        )
-                
-                elif (key.get('CurveMode') in ['natural', 'hermite']) and (key.get('CurveOrder') == 'cubic'):
-                    return FlameChannellInterpolator.HermiteSegment(
-                        key.get('Frame'), 
-                        next_key.get('Frame'), 
-                        key.get('Value'), 
-                        next_key.get('Value'),
-                        key_right_tangent, 
-                        next_key_left_tangent
-                        )
-                elif (key.get('CurveMode') in ['natural', 'hermite']) and (key.get('CurveOrder') == 'quartic'):
-                    return FlameChannellInterpolator.HermiteSegment(
-                        key.get('Frame'), 
-                        next_key.get('Frame'), 
-                        key.get('Value'), 
-                        next_key.get('Value'),
-                        key_right_tangent, 
-                        next_key_left_tangent
-                        )
-                elif key.get('CurveMode') == 'constant':
-                    return FlameChannellInterpolator.ConstantSegment(
-                        key.get('Frame'), 
-                        next_key.get('Frame'), 
-                        key.get('Value')
-                        )
-                else:  # Linear and safe
-                    return FlameChannellInterpolator.LinearSegment(
-                        key.get('Frame'), 
-                        next_key.get('Frame'), 
-                        key.get('Value'), 
-                        next_key.get('Value')
-                        )
-
-        def approximate_speed_curve(tw_setup_string, start, end, tw_channel):
-            from xml.dom import minidom
-            xml = minidom.parseString(tw_setup_string)  
-            tw_speed_timing = {}
-            TW_SpeedTiming = xml.getElementsByTagName('TW_SpeedTiming')
-            keys = TW_SpeedTiming[0].getElementsByTagName('Key')
-            for key in keys:
-                index = key.getAttribute('Index') 
-                frame = key.getElementsByTagName('Frame')
-                if frame:
-                    frame = (frame[0].firstChild.nodeValue)
-                value = key.getElementsByTagName('Value')
-                if value:
-                    value = (value[0].firstChild.nodeValue)
-                tw_speed_timing[int(index)] = {'frame': int(frame), 'value': float(value)}
-
-            if tw_speed_timing[0]['frame'] > start:
-                # we need to extrapolate backwards from the first 
-                # keyframe in SpeedTiming channel
-
-                anchor_frame_value = tw_speed_timing[0]['value']
-                for frame_number in range(tw_speed_timing[0]['frame'] - 1, start - 1, -1):
-                    if frame_number + 1 not in tw_channel.keys() or frame_number not in tw_channel.keys():
-                        step_back = tw_channel[min(list(tw_channel.keys()))] / 100
-                    else:
-                        step_back = (tw_channel[frame_number + 1] + tw_channel[frame_number]) / 200
-                    frame_value_map[frame_number] = anchor_frame_value - step_back
-                    anchor_frame_value = frame_value_map[frame_number]
-
-            # build up frame values between keyframes of SpeedTiming channel
-            for key_frame_index in range(0, len(tw_speed_timing.keys()) - 1):
-                # The value from my gess algo is close to the one in flame but not exact
-                # and error is accumulated. SO quick and dirty way is to do forward
-                # and backward pass and mix them rationally
-
-                range_start = tw_speed_timing[key_frame_index]['frame']
-                range_end = tw_speed_timing[key_frame_index + 1]['frame']
-                
-                if range_end == range_start + 1:
-                # keyframes on next frames, no need to interpolate
-                    frame_value_map[range_start] = tw_speed_timing[key_frame_index]['value']
-                    frame_value_map[range_end] = tw_speed_timing[key_frame_index + 1]['value']
-                    continue
+                    step = (tw_channel[frame_number] + tw_channel[frame_number + 1]) / 200
+                frame_value_map[frame_number] = anchor_frame_value + step
+                anchor_frame_value = frame_value_map[frame_number]
 
-                forward_pass = {}
-                anchor_frame_value = tw_speed_timing[key_frame_index]['value']
-                forward_pass[range_start] = anchor_frame_value
-
-                for frame_number in range(range_start + 1, range_end):
-                    if frame_number + 1 not in tw_channel.keys() or frame_number not in tw_channel.keys():
-                        step = tw_channel[max(list(tw_channel.keys()))] / 100
-                    else:
-                        step = (tw_channel[frame_number] + tw_channel[frame_number + 1]) / 200
-                    forward_pass[frame_number] = anchor_frame_value + step
-                    anchor_frame_value = forward_pass[frame_number]
-                forward_pass[range_end] = tw_speed_timing[key_frame_index + 1]['value']
-                
-                backward_pass = {}
-                anchor_frame_value = tw_speed_timing[key_frame_index + 1]['value']
-                backward_pass[range_end] = anchor_frame_value
-                
-                for frame_number in range(range_end - 1, range_start -1, -1):
-                    if frame_number + 1 not in tw_channel.keys() or frame_number not in tw_channel.keys():
-                        step_back = tw_channel[min(list(tw_channel.keys()))] / 100
-                    else:
-                        step_back = (tw_channel[frame_number + 1] + tw_channel[frame_number]) / 200
-                    backward_pass[frame_number] = anchor_frame_value - step_back
-                    anchor_frame_value = backward_pass[frame_number]
-                
-                backward_pass[range_start] = tw_speed_timing[key_frame_index]['value']
-
-                def hermite_curve(t):
-                    P0, P1 = 0, 1
-                    T0, T1 = 0, 0
-                    h00 = 2*t**3 - 3*t**2 + 1  # Compute basis function 1
-                    h10 = t**3 - 2*t**2 + t    # Compute basis function 2
-                    h01 = -2*t**3 + 3*t**2     # Compute basis function 3
-                    h11 = t**3 - t**2          # Compute basis function 4
-
-                    return h00 * P0 + h10 * T0 + h01 * P1 + h11 * T1
-
-
-                work_range = list(forward_pass.keys())
-                ratio = 0
-                rstep = 1 / len(work_range)
-                for frame_number in sorted(work_range):
-                    frame_value_map[frame_number] = forward_pass[frame_number] * (1 - hermite_curve(ratio)) + backward_pass[frame_number] * hermite_curve(ratio)
-                    ratio += rstep
-
-            last_key_index = list(sorted(tw_speed_timing.keys()))[-1]
-            if tw_speed_timing[last_key_index]['frame'] < end:
-                # we need to extrapolate further on from the 
-                # last keyframe in SpeedTiming channel
-                anchor_frame_value = tw_speed_timing[last_key_index]['value']
-                frame_value_map[tw_speed_timing[last_key_index]['frame']] = anchor_frame_value
-
-                for frame_number in range(tw_speed_timing[last_key_index]['frame'] + 1, end + 1):
-                    if frame_number + 1 not in tw_channel.keys() or frame_number not in tw_channel.keys():
-                        step = tw_channel[max(list(tw_channel.keys()))] / 100
-                    else:
-                        step = (tw_channel[frame_number] + tw_channel[frame_number + 1]) / 200
-                    frame_value_map[frame_number] = anchor_frame_value + step
-                    anchor_frame_value = frame_value_map[frame_number]
+        return frame_value_map
 
-            return frame_value_map
+    import numpy as np
+    import xml.etree.ElementTree as ET
 
-        import numpy as np
-        import xml.etree.ElementTree as ET
+    tw_setup_xml = ET.fromstring(tw_setup_string)
+    tw_setup = dictify(tw_setup_xml)
 
-        tw_setup_xml = ET.fromstring(tw_setup_string)
-        tw_setup = dictify(tw_setup_xml)
+    start_frame = int(tw_setup['Setup']['Base'][0]['Range'][0]['Start'])
+    end_frame = int(tw_setup['Setup']['Base'][0]['Range'][0]['End'])
+    # TW_Timing_size = int(tw_setup['Setup']['State'][0]['TW_Timing'][0]['Channel'][0]['Size'][0]['_text'])
 
-        start_frame = int(tw_setup['Setup']['Base'][0]['Range'][0]['Start'])
-        end_frame = int(tw_setup['Setup']['Base'][0]['Range'][0]['End'])
-        # TW_Timing_size = int(tw_setup['Setup']['State'][0]['TW_Timing'][0]['Channel'][0]['Size'][0]['_text'])
+    # TW_SpeedTiming_size = tw_setup['Setup']['State'][0]['TW_SpeedTiming'][0]['Channel'][0]['Size']
+    TW_RetimerMode = tw_setup['Setup']['State'][0]['TW_RetimerMode']
 
-        # TW_SpeedTiming_size = tw_setup['Setup']['State'][0]['TW_SpeedTiming'][0]['Channel'][0]['Size']
-        TW_RetimerMode = tw_setup['Setup']['State'][0]['TW_RetimerMode']
+    frame_value_map = {}
 
-        frame_value_map = {}
+    if TW_RetimerMode == 1:
+        # 'Timing' channel is enough
+        tw_channel = 'TW_Timing'
+        channel = tw_setup['Setup']['State'][0][tw_channel][0]['Channel'][0]
+        if 'KFrames' in channel.keys():
+            channel['KFrames'] = {x['Frame']: x for x in sorted(channel['KFrames'][0]['Key'], key=lambda d: d['Value'])}
+        interpolator = FlameChannellInterpolator(channel)
+        for frame_number in range (start_frame, end_frame+1):
+            frame_value_map[frame_number] = round(interpolator.sample_at(frame_number), 4)
+        return frame_value_map
 
-        if TW_RetimerMode == 1:
-            # 'Timing' channel is enough
-            tw_channel = 'TW_Timing'
-            channel = tw_setup['Setup']['State'][0][tw_channel][0]['Channel'][0]
-            if 'KFrames' in channel.keys():
-                channel['KFrames'] = {x['Frame']: x for x in sorted(channel['KFrames'][0]['Key'], key=lambda d: d['Value'])}
-            interpolator = FlameChannellInterpolator(channel)
+    else:
+        # speed - based timewarp seem to
+        # work in a different way
+        # depending on a segment mode
+
+        tw_channel = 'TW_Speed'
+        channel = tw_setup['Setup']['State'][0][tw_channel][0]['Channel'][0]
+        if 'KFrames' in channel.keys():
+            channel['KFrames'] = {x['Frame']: x for x in sorted(channel['KFrames'][0]['Key'], key=lambda d: d['Value'])}
+        speed_channel = dict(channel)
+        tw_channel = 'TW_SpeedTiming'
+        channel = tw_setup['Setup']['State'][0][tw_channel][0]['Channel'][0]
+        if 'KFrames' in channel.keys():
+            channel['KFrames'] = {x['Frame']: x for x in sorted(channel['KFrames'][0]['Key'], key=lambda d: d['Value'])}
+        speed_timing_channel = dict(channel)
+
+        if 'quartic' in tw_setup_string:
+            speed_interpolator = FlameChannellInterpolator(speed_channel)
+            interpolated_speed_channel = {}
             for frame_number in range (start_frame, end_frame+1):
-                frame_value_map[frame_number] = round(interpolator.sample_at(frame_number), 4)
-            return frame_value_map
+                interpolated_speed_channel[frame_number] = round(speed_interpolator.sample_at(frame_number), 4)
+            return approximate_speed_curve(tw_setup_string, record_in, record_out, interpolated_speed_channel)
 
-        else:
-            # speed - based timewarp seem to
-            # work in a different way
-            # depending on a segment mode
-
-            tw_channel = 'TW_Speed'
-            channel = tw_setup['Setup']['State'][0][tw_channel][0]['Channel'][0]
-            if 'KFrames' in channel.keys():
-                channel['KFrames'] = {x['Frame']: x for x in sorted(channel['KFrames'][0]['Key'], key=lambda d: d['Value'])}
-            speed_channel = dict(channel)
-            tw_channel = 'TW_SpeedTiming'
-            channel = tw_setup['Setup']['State'][0][tw_channel][0]['Channel'][0]
-            if 'KFrames' in channel.keys():
-                channel['KFrames'] = {x['Frame']: x for x in sorted(channel['KFrames'][0]['Key'], key=lambda d: d['Value'])}
-            speed_timing_channel = dict(channel)
-
-            if 'quartic' in tw_setup_string:
-                speed_interpolator = FlameChannellInterpolator(speed_channel)
-                interpolated_speed_channel = {}
-                for frame_number in range (start_frame, end_frame+1):
-                    interpolated_speed_channel[frame_number] = round(speed_interpolator.sample_at(frame_number), 4)
-                return approximate_speed_curve(tw_setup_string, self.record_in, self.record_out, interpolated_speed_channel)
-
-            timing_interpolator = FlameChannellInterpolator(speed_timing_channel)
+        timing_interpolator = FlameChannellInterpolator(speed_timing_channel)
 
-            for frame_number in range (start_frame, end_frame+1):
-                frame_value_map[frame_number] = round(timing_interpolator.sample_at(frame_number), 4)
-                    
-        return frame_value_map
+        for frame_number in range (start_frame, end_frame+1):
+            frame_value_map[frame_number] = round(timing_interpolator.sample_at(frame_number), 4)
+                
+    return frame_value_map
+
+def get_source_frame_range(frame_value_map, record_in, record_out, source_duration):
+    """
+    Returns first and last source frames referenced by baked timewarp curve
+    between record_in and record_out. Follows the same rules as the render plan:
+    frames are clamped to the source duration and each frame in between
+    two source frames needs both incoming and outgoing one.
+    """
+
+    frames = set()
+    for frame_number in range(record_in, record_out + 1):
+        incoming_frame_number = int(frame_value_map[frame_number])
+        if incoming_frame_number < 1:
+            frames.add(1)
+        elif incoming_frame_number >= source_duration:
+            frames.add(source_duration)
+        else:
+            frames.add(incoming_frame_number)
+            frames.add(incoming_frame_number + 1)
+    return min(frames), max(frames)
+
+def timewarp_pool_worker(device, frame_info_list, progress, json_info):
+    # Renders a shard of timewarp plan on a single device.
+    # Runs in a separate process started by device_pool.run_device_pool
+    json_info = dict(json_info)
+    json_info['device'] = device
+    tw = Timewarp(json_info)
+    if not tw.model:
+        raise Exception(f'Unable to import model from file {tw.model_path}')
+    if not tw.render_frames(frame_info_list, progress = progress):
+        raise Exception('Rendering failed')
+
+    result = {
+        'stage_times': tw.stage_times,
+        'decision_log': tw.decision_log,
+        'warm_start': tw.warm_start,
+        'warm_start_stats': tw.warm_start_stats,
+        'adaptive_exit': tw.adaptive_exit,
+        'adaptive_exit_stats': tw.adaptive_exit_stats,
+        'sparse_tiles': tw.sparse_tiles,
+        'sparse_stats': tw.sparse_stats,
+        'flow_reuse': tw.flow_reuse,
+        'flow_reuse_stats': tw.flow_reuse_stats,
+    }
+    if tw.block_profiler:
+        tw.block_profiler.stop()
+        result['block_profile'] = tw.block_profiler.report()
+    return result
 
 def main():
     # Custom stream object to capture output
@@ -1432,8 +2584,19 @@ def main():
                 print ("MPS device not found.")
             '''
 
-            tw = Timewarp(json_info)
-            result = tw.process()
+            try:
+                tw = Timewarp(json_info)
+                result = tw.process()
+            except Exception as e:
+                print (f'{e}')
+                status = JobStatus(
+                    json_info.get('job_id', json_info.get('clip_name')),
+                    status_file = json_info.get('status_file'),
+                    status_socket = json_info.get('status_socket')
+                )
+                status.error(f'{e}')
+                status.finish(False)
+                result = False
             if os.path.isfile(self.lockfile):
                 os.remove(self.lockfile)
             self.result.emit(result, '')
@@ -176,7 +176,14 @@ def get_dataset(
         acescc_rate = 40,
         generalize = 80,
         repeat = 1,
-        sequential = False
+        sequential = False,
+        cache_folder = None,
+        workers = 1,
+        seed = None,
+        mixed_batch = False,
+        locality = 1,
+        decode_cache = 0,
+        multi_target = False
         ):
     class TimewarpMLDataset(torch.utils.data.Dataset):
         def __init__(   
@@ -189,11 +196,23 @@ def get_dataset(
                 acescc_rate = 40,
                 generalize = 80,
                 repeat = 1,
-                sequential = False
+                sequential = False,
+                cache_folder = None,
+                workers = 1,
+                seed = None,
+                mixed_batch = False,
+                locality = 1,
+                decode_cache = 0,
+                multi_target = False
                 ):
             
             self.data_root = data_root
             self.batch_size = batch_size
+            self.mixed_batch = mixed_batch
+            self.locality = max(1, locality)
+            # per reader process, in megabytes
+            self.decode_cache = decode_cache
+            self.multi_target = multi_target
             self.max_window = max_window
             self.acescc_rate = acescc_rate
             self.generalize = generalize
@@ -221,32 +240,40 @@ def get_dataset(
             self.w = frame_size
             # self.frame_multiplier = (self.src_w // self.w) * (self.src_h // self.h) * 4
 
-            self.frame_read_process = None
-            self.frames_queue = torch.multiprocessing.Queue(maxsize=4)
-            self.frame_read_thread = threading.Thread(target=self.read_frames_thread)
-            self.frame_read_thread.daemon = True
-            self.frame_read_thread.start()
+            self.repeat_count = repeat
+            self.repeat_counter = 1
 
-            print ('reading first block of training data...')
-            self.last_train_data_size = 24
-            self.last_train_data = [self.frames_queue.get()] * self.last_train_data_size
-            self.train_data_index = 0
+            # crops and augmentation are drawn from this generator,
+            # so a run can be reproduced with --seed
+            self.seed = seed
+            self.generator = torch.Generator()
+            if seed is None:
+                self.generator.seed()
+            else:
+                self.generator.manual_seed(seed)
 
-            def new_sample_fetch(frames_queue, new_sample_queue):
-                while not exit_event.is_set():
-                    try:
-                        new_sample = frames_queue.get_nowait()
-                        new_sample_queue.put(new_sample)
-                    except queue.Empty:
-                        time.sleep(1e-8)
+            self.frame_cache = None
+            if cache_folder:
+                self.init_frame_cache(cache_folder)
 
-            self.new_sample_queue = queue.Queue(maxsize=1)
-            self.new_sample_thread = threading.Thread(target=new_sample_fetch, args=(self.frames_queue, self.new_sample_queue))
-            self.new_sample_thread.daemon = True
-            self.new_sample_thread.start()
+            if self.multi_target:
+                self.train_descriptions = self.group_windows(self.train_descriptions)
+                print (f'Multi-target: {len(self.train_descriptions)} windows')
+                if not self.sequential:
+                    self.reshuffle()
 
-            self.repeat_count = repeat
-            self.repeat_counter = 1
+            if self.frame_cache:
+                # frames are read straight from memory-mapped shards,
+                # there is nothing to decode in the background
+                self.cache_index = -1
+                self.last_train_data = [None]
+                self.train_data_index = 0
+            else:
+                self.start_readers(max(1, workers))
+                print (f'reading first block of training data with {self.num_workers} workers...')
+                self.last_train_data_size = 24
+                self.last_train_data = [self.get_new_sample()] * self.last_train_data_size
+                self.train_data_index = 0
 
             # self.last_shuffled_index = -1
             # self.last_source_image_data = None
@@ -258,9 +285,110 @@ def get_dataset(
                 self.device = device
 
             print (f'ACEScc rate: {self.acescc_rate}%')
+            if self.mixed_batch:
+                print (f'Mixed batches: {self.batch_size} independent samples per batch')
 
         def reshuffle(self):
-            random.shuffle(self.train_descriptions)
+            # shuffled list is built aside and assigned at once,
+            # readers' feeder thread copies it at any moment
+            if self.locality == 1:
+                descriptions = list(self.train_descriptions)
+                random.shuffle(descriptions)
+                self.train_descriptions = descriptions
+                return
+
+            # Nearby windows of the same clip share most of their frames.
+            # Descriptions are sorted by clip and position and split into runs
+            # of --locality samples, runs are shuffled and so are samples
+            # inside each run, so the epoch order stays random while the
+            # reader decoding a run keeps hitting its decoded frame cache.
+            ordered = sorted(
+                self.train_descriptions,
+                key=lambda d: (os.path.dirname(d['start']), min(d['start'], d['end']), d['gt'], max(d['start'], d['end']))
+            )
+            runs = [ordered[i:i + self.locality] for i in range(0, len(ordered), self.locality)]
+            random.shuffle(runs)
+            descriptions = []
+            for run in runs:
+                random.shuffle(run)
+                descriptions.extend(run)
+            self.train_descriptions = descriptions
+
+        def group_windows(self, descriptions):
+            # all targets between the same start and end frames become one
+            # sample with lists of gt frames and ratios, order is kept
+            windows = {}
+            for description in descriptions:
+                key = (description['start'], description['end'])
+                window = windows.get(key)
+                if window is None:
+                    window = {
+                        'h': description['h'],
+                        'w': description['w'],
+                        'start': description['start'],
+                        'gt': [],
+                        'end': description['end'],
+                        'ratio': []
+                    }
+                    windows[key] = window
+                window['gt'].append(description['gt'])
+                window['ratio'].append(description['ratio'])
+            return list(windows.values())
+
+        @staticmethod
+        def description_files(description):
+            # start, one or more gt frames and end
+            gt = description['gt']
+            return [description['start']] + (gt if isinstance(gt, list) else [gt]) + [description['end']]
+
+        def init_frame_cache(self, cache_folder):
+            from frame_cache import FrameCache
+
+            try:
+                frame_cache = FrameCache(cache_folder)
+            except Exception as e:
+                print (f'\nUnable to open frame cache in {cache_folder}: {e}')
+                return
+            if frame_cache.frame_size != self.h:
+                print (f'\nFrame cache in {cache_folder} is built for frame size {frame_cache.frame_size}, reading source files')
+                return
+
+            cached_descriptions = [
+                d for d in self.train_descriptions
+                if frame_cache.has(d['start']) and frame_cache.has(d['gt']) and frame_cache.has(d['end'])
+            ]
+            if len(cached_descriptions) < len(self.train_descriptions):
+                print (f'\n{len(self.train_descriptions) - len(cached_descriptions)} samples are not in frame cache and will be skipped, run preprocess to update it')
+            if not cached_descriptions:
+                return
+
+            self.train_descriptions = cached_descriptions
+            self.initial_train_descriptions = list(cached_descriptions)
+            self.frame_cache = frame_cache
+            print (f'Using frame cache in {cache_folder}')
+
+        def read_cached_frames(self):
+            self.cache_index = (self.cache_index + 1) % len(self.train_descriptions)
+            description = self.train_descriptions[self.cache_index]
+
+            if self.generalize == 0:
+                h_scaled = self.frame_cache.scale_levels[0]
+            else:
+                h_scaled = self.frame_cache.scale_levels[int(torch.randint(0, len(self.frame_cache.scale_levels), (1, ), generator=self.generator))]
+
+            frames = [self.frame_cache.get_frame(file_path, h_scaled) for file_path in self.description_files(description)]
+
+            train_data = {}
+            train_data['frames'] = frames
+            train_data['start'] = frames[0]
+            train_data['gt'] = frames[1]
+            train_data['end'] = frames[-1]
+            train_data['ratio'] = description['ratio']
+            train_data['h'] = description['h']
+            train_data['w'] = description['w']
+            train_data['description'] = description
+            train_data['index'] = self.cache_index
+            return train_data
 
         def find_folders_with_exr(self, path):
             """
@@ -354,135 +482,209 @@ def get_dataset(
 
             return descriptions
 
-        def read_frames_thread(self):
-            while not exit_event.is_set():
-                self.frame_read_process = torch.multiprocessing.Process(
+        def start_readers(self, num_workers):
+            # Persistent reader processes, each decoding its own interleaved
+            # slice of the epoch into a ring of shared memory slots.
+            # Slots are handed over by index through blocking queues.
+            from frame_cache import get_scale_levels, get_scaled_size
+
+            max_h_scaled = max(get_scale_levels(self.h))
+            max_h, max_w = 0, 0
+            for description in self.train_descriptions:
+                new_h, new_w = get_scaled_size(description['h'], description['w'], max_h_scaled)
+                max_h, max_w = max(max_h, new_h), max(max_w, new_w)
+
+            self.num_workers = num_workers
+            num_slots = 2 * num_workers + 2
+            # whole window in multi-target mode
+            slot_frames = max(len(self.description_files(d)) for d in self.train_descriptions)
+            self.slots = [torch.zeros((slot_frames, max_h, max_w, 3), dtype=torch.float32).share_memory_() for _ in range(num_slots)]
+            self.free_slots = torch.multiprocessing.Queue()
+            for slot_index in range(num_slots):
+                self.free_slots.put(slot_index)
+            self.ready_queue = torch.multiprocessing.Queue()
+            self.epoch_done_queue = torch.multiprocessing.Queue()
+            # samples of an epoch come interleaved from all readers,
+            # so epoch end is counted on received samples, not indices
+            self.epoch_received = 0
+            self.epoch_end = False
+            self.task_queues = []
+            # cumulative (hits, misses) of decoded frame cache per worker
+            self.decode_cache_stats = {}
+
+            self.frame_read_processes = []
+            for worker_index in range(num_workers):
+                task_queue = torch.multiprocessing.Queue()
+                process = torch.multiprocessing.Process(
                     target=self.read_frames,
                     args=(
-                        self.frames_queue,
-                        list(self.train_descriptions),
-                        batch_size,
+                        task_queue,
+                        self.free_slots,
+                        self.ready_queue,
+                        self.epoch_done_queue,
+                        self.slots,
+                        self.generalize,
                         self.h,
-                        self.w
+                        self.w,
+                        worker_index,
+                        self.decode_cache * 1024 * 1024,
+                        self.seed
                         ),
                     daemon = True
                 )
-                self.frame_read_process.daemon = True
-                self.frame_read_process.start()
-                self.frame_read_process.join()
+                process.start()
+                self.task_queues.append(task_queue)
+                self.frame_read_processes.append(process)
+
+            self.frame_read_thread = threading.Thread(target=self.read_frames_thread)
+            self.frame_read_thread.daemon = True
+            self.frame_read_thread.start()
+
+        def read_frames_thread(self):
+            while not exit_event.is_set():
+                descriptions = list(self.train_descriptions)
+                for worker_index, task_queue in enumerate(self.task_queues):
+                    # whole locality runs go to the same worker
+                    task_queue.put([(index, descriptions[index]) for index in range(len(descriptions)) if (index // self.locality) % self.num_workers == worker_index])
+                for _ in range(self.num_workers):
+                    self.epoch_done_queue.get()
                 if not self.sequential:
                     self.reshuffle()
 
         @staticmethod
-        def read_frames(frames_queue, train_descriptions, generalize, self_h, self_w):
-            from PIL import Image
-            while not process_exit_event.is_set():
-                for index in range(len(train_descriptions)):
-                    description = train_descriptions[index]
-                    train_data = {}
-                    train_data['description'] = description
-
-                    try:
-                        img0 = read_image_file(description['start'])['image_data']
-                        img1 = read_image_file(description['gt'])['image_data']
-                        img2 = read_image_file(description['end'])['image_data']
-
-                        # get rid of negative values before scale
-                        img0[img0 < 0] = 0.
-                        img1[img1 < 0] = 0.
-                        img2[img2 < 0] = 0.
+        def read_sample(description, generalize, self_h, self_w, frame_lru = None):
+            from frame_cache import get_scale_levels, get_scaled_size, resize_lanczos
 
-                        '''
-                        img0 = torch.from_numpy(img0['image_data']).to(dtype = torch.float32)
-                        img1 = torch.from_numpy(img1['image_data']).to(dtype = torch.float32)
-                        img2 = torch.from_numpy(img2['image_data']).to(dtype = torch.float32)
-
-                        img0 = img0.permute(2, 0, 1)
-                        img1 = img1.permute(2, 0, 1)
-                        img2 = img2.permute(2, 0, 1)
-                        '''
-
-                        if generalize == 0:
-                            h_scaled = self_h
-                        else:
-                            q = random.uniform(0, 1)
-                            if q < 0.25:
-                                h_scaled = self_h
-                            elif q < 0.5:
-                                h_scaled = int(self_h * (1 + 1/8))
-                            elif q < 0.75:
-                                h_scaled = int(self_h * (1 + 1/7))
-                            else:
-                                h_scaled = int(self_h * (1 + 1/6))
-
-                        h, w = img0.shape[0], img0.shape[1]
-                        if h > w:
-                            new_w = h_scaled
-                            new_h = int(h_scaled * h / w)
-                        else:
-                            new_h = h_scaled
-                            new_w = int(h_scaled * w / h)
-
-                        channels = [Image.fromarray(img0[:, :, i], mode='F') for i in range(3)]
-                        resized_channels = [channel.resize((new_w, new_h), resample=Image.LANCZOS) for channel in channels]
-                        resized_arrays = [np.array(channel) for channel in resized_channels]
-                        img0 = np.stack(resized_arrays, axis=-1)
-
-                        channels = [Image.fromarray(img1[:, :, i], mode='F') for i in range(3)]
-                        resized_channels = [channel.resize((new_w, new_h), resample=Image.LANCZOS) for channel in channels]
-                        resized_arrays = [np.array(channel) for channel in resized_channels]
-                        img1 = np.stack(resized_arrays, axis=-1)
-
-                        channels = [Image.fromarray(img2[:, :, i], mode='F') for i in range(3)]
-                        resized_channels = [channel.resize((new_w, new_h), resample=Image.LANCZOS) for channel in channels]
-                        resized_arrays = [np.array(channel) for channel in resized_channels]
-                        img2 = np.stack(resized_arrays, axis=-1)
-
-                        # resize_transform = torchvision.transforms.Resize((new_w, new_h), interpolation=torchvision.transforms.InterpolationMode.LANCZOS)
+            if generalize == 0:
+                h_scaled = self_h
+            else:
+                h_scaled = random.choice(get_scale_levels(self_h))
+
+            keys = [(file_path, h_scaled) for file_path in TimewarpMLDataset.description_files(description)]
+            frames = [frame_lru.get(key) if frame_lru else None for key in keys]
+            missing = [i for i, frame in enumerate(frames) if frame is None]
+            if missing:
+                images = []
+                for i in missing:
+                    img = read_image_file(keys[i][0])['image_data'][:, :, :3]
+                    # get rid of negative values before scale
+                    img[img < 0] = 0.
+                    images.append(img)
+
+                new_h, new_w = get_scaled_size(images[0].shape[0], images[0].shape[1], h_scaled)
+                # all decoded frames are resized in one call
+                resized = resize_lanczos(np.stack(images), new_h, new_w)
+                for i, frame in zip(missing, resized):
+                    frames[i] = frame
+                    if frame_lru:
+                        frame_lru.put(keys[i], frame.copy())
+
+            return frames
 
-                        '''
-                        img0 = torchvision.transforms.functional.resize(img0, (new_h, new_w))
-                        img1 = torchvision.transforms.functional.resize(img1, (new_h, new_w))
-                        img2 = torchvision.transforms.functional.resize(img2, (new_h, new_w))
+        @staticmethod
+        def read_frames(task_queue, free_slots, ready_queue, epoch_done_queue, slots, generalize, self_h, self_w, worker_index = 0, decode_cache_bytes = 0, seed = None):
+            from frame_cache import DecodedFrameLRU
 
-                        img0 = img0.squeeze(0).permute(1, 2, 0)
-                        img1 = img1.squeeze(0).permute(1, 2, 0)
-                        img2 = img2.squeeze(0).permute(1, 2, 0)
-                        '''
+            # forked readers start with the same state of random,
+            # each worker is reseeded to draw its own scale levels
+            random.seed(None if seed is None else seed + worker_index)
 
-                        train_data['start'] = img0
-                        train_data['gt'] = img1
-                        train_data['end'] = img2
-                        train_data['ratio'] = description['ratio']
-                        train_data['h'] = description['h']
-                        train_data['w'] = description['w']
-                        train_data['description'] = description
-                        train_data['index'] = index
-                        frames_queue.put(train_data)
-
-                        # del img0, img1, img2, train_data
-                    
+            frame_lru = DecodedFrameLRU(decode_cache_bytes) if decode_cache_bytes > 0 else None
+            while not process_exit_event.is_set():
+                task = task_queue.get()
+                for index, description in task:
+                    try:
+                        frames = TimewarpMLDataset.read_sample(description, generalize, self_h, self_w, frame_lru)
                     except Exception as e:
-                        del train_data
                         print (f'\n\nError reading file: {e}')
                         print (f'{description}\n\n')
-
-                # time.sleep(timeout)
+                        # still counted towards the end of epoch
+                        ready_queue.put({'skipped': index, 'worker': worker_index})
+                        continue
+
+                    h, w = frames[0].shape[0], frames[0].shape[1]
+                    slot_index = free_slots.get()
+                    slot = slots[slot_index].numpy()
+                    for frame_index, frame in enumerate(frames):
+                        slot[frame_index, :h, :w] = frame
+                    ready_queue.put({
+                        'slot': slot_index,
+                        'frames': len(frames),
+                        'shape': (h, w),
+                        'ratio': description['ratio'],
+                        'h': description['h'],
+                        'w': description['w'],
+                        'description': description,
+                        'index': index,
+                        'worker': worker_index,
+                        'cache_hits': frame_lru.hits if frame_lru else 0,
+                        'cache_misses': frame_lru.misses if frame_lru else 0
+                    })
+                epoch_done_queue.put(True)
+
+        def get_new_sample(self, block = True):
+            # raises queue.Empty if not blocking and there is no sample ready
+            while True:
+                message = self.ready_queue.get(block = block)
+                self.epoch_received += 1
+                if self.epoch_received >= len(self.train_descriptions):
+                    self.epoch_received = 0
+                    self.epoch_end = True
+                if 'skipped' not in message:
+                    break
+            h, w = message['shape']
+            frames = self.slots[message['slot']][:message['frames'], :h, :w].numpy().copy()
+            self.free_slots.put(message['slot'])
+            self.decode_cache_stats[message['worker']] = (message['cache_hits'], message['cache_misses'])
+
+            train_data = {}
+            train_data['frames'] = list(frames)
+            train_data['start'] = frames[0]
+            train_data['gt'] = frames[1]
+            train_data['end'] = frames[-1]
+            train_data['ratio'] = message['ratio']
+            train_data['h'] = message['h']
+            train_data['w'] = message['w']
+            train_data['description'] = message['description']
+            train_data['index'] = message['index']
+            return train_data
+
+        def decode_cache_hit_rate(self):
+            # None if there is no decoded frame cache or nothing was read yet
+            if self.frame_cache or not self.decode_cache:
+                return None
+            hits = sum(stats[0] for stats in self.decode_cache_stats.values())
+            misses = sum(stats[1] for stats in self.decode_cache_stats.values())
+            if hits + misses == 0:
+                return None
+            return hits / (hits + misses)
+
+        def is_epoch_end(self, index):
+            # True once for the sample that completes an epoch
+            if self.frame_cache:
+                return index + 1 == len(self)
+            epoch_end = self.epoch_end
+            self.epoch_end = False
+            return epoch_end
 
         def __len__(self):
             return len(self.train_descriptions)
         
-        def crop(self, img0, img1, img2, h, w):
-            np.random.seed(None)
-            ih, iw, _ = img0.shape
-            x = np.random.randint(0, ih - h + 1)
-            y = np.random.randint(0, iw - w + 1)
-            img0 = img0[x:x+h, y:y+w, :]
-            img1 = img1[x:x+h, y:y+w, :]
-            img2 = img2[x:x+h, y:y+w, :]
-            # img3 = img3[x:x+h, y:y+w, :]
-            # img4 = img4[x:x+h, y:y+w, :]
-            return img0, img1, img2 #, img3, img4
+        def crop(self, img0, img1, img2, h, w, count = None):
+            return self.crop_frames([img0, img1, img2], h, w, count = count)
+
+        def crop_frames(self, frames, h, w, count = None):
+            # count (batch_size by default) random crops of the frames as BxNxHxWxC array,
+            # memory-mapped half float frames are only read under the crops
+            count = self.batch_size if count is None else count
+            ih, iw, _ = frames[0].shape
+            xs = torch.randint(0, ih - h + 1, (count, ), generator=self.generator).tolist()
+            ys = torch.randint(0, iw - w + 1, (count, ), generator=self.generator).tolist()
+            crops = np.empty((count, len(frames), h, w, 3), dtype=np.float32)
+            for batch_index, (x, y) in enumerate(zip(xs, ys)):
+                for frame_index, frame in enumerate(frames):
+                    crops[batch_index, frame_index] = frame[x:x+h, y:y+w, :3]
+            return crops
 
         def resize_image(self, tensor, x):
             """
@@ -519,15 +721,24 @@ def get_dataset(
             return resized_tensor
 
         def getimg(self, index):        
+            if self.frame_cache:
+                if self.last_train_data[0] is None or self.repeat_counter >= self.repeat_count:
+                    self.repeat_counter = 1
+                    self.last_train_data[0] = self.read_cached_frames()
+                    self.train_data_index = self.last_train_data[0]['index']
+                else:
+                    self.repeat_counter += 1
+                return self.last_train_data[0]
+
             if self.repeat_count == 0:
-                new_data = self.frames_queue.get()
+                new_data = self.get_new_sample()
                 self.train_data_index = new_data['index']
                 return new_data
         
             if self.repeat_counter >= self.repeat_count:
                 self.repeat_counter = 1
                 try:
-                    new_data = self.new_sample_queue.get_nowait()
+                    new_data = self.get_new_sample(block = False)
                     self.last_train_data[random.randint(0, len(self.last_train_data) - 1)] = new_data
                     self.train_data_index = new_data['index']
                     return new_data
@@ -565,122 +776,140 @@ def get_dataset(
 
             return ACEScc
 
+        def augment(self, batch):
+            """
+            Applies augmentation to the whole Bx3xCxHxW batch of triplets at once.
+
+            Random parameters for all samples are drawn from the dataset generator
+            on CPU in one go, each augmentation is a single broadcasted op with
+            per-sample masks. Probabilities are the same as for sample by sample
+            augmentation: each one is applied with --generalize rate and then
+            with its own chance.
+            """
+
+            b = batch.shape[0]
+            rate = self.generalize / 100
+
+            def draw(*shape):
+                return torch.rand(shape, generator=self.generator).to(device=batch.device, dtype=batch.dtype)
+
+            def select(mask, if_true, if_false):
+                return torch.where(mask.view(b, 1, 1, 1, 1), if_true, if_false)
+
+            if self.generalize == 1:
+                # horizontal flip only
+                batch = select(draw(b) < 0.5, batch.flip(-1), batch)
+
+            elif self.generalize > 1:
+                # horizontal flip (reverse width)
+                batch = select(draw(b) < 0.5, batch.flip(-1), batch)
+
+                # rotation, crops are square so shape stays the same
+                rotate = draw(b) < rate
+                p = draw(b)
+                batch = select(rotate & (p < 0.25), batch.transpose(-2, -1).flip(-1), batch)
+                batch = select(rotate & (p >= 0.25) & (p < 0.5), batch.flip(-2, -1), batch)
+                batch = select(rotate & (p >= 0.5) & (p < 0.75), batch.transpose(-2, -1).flip(-2), batch)
+
+                # vertical flip (reverse height)
+                batch = select((draw(b) < rate) & (draw(b) < 0.5), batch.flip(-2), batch)
+
+                # depth-wise flip (reverse channels)
+                batch = select((draw(b) < rate) & (draw(b) < 0.28), batch.flip(2), batch)
+
+                # exposure
+                exposure = 1 / 8 + draw(b) * (2 - 1 / 8)
+                exposure = torch.where((draw(b) < rate) & (draw(b) < 0.4), exposure, torch.ones_like(exposure))
+                batch = batch * exposure.view(b, 1, 1, 1, 1)
+
+                # colour balance shift
+                delta = draw(b, 1) * 0.49
+                multipliers = 1 - delta + draw(b, 3) * 2 * delta
+                multipliers = torch.where(draw(b, 1) < rate, multipliers, torch.ones_like(multipliers))
+                batch = batch * multipliers.view(b, 1, 3, 1, 1)
+
+                # gamma, samples with gamma of 1 stay the same
+                gamma = 0.9 + draw(b)
+                gamma = torch.where((draw(b) < rate) & (draw(b) < 0.44), gamma, torch.ones_like(gamma))
+                batch = torch.sign(batch) * torch.pow(torch.abs(batch), 1 / gamma.view(b, 1, 1, 1, 1))
+
+            # convert to ACEScc
+            acescc = draw(b) < (self.acescc_rate / 100)
+            if acescc.any():
+                batch = select(acescc, self.apply_acescc(torch.clamp(batch, min=0.01)), batch)
+
+            return batch
+
+        def get_mixed_sample(self, index):
+            # samples of a mixed batch should be independent, non-blocking getimg
+            # would fill the batch with replays whenever readers fall behind,
+            # replay buffer is only used when --repeat asks for it
+            if self.frame_cache or self.repeat_count > 1:
+                return self.getimg(index)
+            new_data = self.get_new_sample()
+            self.train_data_index = new_data['index']
+            return new_data
+
+        def get_mixed_batch(self, index):
+            # one crop from each of batch_size samples, possibly from different
+            # clips and ratios, ratio is returned as Bx1x1x1 tensor
+            crops = np.empty((self.batch_size, 3, self.h, self.w, 3), dtype=np.float32)
+            ratios = []
+            descriptions = []
+            images_idx = None
+            for batch_index in range(self.batch_size):
+                train_data = self.get_mixed_sample(index)
+                crops[batch_index] = self.crop(train_data['start'], train_data['gt'], train_data['end'], self.h, self.w, count = 1)[0]
+                ratios.append(train_data['ratio'])
+                descriptions.append(train_data['description'])
+                # keep the last sample of epoch visible to the training loop
+                if images_idx != len(self) - 1:
+                    images_idx = self.train_data_index
+
+            ratio = torch.tensor(ratios, dtype=torch.float32, device=device).view(self.batch_size, 1, 1, 1)
+            return crops, ratio, images_idx, {'batch': descriptions}
+
+        def get_multi_target_batch(self, index):
+            # batch_size crops of the whole window, start and end are Bx3xHxW,
+            # targets and ratios are laid out ratio-major as (K*B)x3xHxW,
+            # the same order the model repeats start and end features in
+            train_data = self.getimg(index)
+            crops = self.crop_frames(train_data['frames'], self.h, self.w)
+            batch = torch.from_numpy(crops).to(device = device, dtype = torch.float32)
+            batch = batch.permute(0, 1, 4, 2, 3)
+            batch = self.augment(batch)
+
+            gt = batch[:, 1:-1].transpose(0, 1).reshape(-1, *batch.shape[2:]).contiguous()
+            ratio = torch.tensor(train_data['ratio'], dtype=torch.float32, device=device)
+            ratio = ratio.repeat_interleave(self.batch_size).view(-1, 1, 1, 1)
+            return batch[:, 0].contiguous(), gt, batch[:, -1].contiguous(), ratio, self.train_data_index, train_data['description']
+
         def __getitem__(self, index):
+            if self.multi_target:
+                return self.get_multi_target_batch(index)
+
+            if self.mixed_batch:
+                crops, ratio, images_idx, description = self.get_mixed_batch(index)
+                batch = torch.from_numpy(crops).to(device = device, dtype = torch.float32)
+                batch = batch.permute(0, 1, 4, 2, 3)
+                batch = self.augment(batch)
+                return batch[:, 0].contiguous(), batch[:, 1].contiguous(), batch[:, 2].contiguous(), ratio, images_idx, description
+
             train_data = self.getimg(index)
 
             src_img0 = train_data['start']
             src_img1 = train_data['gt']
             src_img2 = train_data['end']
-            imgh = train_data['h']
-            imgw = train_data['w']
             ratio = train_data['ratio']
             description = train_data['description']
             images_idx = self.train_data_index
 
-            batch_img0 = []
-            batch_img1 = []
-            batch_img2 = []
-
-            for batch_index in range(self.batch_size):
-
-                img0, img1, img2 = self.crop(src_img0, src_img1, src_img2, self.h, self.w)
-
-                img0 = torch.from_numpy(img0).to(device = device, dtype = torch.float32)
-                img1 = torch.from_numpy(img1).to(device = device, dtype = torch.float32)
-                img2 = torch.from_numpy(img2).to(device = device, dtype = torch.float32)
+            crops = self.crop(src_img0, src_img1, src_img2, self.h, self.w)
+            batch = torch.from_numpy(crops).to(device = device, dtype = torch.float32)
+            batch = batch.permute(0, 1, 4, 2, 3)
+            batch = self.augment(batch)
 
-                img0 = img0.permute(2, 0, 1)
-                img1 = img1.permute(2, 0, 1)
-                img2 = img2.permute(2, 0, 1)
-
-                if self.generalize == 0:
-                    # No augmentaton
-                    pass
-                elif self.generalize == 1:
-                    if random.uniform(0, 1) < 0.5:
-                        img0 = img0.flip(-1)
-                        img1 = img1.flip(-1)
-                        img2 = img2.flip(-1)
-                else:
-                    # Horizontal flip (reverse width)
-                    if random.uniform(0, 1) < 0.5:
-                        img0 = img0.flip(-1)
-                        img1 = img1.flip(-1)
-                        img2 = img2.flip(-1)
-
-                    # Rotation
-                    if random.uniform(0, 1) < (self.generalize / 100):
-                        p = random.uniform(0, 1)
-                        if p < 0.25:
-                            img0 = torch.flip(img0.transpose(1, 2), [2])
-                            img1 = torch.flip(img1.transpose(1, 2), [2])
-                            img2 = torch.flip(img2.transpose(1, 2), [2])
-                        elif p < 0.5:
-                            img0 = torch.flip(img0, [1, 2])
-                            img1 = torch.flip(img1, [1, 2])
-                            img2 = torch.flip(img2, [1, 2])
-                        elif p < 0.75:
-                            img0 = torch.flip(img0.transpose(1, 2), [1])
-                            img1 = torch.flip(img1.transpose(1, 2), [1])
-                            img2 = torch.flip(img2.transpose(1, 2), [1])
-
-                    if random.uniform(0, 1) < (self.generalize / 100):
-                        # Vertical flip (reverse height)
-                        if random.uniform(0, 1) < 0.5:
-                            img0 = img0.flip(-2)
-                            img1 = img1.flip(-2)
-                            img2 = img2.flip(-2)
-
-                    if random.uniform(0, 1) < (self.generalize / 100):
-                        # Depth-wise flip (reverse channels)
-                        if random.uniform(0, 1) < 0.28:
-                            img0 = img0.flip(0)
-                            img1 = img1.flip(0)
-                            img2 = img2.flip(0)
-
-                    if random.uniform(0, 1) < (self.generalize / 100):
-                        # Exposure augmentation
-                        exp = random.uniform(1 / 8, 2)
-                        if random.uniform(0, 1) < 0.4:
-                            img0 = img0 * exp
-                            img1 = img1 * exp
-                            img2 = img2 * exp
-
-                    if random.uniform(0, 1) < (self.generalize / 100):
-                        # add colour banace shift
-                        delta = random.uniform(0, 0.49)
-                        r = random.uniform(1-delta, 1+delta)
-                        g = random.uniform(1-delta, 1+delta)
-                        b = random.uniform(1-delta, 1+delta)
-                        multipliers = torch.tensor([r, g, b]).view(3, 1, 1).to(device = device, dtype = torch.float32)
-                        img0 = img0 * multipliers
-                        img1 = img1 * multipliers
-                        img2 = img2 * multipliers
-                        del multipliers
-                    
-                    def gamma_up(img, gamma = 1.18):
-                        return torch.sign(img) * torch.pow(torch.abs(img), 1 / gamma )
-                    
-                    if random.uniform(0, 1) < (self.generalize / 100):
-                        if random.uniform(0, 1) < 0.44:
-                            gamma = random.uniform(0.9, 1.9)
-                            img0 = gamma_up(img0, gamma=gamma)
-                            img1 = gamma_up(img1, gamma=gamma)
-                            img2 = gamma_up(img2, gamma=gamma)
-
-                # Convert to ACEScc
-                if random.uniform(0, 1) < (self.acescc_rate / 100):
-                    img0 = self.apply_acescc(torch.clamp(img0, min=0.01))
-                    img1 = self.apply_acescc(torch.clamp(img1, min=0.01))
-                    img2 = self.apply_acescc(torch.clamp(img2, min=0.01))
-                
-                batch_img0.append(img0)
-                batch_img1.append(img1)
-                batch_img2.append(img2)
-
-            # del train_data, src_img0, src_img1, src_img2
-
-            return torch.stack(batch_img0), torch.stack(batch_img1), torch.stack(batch_img2), ratio, images_idx, description
+            return batch[:, 0].contiguous(), batch[:, 1].contiguous(), batch[:, 2].contiguous(), ratio, images_idx, description
 
     return TimewarpMLDataset(
         data_root, 
@@ -691,7 +920,14 @@ def get_dataset(
         acescc_rate=acescc_rate,
         generalize=generalize,
         repeat=repeat,
-        sequential = sequential
+        sequential = sequential,
+        cache_folder = cache_folder,
+        workers = workers,
+        seed = seed,
+        mixed_batch = mixed_batch,
+        locality = locality,
+        decode_cache = decode_cache,
+        multi_target = multi_target
         )
 
 def normalize(x):
@@ -1693,6 +1929,7 @@ def main():
     parser.add_argument('--legacy_model', type=str, default=None, help='Model name (optional)')
     parser.add_argument('--device', type=int, default=0, help='Graphics card index (default: 0)')
     parser.add_argument('--batch_size', type=int, default=2, help='Batch size (int) (default: 2)')
+    parser.add_argument('--accumulate', type=int, default=1, help='Split each batch into N micro-batches and accumulate gradients (default: 1)')
     parser.add_argument('--first_epoch', type=int, default=-1, help='Epoch (int) (default: Saved)')
     parser.add_argument('--epochs', type=int, default=-1, help='Number of epoch to run (int) (default: Unlimited)')
     parser.add_argument('--reset_stats', action='store_true', dest='reset_stats', default=False, help='Reset saved step, epoch and loss stats')
@@ -1705,6 +1942,8 @@ def main():
     parser.add_argument('--eval_save_imgs', action='store_true', dest='eval_save_imgs', default=False, help='Save eval result images')
     parser.add_argument('--eval_keep_all', action='store_true', dest='eval_keep_all', default=False, help='Keep eval results for each eval step')
     parser.add_argument('--eval_folder', type=str, default=None, help='Folder with clips for evaluation')
+    parser.add_argument('--amp', type=str, default=None, choices=['fp16', 'bf16'], help='Train with mixed precision (default: fp32)')
+    parser.add_argument('--cpu', action='store_true', dest='cpu', default=False, help='Train on CPU')
     parser.add_argument('--eval_half', action='store_true', dest='eval_half', default=False, help='Evaluate in half-precision')
 
     parser.add_argument('--frame_size', type=int, default=448, help='Frame size in pixels (default: 448)')
@@ -1722,12 +1961,33 @@ def main():
     parser.add_argument('--iterations', type=int, default=1, help='Process each flow refinement N times (default: 1)')
     parser.add_argument('--compile', action='store_true', dest='compile', default=False, help='Compile with torch.compile')
     parser.add_argument('--sequential', action='store_true', dest='sequential', default=False, help='Keep sequences, do not reshuffle')
+    parser.add_argument('--checkpoint_blocks', type=str, default=None, help='Recompute activations of comma separated model blocks in backward pass to save memory, i.e. block0,encode or all (default: None)')
+    parser.add_argument('--profile_blocks', action='store_true', dest='profile_blocks', default=False, help='Profile time and memory of model blocks and warps, with --checkpoint_blocks also compare a step with and without checkpointing at startup')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes decoding training frames (default: 1)')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for crops and augmentation (default: random)')
+    parser.add_argument('--mixed_batch', action='store_true', dest='mixed_batch', default=False, help='Compose each batch of independent samples from different clips and ratios')
+    parser.add_argument('--multi_target', action='store_true', dest='multi_target', default=False, help='Train all targets of a window in one step, start and end are encoded once')
+    parser.add_argument('--locality', type=int, default=1, help='Shuffle nearby windows of a clip in runs of N samples so readers can reuse decoded frames, i.e. 8 (default: 1, shuffle freely)')
+    parser.add_argument('--decode_cache', type=int, default=0, help='Memory for decoded frames kept by each reader process in Mb, i.e. 1024 with --locality 8 (default: 0, disabled)')
+    parser.add_argument('--cache', type=str, default=None, help='Read frames from cache built with preprocess_dataset.py (default: decode source files)')
 
     args = parser.parse_args()
 
     device = torch.device("mps") if platform.system() == 'Darwin' else torch.device(f'cuda:{args.device}')
     if args.all_gpus:
         device = 'cuda'
+    if args.cpu:
+        device = torch.device('cpu')
+
+    amp_device_type = torch.device(device).type
+    amp_dtype = {'fp16': torch.float16, 'bf16': torch.bfloat16}.get(args.amp)
+    if amp_dtype == torch.float16 and amp_device_type == 'cpu':
+        print ('fp16 mixed precision is not supported on CPU, use --amp bf16')
+        return
+    if amp_dtype is not None:
+        print (f'Mixed precision: {args.amp}')
+    # loss scaling is only needed for fp16, bf16 has the range of fp32
+    grad_scaler = torch.amp.GradScaler(amp_device_type, enabled=amp_dtype == torch.float16)
 
     Flownet = None
 
@@ -1766,18 +2026,62 @@ def main():
     max_dataset_window = 11
     if not model_info.get('ratio_support'):
         max_dataset_window = 3
+
+    if args.multi_target:
+        if not model_info.get('multi_target_support'):
+            print (f'Model {model_info.get("name")} does not support multi-target training')
+            return
+        if args.mixed_batch or args.all_gpus:
+            print ('Multi-target training can not be used with --mixed_batch or --all_gpus')
+            return
     
-    if args.compile:
-        flownet_uncompiled = Flownet().get_training_model()().to(torch.float32).cuda()
-        flownet = torch.compile(flownet_uncompiled, mode='reduce-overhead')
-    else:
-        flownet = Flownet().get_training_model()().to(device)
+    checkpoint_blocks = None
+    if args.checkpoint_blocks:
+        if not model_info.get('checkpoint_support'):
+            print (f'Model {model_info.get("name")} does not support activation checkpointing')
+            return
+        if args.all_gpus:
+            # blocks are wrapped per instance and would not follow DataParallel replicas
+            print ('Activation checkpointing can not be used with --all_gpus')
+            return
+        checkpoint_blocks = 'all' if args.checkpoint_blocks == 'all' else [b.strip() for b in args.checkpoint_blocks.split(',') if b.strip()]
+
+    try:
+        if checkpoint_blocks:
+            TrainingModel = Flownet().get_training_model(checkpoint_blocks=checkpoint_blocks)
+        else:
+            TrainingModel = Flownet().get_training_model()
+        if args.compile:
+            flownet_uncompiled = TrainingModel().to(torch.float32).cuda()
+            flownet = torch.compile(flownet_uncompiled, mode='reduce-overhead')
+        else:
+            flownet = TrainingModel().to(device)
+    except ValueError as e:
+        print (f'Unable to create model: {e}')
+        return
+
+    if checkpoint_blocks and args.profile_blocks:
+        from block_profiler import measure_checkpointing, print_checkpointing_report
+        checkpointed_flownet = flownet_uncompiled if args.compile else flownet
+        print ('Measuring activation checkpointing...')
+        # tensors are the size of a micro-batch with --accumulate
+        checkpointing_batch_size = max(1, args.batch_size // max(1, args.accumulate))
+        checkpointing_results = measure_checkpointing(checkpointed_flownet, torch.device(device), checkpointing_batch_size, args.frame_size, amp_dtype=amp_dtype)
+        print_checkpointing_report(checkpointing_results, checkpointed_flownet.checkpoint_blocks, checkpointing_batch_size, args.frame_size)
     
     if args.all_gpus:
         print ('Using nn.DataParallel')
         flownet = torch.nn.DataParallel(flownet)
         flownet.to(device)
 
+    block_profiler = None
+    if args.profile_blocks:
+        from block_profiler import BlockProfiler
+        profiled_flownet = flownet_uncompiled if args.compile else flownet
+        profiled_flownet = getattr(profiled_flownet, 'module', profiled_flownet)
+        block_profiler = BlockProfiler(profiled_flownet, torch.device(device))
+        block_profiler.start()
+
     if not os.path.isdir(os.path.join(args.dataset_path, 'preview')):
         os.makedirs(os.path.join(args.dataset_path, 'preview'))
 
@@ -1789,23 +2093,37 @@ def main():
 
     frame_size = args.frame_size
 
+    if args.accumulate < 1 or args.batch_size % args.accumulate != 0:
+        print (f'Batch size {args.batch_size} should be divisible by --accumulate {args.accumulate}')
+        return
+    micro_batch_size = args.batch_size // args.accumulate
+    if args.accumulate > 1:
+        print (f'Gradient accumulation: {args.accumulate} micro-batches of {micro_batch_size}')
+
     dataset = get_dataset(
         args.dataset_path, 
-        batch_size=args.batch_size, 
+        batch_size=micro_batch_size, 
         device=device, 
         frame_size=frame_size,
         max_window=max_dataset_window,
         acescc_rate=args.acescc,
         generalize=args.generalize,
         repeat=args.repeat,
-        sequential = args.sequential
+        sequential = args.sequential,
+        cache_folder = args.cache,
+        workers = args.workers,
+        seed = args.seed,
+        mixed_batch = args.mixed_batch,
+        locality = args.locality,
+        decode_cache = args.decode_cache,
+        multi_target = args.multi_target
         )
     
     if args.eval_folder:
         print (f'Scanning data for evaluation:')
         eval_dataset = get_dataset(
         args.eval_folder, 
-        batch_size=args.batch_size,
+        batch_size=micro_batch_size,
         device=device, 
         frame_size=frame_size,
         max_window=max_dataset_window,
@@ -1969,6 +2287,12 @@ def main():
         current_epoch = 0
         preview_index = 0
     
+    # scheduler steps once per logical batch of --accumulate micro-batches,
+    # with --mixed_batch each sample of a logical batch is a separate triplet
+    samples_per_step = args.batch_size if args.mixed_batch else args.accumulate
+    repeat_count = dataset.repeat_count if dataset.repeat_count > 0 else 1
+    steps_per_epoch = (len(dataset) * repeat_count + samples_per_step - 1) // samples_per_step
+
     if args.onecycle != -1:
         try:
             optimizer_flownet.load_state_dict(checkpoint['optimizer_flownet_state_dict'])
@@ -1981,7 +2305,7 @@ def main():
                 max_lr=args.lr,
                 div_factor = 4,
                 final_div_factor = 1,
-                steps_per_epoch=len(dataset)*dataset.repeat_count, 
+                steps_per_epoch=steps_per_epoch, 
                 epochs=args.onecycle,
                 last_epoch = -1 if loaded_step == 0 else loaded_step
                 )
@@ -1991,11 +2315,11 @@ def main():
                 max_lr=args.lr,
                 div_factor = 4,
                 final_div_factor = 1,
-                steps_per_epoch=len(dataset)*dataset.repeat_count, 
+                steps_per_epoch=steps_per_epoch, 
                 epochs=args.onecycle,
                 last_epoch = -1
                 )
-        print (f'setting OneCycleLR scheduler with max_lr={args.lr}, steps_per_epoch={len(dataset)*dataset.repeat_count}, epochs={args.onecycle}, last: {-1 if loaded_step == 0 else loaded_step}')
+        print (f'setting OneCycleLR scheduler with max_lr={args.lr}, steps_per_epoch={steps_per_epoch}, epochs={args.onecycle}, last: {-1 if loaded_step == 0 else loaded_step}')
         args.epochs = args.onecycle
     elif args.cyclic != -1:
         print (f'setting CyclicLR scheduler with max_lr={args.lr}, base_lr={lr * pulse_dive:.2e}, step_size_up={args.cyclic}, last: {-1 if loaded_step == 0 else loaded_step}')
@@ -2340,12 +2664,22 @@ def main():
             ]
         )
     
+    def save_block_profile():
+        if not block_profiler:
+            return
+        block_profiler.stop()
+        block_profiler.print_report()
+        profile_path = f'{os.path.splitext(trained_model_path)[0]}.profile.json'
+        block_profiler.save(profile_path)
+        print (f'Block profile saved to {profile_path}')
+
     import signal
     def create_graceful_exit(current_state_dict):
         def graceful_exit(signum, frame):
             print(f'\nSaving current state to {current_state_dict["trained_model_path"]}...')
             print (f'Epoch: {current_state_dict["epoch"] + 1}, Step: {current_state_dict["step"]:11}')
             torch.save(current_state_dict, current_state_dict['trained_model_path'])
+            save_block_profile()
             exit_event.set()  # Signal threads to stop
             process_exit_event.set()  # Signal processes to stop
             exit(0)
@@ -2373,8 +2707,9 @@ def main():
     cur_comb = None
     cur_lpips = None
 
-    repeat_count = dataset.repeat_count if dataset.repeat_count > 0 else 1
-    preview_maxmin_steps = args.preview_maxmin_steps if args.preview_maxmin_steps < len(dataset)*repeat_count else len(dataset)*repeat_count
+    # optimizer steps, each takes samples_per_step samples
+    epoch_steps = steps_per_epoch
+    preview_maxmin_steps = args.preview_maxmin_steps if args.preview_maxmin_steps < epoch_steps else epoch_steps
     max_values = MaxNValues(n=args.preview_max if args.preview_max else 10)
     min_values = MinNValues(n=args.preview_min if args.preview_min else 10)
 
@@ -2386,140 +2721,195 @@ def main():
     while True:
         # tracemalloc.start()
         # data_time = time.time() - time_stamp
-        time_stamp = time.time()
         optimizer_flownet.zero_grad()
 
-        img0, img1, img2, ratio, idx, current_desc = dataset[batch_idx]
-
-        img0 = img0.to(device, non_blocking = True)
-        img1 = img1.to(device, non_blocking = True)
-        img2 = img2.to(device, non_blocking = True)
-
-        if random.uniform(0, 1) > 0.25:
-            scale_augm = random.uniform(1, 3)        
-            nn, nc, nh, nw = img0.shape
-            sh, sw = round(nh * (1 / scale_augm)), round(nw * (1 / scale_augm))
-            sh += 4 - (sh % 4)
-            sw += 4 - (sw % 4)
-            img0 = torch.nn.functional.interpolate(img0, size=(sh, sw), mode="bicubic", align_corners=False)
-            img1 = torch.nn.functional.interpolate(img1, size=(sh, sw), mode="bicubic", align_corners=False)
-            img2 = torch.nn.functional.interpolate(img2, size=(sh, sw), mode="bicubic", align_corners=False)
-
-        img0_orig = img0.detach().clone()
-        img1_orig = img1.detach().clone()
-        img2_orig = img2.detach().clone()
-
-        current_lr_str = str(f'{optimizer_flownet.param_groups[0]["lr"]:.2e}')
-
-        # scale list augmentation
-        random_scales = [
-            [4, 4, 2, 1],
-            [4, 2, 2, 1],
-            [4, 2, 1, 1],
-            [2, 2, 2, 1],
-            [2, 2, 1, 1],
-            [2, 1, 1, 1],
-            [1, 1, 1, 1],
-            [1, 1, 1, 1],
-            [1, 1, 1, 1],
-            [1, 1, 1, 1],
-        ]
-
-        if random.uniform(0, 1) < 0.44:
-            training_scale = random_scales[random.randint(0, len(random_scales) - 1)]
-        else:
-            training_scale = [8, 4, 2, 1]
+        # logical batch of --batch_size is processed in --accumulate micro-batches,
+        # losses and stats below are averaged over the logical batch
+        data_time = 0
+        model_time = 0
+        train_time = 0
+        loss_value = 0
+        loss_l1_value = 0
+        lpips_value = 0
+        psnr_value = 0
+        epoch_end = False
+        min_max_parts = []
+
+        for micro_batch in range(args.accumulate):
+            time_stamp = time.time()
+
+            img0, img1, img2, ratio, idx, current_desc = dataset[batch_idx]
+
+            img0 = img0.to(device, non_blocking = True)
+            img1 = img1.to(device, non_blocking = True)
+            img2 = img2.to(device, non_blocking = True)
+
+            if random.uniform(0, 1) > 0.25:
+                scale_augm = random.uniform(1, 3)        
+                nn, nc, nh, nw = img0.shape
+                sh, sw = round(nh * (1 / scale_augm)), round(nw * (1 / scale_augm))
+                sh += 4 - (sh % 4)
+                sw += 4 - (sw % 4)
+                img0 = torch.nn.functional.interpolate(img0, size=(sh, sw), mode="bicubic", align_corners=False)
+                img1 = torch.nn.functional.interpolate(img1, size=(sh, sw), mode="bicubic", align_corners=False)
+                img2 = torch.nn.functional.interpolate(img2, size=(sh, sw), mode="bicubic", align_corners=False)
+
+            img0_orig = img0.detach().clone()
+            img1_orig = img1.detach().clone()
+            img2_orig = img2.detach().clone()
+
+            if img1.shape[0] > img0.shape[0]:
+                # multi-target window: start and end are shared by all targets
+                targets = img1.shape[0] // img0.shape[0]
+                img0_orig = img0_orig.repeat(targets, 1, 1, 1)
+                img2_orig = img2_orig.repeat(targets, 1, 1, 1)
+
+            current_lr_str = str(f'{optimizer_flownet.param_groups[0]["lr"]:.2e}')
+
+            # scale list augmentation
+            random_scales = [
+                [4, 4, 2, 1],
+                [4, 2, 2, 1],
+                [4, 2, 1, 1],
+                [2, 2, 2, 1],
+                [2, 2, 1, 1],
+                [2, 1, 1, 1],
+                [1, 1, 1, 1],
+                [1, 1, 1, 1],
+                [1, 1, 1, 1],
+                [1, 1, 1, 1],
+            ]
 
-        training_scale = [5 if num == 8 else 3 if num == 4 else num for num in training_scale]
+            if random.uniform(0, 1) < 0.44:
+                training_scale = random_scales[random.randint(0, len(random_scales) - 1)]
+            else:
+                training_scale = [8, 4, 2, 1]
 
-        data_time = time.time() - time_stamp
-        time_stamp = time.time()
+            training_scale = [5 if num == 8 else 3 if num == 4 else num for num in training_scale]
 
-        flownet.train()
+            data_time += time.time() - time_stamp
+            time_stamp = time.time()
+
+            flownet.train()
         
-        if random.uniform(0, 1) < (args.generalize / 100):
-            # add noise
-            if random.uniform(0, 1) < 0.2:
-                delta = random.uniform(0, 1e-3)
-                img0 += torch.rand_like(img0) * delta
-                img2 += torch.rand_like(img1) * delta
-
-        result = flownet(
-            img0,
-            img2,
-            ratio,
-            scale=training_scale,
-            iterations = args.iterations,
-            gt = img1
-            )
+            if random.uniform(0, 1) < (args.generalize / 100):
+                # add noise
+                if random.uniform(0, 1) < 0.2:
+                    delta = random.uniform(0, 1e-3)
+                    img0 += torch.rand_like(img0) * delta
+                    img2 += torch.rand_like(img2) * delta
+
+            # forward pass and losses in reduced precision with --amp,
+            # weights and optimizer state stay in fp32
+            with torch.autocast(device_type=amp_device_type, dtype=amp_dtype, enabled=amp_dtype is not None):
+                result = flownet(
+                    img0,
+                    img2,
+                    ratio,
+                    scale=training_scale,
+                    iterations = args.iterations,
+                    gt = img1
+                    )
 
-        flow_list = result['flow_list']
-        mask_list = result['mask_list']
-        conf_list = result['conf_list']
+                flow_list = result['flow_list']
+                mask_list = result['mask_list']
+                conf_list = result['conf_list']
+
+                model_time += time.time() - time_stamp
+                time_stamp = time.time()
+
+                loss = torch.zeros(1, device=device, requires_grad=True)
+
+                for i in range(len(flow_list)):
+                    if flow_list[i] is not None:
+                        scale = training_scale[i]
+                        flow0 = flow_list[i][:, :2]
+                        flow1 = flow_list[i][:, 2:4]
+                        mask = mask_list[i]
+                        conf = conf_list[i]
+                        output_clean = warp(img0_orig, flow0) * mask + warp(img2_orig, flow1) * (1 - mask)
+                        loss_mask = variance_loss(mask, 0.1)
+                        loss_conf = criterion_l1(conf, diffmatte(output_clean, img1_orig))
+                        loss_l1 = criterion_l1(
+                            torch.nn.functional.interpolate(output_clean, scale_factor= 1. / scale, mode="bilinear", align_corners=False),
+                            torch.nn.functional.interpolate(img1_orig, scale_factor= 1. / scale, mode="bilinear", align_corners=False)
+                            ) * scale
+                        loss_lap = criterion_lap(
+                            output_clean,
+                            img1_orig
+                            )
+                        loss = loss + loss_l1 + loss_lap + 1e-2*loss_mask + 1e-2*loss_conf
+
+                diff_matte = diffmatte(output_clean, img1_orig)
+                loss_LPIPS = loss_fn_alex(output_clean * 2 - 1, img1_orig * 2 - 1)        
+                # loss_l1 = criterion_l1(output_clean, img1_orig)
+                loss = loss + loss_l1 + loss_lap + 1e-2 * float(torch.mean(loss_LPIPS).item())
+
+            if amp_dtype is not None:
+                output_clean = output_clean.float()
+                diff_matte = diff_matte.float()
+                mask = mask.float()
+                conf = conf.float()
+
+            # gradients of micro-batches add up to the gradient of the mean loss
+            grad_scaler.scale(loss / args.accumulate).backward()
+
+            loss_value += float(loss.item()) / args.accumulate
+            loss_l1_value += float(loss_l1.item()) / args.accumulate
+            lpips_value += float(torch.mean(loss_LPIPS).item()) / args.accumulate
+            psnr_value += float(psnr_torch(output_clean, img1_orig)) / args.accumulate
+            epoch_end = dataset.is_epoch_end(idx) or epoch_end
+
+            min_max_parts.append({
+                    'description': current_desc,
+                    'img0_orig': img0_orig.numpy(force=True).copy(),
+                    'img1_orig': img1_orig.numpy(force=True).copy(),
+                    'img2_orig': img2_orig.numpy(force=True).copy(),
+                    'diff': diff_matte.repeat_interleave(3, dim=1).numpy(force=True).copy(),
+                    'conf': conf.repeat_interleave(3, dim=1).numpy(force=True).copy(),
+                    'mask': mask.repeat_interleave(3, dim=1).numpy(force=True).copy(),
+                    'output': output_clean.numpy(force=True).copy(),
+            })
+
+            train_time += time.time() - time_stamp
 
-        model_time = time.time() - time_stamp
         time_stamp = time.time()
 
-        loss = torch.zeros(1, device=device, requires_grad=True)
-
-        for i in range(len(flow_list)):
-            if flow_list[i] is not None:
-                scale = training_scale[i]
-                flow0 = flow_list[i][:, :2]
-                flow1 = flow_list[i][:, 2:4]
-                mask = mask_list[i]
-                conf = conf_list[i]
-                output_clean = warp(img0_orig, flow0) * mask + warp(img2_orig, flow1) * (1 - mask)
-                loss_mask = variance_loss(mask, 0.1)
-                loss_conf = criterion_l1(conf, diffmatte(output_clean, img1_orig))
-                loss_l1 = criterion_l1(
-                    torch.nn.functional.interpolate(output_clean, scale_factor= 1. / scale, mode="bilinear", align_corners=False),
-                    torch.nn.functional.interpolate(img1_orig, scale_factor= 1. / scale, mode="bilinear", align_corners=False)
-                    ) * scale
-                loss_lap = criterion_lap(
-                    output_clean,
-                    img1_orig
-                    )
-                loss = loss + loss_l1 + loss_lap + 1e-2*loss_mask + 1e-2*loss_conf
-
-        diff_matte = diffmatte(output_clean, img1_orig)
-        loss_LPIPS = loss_fn_alex(output_clean * 2 - 1, img1_orig * 2 - 1)        
-        # loss_l1 = criterion_l1(output_clean, img1_orig)
-        loss = loss + loss_l1 + loss_lap + 1e-2 * float(torch.mean(loss_LPIPS).item())
-
         if cur_comb is None:
-            cur_comb = np.full(cur_size, float(loss.item()))
+            cur_comb = np.full(cur_size, loss_value)
         if cur_l1 is None:
-            cur_l1 = np.full(cur_size, float(loss_l1.item()))
+            cur_l1 = np.full(cur_size, loss_l1_value)
         if cur_lpips is None:
-            cur_lpips = np.full(cur_size, float(torch.mean(loss_LPIPS).item()))
+            cur_lpips = np.full(cur_size, lpips_value)
 
         cur_idx = np.random.choice(cur_size)
         cur_mask[cur_idx] = False
-        cur_comb[cur_idx] = float(loss.item())
-        cur_l1[cur_idx] = float(loss_l1.item())
-        cur_lpips[cur_idx] = float(torch.mean(loss_LPIPS).item())
+        cur_comb[cur_idx] = loss_value
+        cur_l1[cur_idx] = loss_l1_value
+        cur_lpips[cur_idx] = lpips_value
 
-        min_l1 = min(min_l1, float(loss_l1.item()))
-        max_l1 = max(max_l1, float(loss_l1.item()))
-        avg_loss = float(loss.item()) if batch_idx == 0 else (avg_loss * (batch_idx - 1) + float(loss.item())) / batch_idx 
-        avg_l1 = float(loss_l1.item()) if batch_idx == 0 else (avg_l1 * (batch_idx - 1) + float(loss_l1.item())) / batch_idx 
-        avg_lpips = float(torch.mean(loss_LPIPS).item()) if batch_idx == 0 else (avg_lpips * (batch_idx - 1) + float(torch.mean(loss_LPIPS).item())) / batch_idx
-        avg_pnsr = float(psnr_torch(output_clean, img1_orig)) if batch_idx == 0 else (avg_pnsr * (batch_idx - 1) + float(psnr_torch(output_clean, img1_orig))) / batch_idx
+        min_l1 = min(min_l1, loss_l1_value)
+        max_l1 = max(max_l1, loss_l1_value)
+        avg_loss = loss_value if batch_idx == 0 else (avg_loss * (batch_idx - 1) + loss_value) / batch_idx 
+        avg_l1 = loss_l1_value if batch_idx == 0 else (avg_l1 * (batch_idx - 1) + loss_l1_value) / batch_idx 
+        avg_lpips = lpips_value if batch_idx == 0 else (avg_lpips * (batch_idx - 1) + lpips_value) / batch_idx
+        avg_pnsr = psnr_value if batch_idx == 0 else (avg_pnsr * (batch_idx - 1) + psnr_value) / batch_idx
 
         cur_comb[cur_mask] = avg_loss
         cur_l1[cur_mask] = avg_l1
         cur_lpips[cur_mask] = avg_lpips
 
-        loss.backward()
+        # scaler is a pass-through unless training in fp16
+        grad_scaler.unscale_(optimizer_flownet)
         torch.nn.utils.clip_grad_norm_(flownet.parameters(), 1)
 
         if platform.system() == 'Darwin':
             torch.mps.synchronize()
-        else:
+        elif torch.device(device).type == 'cuda':
             torch.cuda.synchronize(device=device)
 
-        optimizer_flownet.step()
+        grad_scaler.step(optimizer_flownet)
+        grad_scaler.update()
 
         if isinstance(scheduler_flownet, torch.optim.lr_scheduler.ReduceLROnPlateau):
             pass
@@ -2556,7 +2946,7 @@ def main():
                                 scale_mode='cycle'              # Apply scaling once per cycle
                             )
 
-        train_time = time.time() - time_stamp
+        train_time += time.time() - time_stamp
         time_stamp = time.time()
 
         # del img0, img1, img2, img0_orig, img1_orig, img2_orig, flow0, flow1, flow_list, mask, mask_list, conf, conf_list, merged, output, output_clean, diff_matte
@@ -2608,28 +2998,31 @@ def main():
 
             del rgb_source1, rgb_source2, rgb_target, rgb_output, rgb_output_mask
 
-        current_desc['loss'] = float(loss.item())
-        current_desc['loss_l1'] = float(loss_l1.item())
-        current_desc['lpips'] = float(torch.mean(loss_LPIPS).item())
-
-        min_max_item = {
-                'description': current_desc,
-                'img0_orig': img0_orig.numpy(force=True).copy(),
-                'img1_orig': img1_orig.numpy(force=True).copy(),
-                'img2_orig': img2_orig.numpy(force=True).copy(),
-                'diff': diff_matte.repeat_interleave(3, dim=1).numpy(force=True).copy(),
-                'conf': conf.repeat_interleave(3, dim=1).numpy(force=True).copy(),
-                'mask': mask.repeat_interleave(3, dim=1).numpy(force=True).copy(),
-                'output': output_clean.numpy(force=True).copy(),
-        }
+        if len(min_max_parts) == 1:
+            min_max_item = min_max_parts[0]
+        else:
+            # micro-batches are joined back into the logical batch as lists
+            # of samples, they can differ in size after scale augmentation
+            batch_descriptions = []
+            for part in min_max_parts:
+                n = part['img1_orig'].shape[0]
+                batch_descriptions.extend(part['description']['batch'] if 'batch' in part['description'] else [part['description']] * n)
+            min_max_item = {key: [sample for part in min_max_parts for sample in part[key]] for key in min_max_parts[0] if key != 'description'}
+            min_max_item['description'] = {'batch': batch_descriptions}
+        del min_max_parts
+
+        current_desc = min_max_item['description']
+        current_desc['loss'] = loss_value
+        current_desc['loss_l1'] = loss_l1_value
+        current_desc['lpips'] = lpips_value
 
         try:
-            max_values.add(float(loss.item()), min_max_item)
-            min_values.add(float(loss.item()), min_max_item)
+            max_values.add(loss_value, min_max_item)
+            min_values.add(loss_value, min_max_item)
         except:
             pass
 
-        if (args.preview_max > 0) and ((step+1 % preview_maxmin_steps) == 1 or ( idx + 1 ) == len(dataset)):
+        if (args.preview_max > 0) and ((step+1 % preview_maxmin_steps) == 1 or epoch_end):
             max_preview_folder = os.path.join(
                 args.dataset_path,
                 'preview',
@@ -2642,7 +3035,7 @@ def main():
             item = None
             for index, item in enumerate(max_loss_values):
                 item_data = item[1]
-                n, c, h, w = item_data['img0_orig'].shape
+                n = len(item_data['img1_orig'])
                 for b_indx in range(n):
                     write_eval_image_queue.put(
                     {
@@ -2668,10 +3061,10 @@ def main():
                         f'{index:04}_{b_indx:02}.json'
                     )
                     with open(json_filename, 'w', encoding='utf-8') as json_file:
-                        json.dump(item_data['description'], json_file, indent=4, ensure_ascii=False)
+                        json.dump(item_data['description']['batch'][b_indx] if 'batch' in item_data['description'] else item_data['description'], json_file, indent=4, ensure_ascii=False)
             del index, item
 
-        if (args.preview_min > 0) and ((step+1 % preview_maxmin_steps) == 1 or ( idx + 1 ) == len(dataset)):
+        if (args.preview_min > 0) and ((step+1 % preview_maxmin_steps) == 1 or epoch_end):
             min_preview_folder = os.path.join(
                 args.dataset_path,
                 'preview',
@@ -2684,7 +3077,7 @@ def main():
             item = None
             for index, item in enumerate(min_loss_values):
                 item_data = item[1]
-                n, c, h, w = item_data['img0_orig'].shape
+                n = len(item_data['img1_orig'])
                 for b_indx in range(n):
                     write_eval_image_queue.put(
                     {
@@ -2710,7 +3103,7 @@ def main():
                         f'{index:04}_{b_indx:02}.json'
                     )
                     with open(json_filename, 'w', encoding='utf-8') as json_file:
-                        json.dump(item_data['description'], json_file, indent=4, ensure_ascii=False)
+                        json.dump(item_data['description']['batch'][b_indx] if 'batch' in item_data['description'] else item_data['description'], json_file, indent=4, ensure_ascii=False)
             del index, item
 
         data_time_str = str(f'{data_time:.2f}')
@@ -2723,14 +3116,17 @@ def main():
         hours = int((epoch_time % (24 * 3600)) // 3600)
         minutes = int((epoch_time % 3600) // 60)
 
+        decode_cache_hit_rate = dataset.decode_cache_hit_rate()
+        decode_cache_str = '' if decode_cache_hit_rate is None else f', Cache hits: {decode_cache_hit_rate * 100:.1f}%'
+
         clear_lines(2)
-        print (f'\r[Epoch {(epoch + 1):04} Step {step} - {days:02}d {hours:02}:{minutes:02}], Time: {data_time_str}+{model_time_str}+{train_time_str}+{data_time2_str}, Batch [{batch_idx+1}, Sample: {idx+1} / {len(dataset)}], Lr: {current_lr_str}')
+        print (f'\r[Epoch {(epoch + 1):04} Step {step} - {days:02}d {hours:02}:{minutes:02}], Time: {data_time_str}+{model_time_str}+{train_time_str}+{data_time2_str}, Batch [{batch_idx+1}, Sample: {idx+1} / {len(dataset)}], Lr: {current_lr_str}{decode_cache_str}')
         if len(dataset) > 10000:
             print(f'\r[10K Average] L1: {np.mean(cur_l1):.6f} LPIPS: {np.mean(cur_lpips):.4f} Combined: {np.mean(cur_comb):.8f}')
         else:
             print(f'\r[Epoch] Min L1: {min_l1:.6f} Avg L1: {avg_l1:.6f} Max L1: {max_l1:.6f} Avg LPIPS: {avg_lpips:.4f} Combined: {avg_loss:.8f}')
 
-        if ( idx + 1 ) == len(dataset):
+        if epoch_end:
             write_model_state_queue.put(deepcopy(current_state_dict))
 
             '''
@@ -2775,10 +3171,12 @@ def main():
             epoch = epoch + 1
             batch_idx = 0
             
-            while  ( idx + 1 ) == len(dataset):
+            # repeats of the last cached sample belong to the finished epoch
+            while dataset.frame_cache and ( idx + 1 ) == len(dataset):
                 img0, img1, img2, ratio, idx, current_desc = dataset[batch_idx]
 
-            if not args.sequential:
+            # with reader processes the feeder thread reshuffles after each epoch
+            if not args.sequential and dataset.frame_cache:
                 dataset.reshuffle()
             max_values.reset()
             min_values.reset()
@@ -3099,6 +3497,7 @@ def main():
         data_time2 = time.time() - time_stamp
 
         if epoch == args.epochs:
+            save_block_profile()
             sys.exit()
 
 if __name__ == "__main__":
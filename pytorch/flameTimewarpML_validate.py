@@ -12,6 +12,8 @@ import platform
 
 from pprint import pprint
 
+from checkpoint_io import load_checkpoint
+
 try:
     import numpy as np
     import torch
@@ -1248,6 +1250,8 @@ def main():
     parser.add_argument('--eval_half', action='store_true', dest='eval_half', default=False, help='Evaluate in half-precision')
 
     parser.add_argument('--iterations', type=int, default=1, help='Process each flow refinement N times (default: 1)')
+    parser.add_argument('--flow_reuse', action='store_true', dest='flow_reuse', default=False, help='Compare full cascade with flow computed at ratio 0.5 and rescaled to target ratio')
+    parser.add_argument('--warm_start', action='store_true', dest='warm_start', default=False, help='Compare full cascade with flow warm start seeded from a neighbouring ratio')
 
     args = parser.parse_args()
 
@@ -1256,21 +1260,22 @@ def main():
         device = torch.device('cpu')
     
     Flownet = None
+    checkpoint = None
+
+    if args.state_file and os.path.isfile(args.state_file):
+        try:
+            checkpoint = load_checkpoint(args.state_file)
+            print('loaded previously saved model checkpoint')
+        except Exception as e:
+            print (f'unable to load saved model checkpoint: {e}')
+            sys.exit()
 
     if args.model:
         model_name = args.model
         Flownet = find_and_import_model(base_name='flownet', model_name=model_name)            
     else:
         # Find and initialize model
-        if args.state_file and os.path.isfile(args.state_file):
-            trained_model_path = args.state_file
-            try:
-                checkpoint = torch.load(trained_model_path, map_location=device)
-                print('loaded previously saved model checkpoint')
-            except Exception as e:
-                print (f'unable to load saved model checkpoint: {e}')
-                sys.exit()
-
+        if checkpoint is not None:
             model_info = checkpoint.get('model_info')
             model_file = model_info.get('file')
             Flownet = find_and_import_model(model_file=model_file)
@@ -1335,12 +1340,6 @@ def main():
 
     trained_model_path = args.state_file
 
-    try:
-        checkpoint = torch.load(trained_model_path, map_location=device)
-        print('loaded previously saved model checkpoint')
-    except Exception as e:
-        print (f'unable to load saved model: {e}')
-
     try:
         missing_keys, unexpected_keys = flownet.load_state_dict(checkpoint['flownet_state_dict'], strict=False)
         print('loaded previously saved Flownet state')
@@ -1430,26 +1429,50 @@ def main():
 
     csv_file_name = f'{os.path.splitext(trained_model_path)[0]}.Set_{dataset_basename}.Step_{loaded_step}.eval.csv'
 
+    if args.warm_start:
+        import inspect
+        if 'flow_init' not in inspect.signature(flownet.forward).parameters:
+            print (f'Model {model_info.get("name")} does not support warm start')
+            return
+        csv_file_name = csv_file_name.replace('.eval.csv', '.warm_start.eval.csv')
+
+    if args.flow_reuse:
+        csv_file_name = csv_file_name.replace('.eval.csv', '.flow_reuse.eval.csv')
+
     if not os.path.isfile(csv_file_name):
-        create_csv_file(
-            csv_file_name,
-            [
-                'Index',
-                'Incoming',
-                'Outgoing',
-                'GT',
-                'Ratio',
-                'Min',
-                'Avg',
-                'Max',
-                'PSNR',
-                'LPIPS'
-            ]
-        )
+        csv_columns = [
+            'Index',
+            'Incoming',
+            'Outgoing',
+            'GT',
+            'Ratio',
+            'Min',
+            'Avg',
+            'Max',
+            'PSNR',
+            'LPIPS'
+        ]
+        if args.warm_start:
+            csv_columns += ['Warm PSNR', 'Warm LPIPS', 'Cold ms', 'Warm ms']
+        if args.flow_reuse:
+            csv_columns += ['Reuse PSNR', 'Reuse LPIPS']
+        create_csv_file(csv_file_name, csv_columns)
+
+    def sync():
+        if device.type == 'cuda':
+            torch.cuda.synchronize(device)
+        elif device.type == 'mps':
+            torch.mps.synchronize()
 
     eval_loss = []
     eval_psnr = []
     eval_lpips = []
+    warm_psnr = []
+    warm_lpips = []
+    cold_times = []
+    warm_times = []
+    reuse_psnr = []
+    reuse_lpips = []
 
     if args.eval_half:
         flownet.half()
@@ -1512,12 +1535,25 @@ def main():
                     eval_img0 = eval_img0.half()
                     eval_img2 = eval_img2.half()
 
+                if args.warm_start:
+                    # seed flow from the same pair at a neighbouring ratio
+                    # the way consecutive slow motion frames are rendered
+                    seed_ratio = eval_ratio - 0.25 if eval_ratio >= 0.5 else eval_ratio + 0.25
+                    seed_flow_list, seed_mask_list, _ = flownet(eval_img0, eval_img2, seed_ratio, iterations = args.iterations)
+                    seed_motion = seed_flow_list[3][:, 2:4] - seed_flow_list[3][:, :2]
+                    flow_init = torch.cat((-eval_ratio * seed_motion, (1 - eval_ratio) * seed_motion), 1)
+                    mask_init = torch.logit(seed_mask_list[3].float().clamp(1e-4, 1 - 1e-4)).to(dtype = seed_mask_list[3].dtype)
+                    sync()
+
+                cold_start_time = time.time()
                 eval_flow_list, eval_mask_list, eval_merged = flownet(
                     eval_img0, 
                     eval_img2, 
                     eval_ratio, 
                     iterations = args.iterations
                     )
+                sync()
+                cold_time = time.time() - cold_start_time
 
                 if args.eval_half:
                     eval_flow_list[3] = eval_flow_list[3].float()
@@ -1528,6 +1564,34 @@ def main():
                 eval_loss_l1 = criterion_l1(eval_result, eval_img1)
                 eval_loss_LPIPS_ = loss_fn_alex(eval_result * 2 - 1, eval_img1 * 2 - 1)
 
+                if args.warm_start:
+                    warm_start_time = time.time()
+                    warm_flow_list, warm_mask_list, _ = flownet(
+                        eval_img0,
+                        eval_img2,
+                        eval_ratio,
+                        iterations = args.iterations,
+                        flow_init = flow_init,
+                        mask_init = mask_init
+                        )
+                    sync()
+                    warm_time = time.time() - warm_start_time
+                    warm_flow = warm_flow_list[3].float()
+                    warm_mask = warm_mask_list[3].float()
+                    warm_result = warp(eval_img0_orig, warm_flow[:, :2, :eh, :ew]) * warm_mask[:, :, :eh, :ew] + warp(eval_img2_orig, warm_flow[:, 2:4, :eh, :ew]) * (1 - warm_mask[:, :, :eh, :ew])
+                    warm_loss_LPIPS_ = loss_fn_alex(warm_result * 2 - 1, eval_img1 * 2 - 1)
+
+                if args.flow_reuse:
+                    half_flow_list, half_mask_list, _ = flownet(eval_img0, eval_img2, 0.5, iterations = args.iterations)
+                    half_flow = half_flow_list[3].float()
+                    half_mask = half_mask_list[3].float()
+                    reuse_flow = torch.cat((half_flow[:, :2] * (eval_ratio / 0.5), half_flow[:, 2:4] * ((1 - eval_ratio) / 0.5)), 1)
+                    reuse_weight0 = (1 - eval_ratio) * half_mask
+                    reuse_weight1 = eval_ratio * (1 - half_mask)
+                    reuse_mask = reuse_weight0 / (reuse_weight0 + reuse_weight1 + 1e-6)
+                    reuse_result = warp(eval_img0_orig, reuse_flow[:, :2, :eh, :ew]) * reuse_mask[:, :, :eh, :ew] + warp(eval_img2_orig, reuse_flow[:, 2:4, :eh, :ew]) * (1 - reuse_mask[:, :, :eh, :ew])
+                    reuse_loss_LPIPS_ = loss_fn_alex(reuse_result * 2 - 1, eval_img1 * 2 - 1)
+
                 eval_rows_to_append = [
                     {
                         'Index': ev_item_index,
@@ -1543,6 +1607,22 @@ def main():
                         }
                 ]
 
+                if args.warm_start:
+                    warm_psnr.append(float(psnr_torch(warm_result, eval_img1)))
+                    warm_lpips.append(float(torch.mean(warm_loss_LPIPS_).item()))
+                    cold_times.append(cold_time * 1000)
+                    warm_times.append(warm_time * 1000)
+                    eval_rows_to_append[0]['Warm PSNR'] = warm_psnr[-1]
+                    eval_rows_to_append[0]['Warm LPIPS'] = warm_lpips[-1]
+                    eval_rows_to_append[0]['Cold ms'] = cold_times[-1]
+                    eval_rows_to_append[0]['Warm ms'] = warm_times[-1]
+
+                if args.flow_reuse:
+                    reuse_psnr.append(float(psnr_torch(reuse_result, eval_img1)))
+                    reuse_lpips.append(float(torch.mean(reuse_loss_LPIPS_).item()))
+                    eval_rows_to_append[0]['Reuse PSNR'] = reuse_psnr[-1]
+                    eval_rows_to_append[0]['Reuse LPIPS'] = reuse_lpips[-1]
+
                 for eval_row in eval_rows_to_append:
                     append_row_to_csv(csv_file_name, eval_row)
 
@@ -1587,6 +1667,16 @@ def main():
             }
     ]
 
+    if args.warm_start and warm_psnr:
+        eval_rows_to_append[0]['Warm PSNR'] = float(np.array(warm_psnr).mean())
+        eval_rows_to_append[0]['Warm LPIPS'] = float(np.array(warm_lpips).mean())
+        eval_rows_to_append[0]['Cold ms'] = float(np.array(cold_times).mean())
+        eval_rows_to_append[0]['Warm ms'] = float(np.array(warm_times).mean())
+
+    if args.flow_reuse and reuse_psnr:
+        eval_rows_to_append[0]['Reuse PSNR'] = float(np.array(reuse_psnr).mean())
+        eval_rows_to_append[0]['Reuse LPIPS'] = float(np.array(reuse_lpips).mean())
+
     for eval_row in eval_rows_to_append:
         append_row_to_csv(csv_file_name, eval_row)
 
@@ -1601,6 +1691,13 @@ def main():
 
     clear_lines(2)
     print(f'\rTime: {epoch_time:.2f}, Min: {eval_loss_min:.6f} Avg: {eval_loss_avg:.6f}, Max: {eval_loss_max:.6f}, [PNSR] {eval_psnr_mean:.4f}, [LPIPS] {eval_lpips_mean:.4f}')
+    if args.warm_start and warm_psnr:
+        cold_ms = float(np.array(cold_times).mean())
+        warm_ms = float(np.array(warm_times).mean())
+        print (f'Warm start: [PSNR] {float(np.array(warm_psnr).mean()):.4f} ({float(np.array(warm_psnr).mean()) - eval_psnr_mean:+.4f}), [LPIPS] {float(np.array(warm_lpips).mean()):.4f}')
+        print (f'Cascade time: cold {cold_ms:.2f} ms, warm {warm_ms:.2f} ms, speedup {cold_ms / max(warm_ms, 1e-6):.2f}x')
+    if args.flow_reuse and reuse_psnr:
+        print (f'Flow reuse: [PSNR] {float(np.array(reuse_psnr).mean()):.4f} ({float(np.array(reuse_psnr).mean()) - eval_psnr_mean:+.4f}), [LPIPS] {float(np.array(reuse_lpips).mean()):.4f}')
     print ('\n')
 
 if __name__ == "__main__":
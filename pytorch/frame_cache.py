@@ -0,0 +1,221 @@
+import os
+import json
+import functools
+import collections
+
+def get_scale_levels(frame_size):
+    """
+    Returns heights of the smaller frame side used for scale augmentation,
+    same values read_frames picks from at random.
+    """
+
+    return [
+        frame_size,
+        int(frame_size * (1 + 1/8)),
+        int(frame_size * (1 + 1/7)),
+        int(frame_size * (1 + 1/6))
+    ]
+
+def get_scaled_size(h, w, h_scaled):
+    # smaller side becomes h_scaled, aspect ratio is kept
+    if h > w:
+        return int(h_scaled * h / w), h_scaled
+    return h_scaled, int(h_scaled * w / h)
+
+@functools.lru_cache(maxsize=64)
+def get_lanczos_weights(in_size, out_size):
+    """
+    Precomputes Lanczos taps for resizing one axis from in_size to out_size.
+
+    Follows coefficient computation of PIL resample for float images,
+    the kernel is stretched by the scale factor when downsampling.
+
+    :return: Tuple of (out_size, taps) source indices and float32 weights.
+    """
+
+    import numpy as np
+
+    scale = in_size / out_size
+    filterscale = max(scale, 1.)
+    support = 3. * filterscale
+    ksize = int(np.ceil(support)) * 2 + 1
+
+    center = (np.arange(out_size, dtype=np.float64) + 0.5) * scale
+    xmin = np.maximum(np.trunc(center - support + 0.5).astype(np.int64), 0)
+    xmax = np.minimum(np.trunc(center + support + 0.5).astype(np.int64), in_size)
+    x = xmin[:, np.newaxis] + np.arange(ksize)[np.newaxis, :]
+    t = (x - center[:, np.newaxis] + 0.5) / filterscale
+
+    inside = (x < xmax[:, np.newaxis]) & (t >= -3.) & (t < 3.)
+    weights = np.where(inside, np.sinc(t) * np.sinc(t / 3.), 0.)
+    total = weights.sum(axis=1, keepdims=True)
+    weights = weights / np.where(total != 0, total, 1.)
+
+    return np.minimum(x, in_size - 1), weights.astype(np.float32)
+
+@functools.lru_cache(maxsize=64)
+def get_lanczos_bands(in_size, out_size, channels=1, band_size=32):
+    """
+    Splits Lanczos weights of one axis into bands of band_size output pixels.
+
+    Each band is a dense (outputs x inputs) matrix over the contiguous span
+    of input pixels it reads, so an axis is resampled with a few matrix
+    products instead of a pass over the whole image per filter tap.
+    With channels > 1 the matrix is expanded to interleaved channels, so
+    pixels of a row can be resampled without moving channels apart.
+
+    :return: Tuple of (out_start, out_end, in_start, in_end, weights) tuples,
+        ranges are in values, that is pixels times channels.
+    """
+
+    import numpy as np
+
+    indices, weights = get_lanczos_weights(in_size, out_size)
+    identity = np.eye(channels, dtype=np.float32)
+    bands = []
+    for out_start in range(0, out_size, band_size):
+        out_end = min(out_start + band_size, out_size)
+        band_indices = indices[out_start:out_end]
+        band_weights = weights[out_start:out_end]
+        used = band_weights != 0
+        in_start = int(band_indices[used].min())
+        in_end = int(band_indices[used].max()) + 1
+        rows = np.broadcast_to(np.arange(out_end - out_start)[:, np.newaxis], band_indices.shape)
+        band = np.zeros((out_end - out_start, in_end - in_start), dtype=np.float32)
+        np.add.at(band, (rows[used], band_indices[used] - in_start), band_weights[used])
+        bands.append((
+            out_start * channels,
+            out_end * channels,
+            in_start * channels,
+            in_end * channels,
+            np.kron(band, identity)
+            ))
+    return tuple(bands)
+
+def resample_axis(img, bands, out_size, axis):
+    # img is 2D, resampled axis is either rows (0) or columns (1)
+    import numpy as np
+
+    if axis == 0:
+        result = np.empty((out_size, img.shape[1]), dtype=np.float32)
+        for out_start, out_end, in_start, in_end, band in bands:
+            np.matmul(band, img[in_start:in_end], out=result[out_start:out_end])
+    else:
+        result = np.empty((img.shape[0], out_size), dtype=np.float32)
+        for out_start, out_end, in_start, in_end, band in bands:
+            np.matmul(img[:, in_start:in_end], band.T, out=result[:, out_start:out_end])
+    return result
+
+def resize_lanczos(img, new_h, new_w):
+    """
+    Resizes float images with Lanczos filter, matching PIL LANCZOS for mode "F".
+
+    Works on any stack of images with ...xHxWxC layout in one call, i.e. three
+    frames of a training triplet as 3xHxWx3 array. Each axis is a separable
+    pass of banded matrix products over precomputed taps. Vertical pass goes
+    first as it works on whole rows in place and leaves fewer rows for the
+    horizontal one; passes commute, so result differs from PIL only by float
+    rounding.
+    """
+
+    import numpy as np
+
+    img = np.asarray(img, dtype=np.float32)
+    shape = img.shape
+    h, w, c = shape[-3:]
+    img = img.reshape(-1, h, w * c)
+    if h != new_h:
+        bands = get_lanczos_bands(h, new_h)
+        img = np.stack([resample_axis(frame, bands, new_h, 0) for frame in img])
+    if w != new_w:
+        bands = get_lanczos_bands(w, new_w, channels=c)
+        img = resample_axis(img.reshape(-1, w * c), bands, new_w * c, 1)
+    return img.reshape(shape[:-3] + (new_h, new_w, c))
+
+class FrameCache():
+    '''
+    Read-only access to frames decoded and resized once by preprocess_dataset.py.
+
+    Each clip has one half float .npy file per scale level holding all its
+    frames as NxHxWx3 array. Files are memory-mapped, so reading a crop
+    only touches the pages it covers and the page cache is shared
+    between all processes reading the same clip.
+    '''
+
+    index_name = 'index.json'
+
+    def __init__(self, cache_folder):
+        self.cache_folder = os.path.abspath(cache_folder)
+        with open(os.path.join(self.cache_folder, self.index_name), 'r') as f:
+            self.index = json.load(f)
+        self.frame_size = self.index['frame_size']
+        self.scale_levels = self.index['scale_levels']
+
+        self.frame_lookup = {}
+        for clip_key, clip in self.index['clips'].items():
+            for frame_index, file_path in enumerate(clip['files']):
+                self.frame_lookup[file_path] = (clip_key, frame_index)
+
+        # opened lazily so that the object can be sent to reader processes
+        self.shards = {}
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['shards'] = {}
+        return state
+
+    def has(self, file_path):
+        return os.path.abspath(file_path) in self.frame_lookup
+
+    def get_frame(self, file_path, h_scaled):
+        """
+        Returns memory-mapped HxWx3 half float view of the frame at given scale level.
+        """
+
+        import numpy as np
+
+        clip_key, frame_index = self.frame_lookup[os.path.abspath(file_path)]
+        shard_key = (clip_key, h_scaled)
+        shard = self.shards.get(shard_key)
+        if shard is None:
+            shard_file = self.index['clips'][clip_key]['shards'][str(h_scaled)]
+            shard = np.load(os.path.join(self.cache_folder, shard_file), mmap_mode='r')
+            self.shards[shard_key] = shard
+        return shard[frame_index]
+
+class DecodedFrameLRU():
+    '''
+    Memory-capped least recently used cache of decoded and resized frames
+    keyed by (path, scale level), kept inside each reader process.
+
+    Overlapping training windows share most of their frames, so with
+    locality-aware shuffle a frame is often requested again shortly after
+    it was decoded.
+    '''
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.frames = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        frame = self.frames.get(key)
+        if frame is None:
+            self.misses += 1
+            return None
+        self.frames.move_to_end(key)
+        self.hits += 1
+        return frame
+
+    def put(self, key, frame):
+        if frame.nbytes > self.max_bytes:
+            return
+        if key in self.frames:
+            self.size -= self.frames.pop(key).nbytes
+        self.frames[key] = frame
+        self.size += frame.nbytes
+        while self.size > self.max_bytes:
+            _, evicted = self.frames.popitem(last=False)
+            self.size -= evicted.nbytes
@@ -32,6 +32,10 @@ class Model:
             g = (backwarp_tenGrid[k] + tenFlow).permute(0, 2, 3, 1)
             return torch.nn.functional.grid_sample(input=tenInput, grid=g, mode='bilinear', padding_mode='border', align_corners=True)
 
+        def motion_stat(tenFlow):
+            # largest 8x8 block average of absolute flow, in pixels
+            return float(torch.nn.functional.avg_pool2d(tenFlow.abs(), 8).amax())
+
         class Head(Module):
             def __init__(self):
                 super(Head, self).__init__()
@@ -129,8 +133,9 @@ class Model:
                 self.block2 = Flownet(8+4+16, c=96)
                 self.block3 = Flownet(8+4+16, c=64)
                 self.encode = Head()
+                self.exit_level = 3
 
-            def forward(self, img0, img1, timestep=0.5, scale=[8, 4, 2, 1], iterations=1):
+            def forward(self, img0, img1, timestep=0.5, scale=[8, 4, 2, 1], iterations=1, flow_init=None, mask_init=None, exit_threshold=None, exit_mask_threshold=0.02):
                 gt = None
                 # return self.encode(img0)
                 img0 = img0
@@ -154,8 +159,16 @@ class Model:
                 loss_cons = 0
                 stu = [self.block0, self.block1, self.block2, self.block3]
                 flow = None
+                flow_d = None
+                if flow_init is not None:
+                    # warm start: flow (and mask logits) carried over
+                    # from the previous frame replace block0 estimate
+                    flow = flow_init
+                    mask = mask_init if mask_init is not None else torch.zeros_like(flow_init[:, :1])
                 for i in range(4):
-                    if flow is not None:
+                    if i == 0 and flow_init is not None:
+                        conf = torch.zeros_like(mask)
+                    elif flow is not None:
                         flow_d, mask, conf = stu[i](torch.cat((warped_img0, warped_img1, warped_f0, warped_f1, timestep, mask), 1), flow, scale=scale[i])
                         flow = flow + flow_d
                     else:
@@ -170,6 +183,24 @@ class Model:
                     warped_f1 = warp(f1, flow[:, 2:4])
                     merged_student = (warped_img0, warped_img1)
                     merged.append(merged_student)
+
+                    # adaptive exit: static enough after coarse level or
+                    # last refinement changed flow and mask too little
+                    if exit_threshold is not None and i < 3:
+                        if i == 0 or flow_d is None:
+                            exit_now = motion_stat(flow) < exit_threshold
+                        else:
+                            mask_change = float((torch.sigmoid(mask_list[i]) - torch.sigmoid(mask_list[i - 1])).abs().mean())
+                            exit_now = motion_stat(flow_d) < exit_threshold and mask_change < exit_mask_threshold
+                        if exit_now:
+                            break
+                self.exit_level = len(flow_list) - 1
+                # remaining levels are filled with the last estimate
+                while len(flow_list) < 4:
+                    flow_list.append(flow_list[-1])
+                    mask_list.append(mask_list[-1])
+                    conf_list.append(conf_list[-1])
+                    merged.append(merged[-1])
                 conf = torch.sigmoid(torch.cat(conf_list, 1))
                 conf = conf / (conf.sum(1, True) + 1e-3)
                 if gt is not None:
@@ -44,6 +44,10 @@ class Model:
             g = (backwarp_tenGrid[k] + tenFlow).permute(0, 2, 3, 1)
             return torch.nn.functional.grid_sample(input=tenInput, grid=g, mode='bilinear', padding_mode='reflection', align_corners=True)
 
+        def motion_stat(tenFlow):
+            # largest 8x8 block average of absolute flow, in pixels
+            return float(torch.nn.functional.avg_pool2d(tenFlow.abs(), 8).amax())
+
         class Head(Module):
             def __init__(self):
                 super(Head, self).__init__()
@@ -137,8 +141,18 @@ class Model:
                 self.block2 = Flownet(8+4+16, c=96)
                 self.block3 = Flownet(8+4+16, c=64)
                 self.encode = Head()
+                self.exit_level = 3
+
+            def early_exit(self, level, flow_list, mask_list, merged):
+                # remaining levels are filled with the last estimate
+                for i in range(level + 1, 4):
+                    flow_list[i] = flow_list[level]
+                    mask_list[i] = mask_list[level]
+                    merged[i] = merged[level]
+                self.exit_level = level
+                return flow_list, mask_list, merged
 
-            def forward(self, img0, img1, timestep=0.5, scale=[16, 8, 4, 1], iterations=1):
+            def forward(self, img0, img1, timestep=0.5, scale=[16, 8, 4, 1], iterations=1, flow_init=None, mask_init=None, exit_threshold=None, exit_mask_threshold=0.02):
                 img0 = img0
                 img1 = img1
                 f0 = self.encode(img0)
@@ -148,12 +162,22 @@ class Model:
                 mask_list = [None] * 4
                 merged = [None] * 4
 
-                flow, mask, conf = self.block0(img0, img1, f0, f1, timestep, None, None, scale=scale[0])
+                if flow_init is None:
+                    flow, mask, conf = self.block0(img0, img1, f0, f1, timestep, None, None, scale=scale[0])
+                else:
+                    # warm start: flow (and mask logits) carried over
+                    # from the previous frame replace block0 estimate
+                    flow = flow_init
+                    mask = mask_init if mask_init is not None else torch.zeros_like(flow_init[:, :1])
 
                 flow_list[0] = flow.clone()
                 mask_list[0] = torch.sigmoid(mask.clone())
                 merged[0] = warp(img0, flow[:, :2]) * mask_list[0] + warp(img1, flow[:, 2:4]) * (1 - mask_list[0])
 
+                # adaptive exit: static enough after coarse level
+                if exit_threshold is not None and motion_stat(flow) < exit_threshold:
+                    return self.early_exit(0, flow_list, mask_list, merged)
+
                 for iteration in range(iterations):
                     flow_d, mask, conf = self.block1(
                         img0, 
@@ -171,6 +195,11 @@ class Model:
                 mask_list[1] = torch.sigmoid(mask.clone())
                 merged[1] = warp(img0, flow[:, :2]) * mask_list[1] + warp(img1, flow[:, 2:4]) * (1 - mask_list[1])
 
+                # adaptive exit: last refinement changed flow and mask too little
+                if exit_threshold is not None:
+                    if motion_stat(flow_d) < exit_threshold and float((mask_list[1] - mask_list[0]).abs().mean()) < exit_mask_threshold:
+                        return self.early_exit(1, flow_list, mask_list, merged)
+
                 for iteration in range(iterations):
                     flow_d, mask, conf = self.block2(
                         img0, 
@@ -188,6 +217,11 @@ class Model:
                 mask_list[2] = torch.sigmoid(mask.clone())
                 merged[2] = warp(img0, flow[:, :2]) * mask_list[2] + warp(img1, flow[:, 2:4]) * (1 - mask_list[2])
 
+                # adaptive exit: last refinement changed flow and mask too little
+                if exit_threshold is not None:
+                    if motion_stat(flow_d) < exit_threshold and float((mask_list[2] - mask_list[1]).abs().mean()) < exit_mask_threshold:
+                        return self.early_exit(2, flow_list, mask_list, merged)
+
                 for iteration in range(iterations):
                     flow_d, mask, conf = self.block3(
                         img0, 
@@ -205,6 +239,7 @@ class Model:
                 mask_list[3] = torch.sigmoid(mask)
                 merged[3] = warp(img0, flow[:, :2]) * mask_list[3] + warp(img1, flow[:, 2:4]) * (1 - mask_list[3])
 
+                self.exit_level = 3
                 return flow_list, mask_list, merged
 
         self.model = FlownetCas
@@ -8,7 +8,9 @@ class Model:
     info = {
         'name': 'Flownet4_v001f_v04',
         'file': 'flownet4_v001f_v04.py',
-        'ratio_support': True
+        'ratio_support': True,
+        'multi_target_support': True,
+        'checkpoint_support': True
     }
 
     def __init__(self, status = dict(), torch = None):
@@ -485,6 +487,12 @@ class Model:
                 f0xf = self.encode_xf(img0)
                 f1xf = self.encode_xf(img1)
 
+                # multi-target window: one start and end pair for several
+                # ratios, features are computed once and repeated per target
+                if torch.is_tensor(timestep) and timestep.shape[0] > img0.shape[0]:
+                    targets = timestep.shape[0] // img0.shape[0]
+                    img0, img1, f0, f1, f0xf, f1xf = [t.repeat(targets, 1, 1, 1) for t in (img0, img1, f0, f1, f0xf, f1xf)]
+
                 flow_list = [None] * 4
                 mask_list = [None] * 4
                 conf_list = [None] * 4
@@ -657,8 +665,42 @@ class Model:
             return self.training_model
         return self.model
 
-    def get_training_model(self):
-        return self.training_model
+    def get_training_model(self, checkpoint_blocks=None):
+        """
+        :param checkpoint_blocks: List of FlownetCas block names (i.e. block0, encode)
+            or "all". Activations inside these blocks are not kept for backward
+            pass and are recomputed instead, trading compute for memory.
+        """
+        if not checkpoint_blocks:
+            return self.training_model
+
+        import torch
+        import torch.utils.checkpoint
+
+        class CheckpointedFlownetCas(self.training_model):
+            def __init__(self):
+                super().__init__()
+                # can be switched off to compare against plain training
+                self.checkpointing = True
+                if checkpoint_blocks == 'all':
+                    block_names = [name for name, _ in self.named_children()]
+                else:
+                    block_names = checkpoint_blocks
+                for name in block_names:
+                    block = getattr(self, name, None)
+                    if not isinstance(block, torch.nn.Module):
+                        raise ValueError(f'{name} is not a block of {Model.info.get("name")}')
+                    block.forward = self.checkpointed(block.forward)
+                self.checkpoint_blocks = list(block_names)
+
+            def checkpointed(self, forward):
+                def checkpointed_forward(*args, **kwargs):
+                    if self.checkpointing and self.training and torch.is_grad_enabled():
+                        return torch.utils.checkpoint.checkpoint(forward, *args, use_reentrant=False, **kwargs)
+                    return forward(*args, **kwargs)
+                return checkpointed_forward
+
+        return CheckpointedFlownetCas
 
     def load_model(self, path, flownet, rank=0):
         import torch
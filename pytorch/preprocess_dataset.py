@@ -0,0 +1,175 @@
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+
+try:
+    import numpy as np
+except:
+    python_executable_path = sys.executable
+    if '.miniconda' in python_executable_path:
+        print ('Unable to import Numpy')
+        print (f'Using "{python_executable_path}" as python interpreter')
+        sys.exit()
+
+try:
+    import OpenImageIO as oiio
+except:
+    python_executable_path = sys.executable
+    if '.miniconda' in python_executable_path:
+        print ('Unable to import OpenImageIO')
+        print (f'Using "{python_executable_path}" as python interpreter')
+        sys.exit()
+
+from frame_cache import FrameCache, get_scale_levels, get_scaled_size, resize_lanczos
+
+def read_image_file(file_path, header_only = False):
+    result = {'spec': None, 'image_data': None}
+    inp = oiio.ImageInput.open(file_path)
+    if inp:
+        spec = inp.spec()
+        result['spec'] = spec
+        if not header_only:
+            channels = spec.nchannels
+            result['image_data'] = inp.read_image(0, 0, 0, channels)
+        inp.close()
+    return result
+
+def find_folders_with_exr(path):
+    directories_with_exr = set()
+    for root, dirs, files in os.walk(path, followlinks=True):
+        if 'preview' in root:
+            continue
+        if 'eval' in root:
+            continue
+        for file in files:
+            if file.endswith('.exr'):
+                directories_with_exr.add(root)
+                break
+    return directories_with_exr
+
+def cache_clip(folder_path, exr_files, cache_folder, clip_key, scale_levels):
+    """
+    Decodes each frame of the clip once and writes it at every scale level
+    into a half float .npy file per level.
+
+    :return: Dict of scale level to shard file name relative to cache folder.
+    """
+
+    header = read_image_file(exr_files[0], header_only = True)
+    h, w = header['spec'].height, header['spec'].width
+
+    shards = {}
+    shard_arrays = {}
+    for h_scaled in scale_levels:
+        new_h, new_w = get_scaled_size(h, w, h_scaled)
+        shard_file = f'{clip_key}.{h_scaled}.npy'
+        shards[str(h_scaled)] = shard_file
+        # written under temporary name and renamed when complete
+        shard_arrays[h_scaled] = np.lib.format.open_memmap(
+            os.path.join(cache_folder, shard_file + '.tmp'),
+            mode='w+',
+            dtype=np.float16,
+            shape=(len(exr_files), new_h, new_w, 3)
+        )
+
+    def read_frames(read_queue):
+        for file_path in exr_files:
+            read_queue.put(read_image_file(file_path)['image_data'])
+
+    read_queue = queue.Queue(maxsize=4)
+    read_thread = threading.Thread(target=read_frames, args=(read_queue, ))
+    read_thread.daemon = True
+    read_thread.start()
+
+    for frame_index in range(len(exr_files)):
+        img = read_queue.get()[:, :, :3].astype(np.float32)
+        # get rid of negative values before scale
+        img[img < 0] = 0.
+        for h_scaled, shard_array in shard_arrays.items():
+            new_h, new_w = shard_array.shape[1:3]
+            shard_array[frame_index] = resize_lanczos(img, new_h, new_w)
+        print (f'\r{folder_path}: frame {frame_index + 1} of {len(exr_files)}', end='')
+    print ()
+    read_thread.join()
+
+    for h_scaled, shard_array in shard_arrays.items():
+        shard_array.flush()
+        del shard_array
+    shard_arrays.clear()
+    for shard_file in shards.values():
+        os.replace(
+            os.path.join(cache_folder, shard_file + '.tmp'),
+            os.path.join(cache_folder, shard_file)
+        )
+    return shards
+
+def main():
+    parser = argparse.ArgumentParser(description='Decode and resize training clips once into memory-mapped half float shards.')
+    parser.add_argument('dataset_path', type=str, help='Path to the dataset')
+    parser.add_argument('cache_folder', type=str, nargs='?', default=None, help='Cache folder (default: <dataset_path>/cache)')
+    parser.add_argument('--frame_size', type=int, default=448, help='Training frame size in pixels (default: 448)')
+    parser.add_argument('--overwrite', action='store_true', default=False, help='Rebuild shards of clips already in cache')
+
+    args = parser.parse_args()
+
+    cache_folder = os.path.abspath(args.cache_folder if args.cache_folder else os.path.join(args.dataset_path, 'cache'))
+    os.makedirs(cache_folder, exist_ok=True)
+    index_path = os.path.join(cache_folder, FrameCache.index_name)
+    scale_levels = get_scale_levels(args.frame_size)
+
+    index = {'frame_size': args.frame_size, 'scale_levels': scale_levels, 'clips': {}}
+    if os.path.isfile(index_path) and not args.overwrite:
+        with open(index_path, 'r') as f:
+            saved_index = json.load(f)
+        if saved_index.get('frame_size') == args.frame_size:
+            index = saved_index
+        else:
+            print (f'Cache in {cache_folder} was built for frame size {saved_index.get("frame_size")}, rebuilding')
+
+    def save_index():
+        with open(index_path + '.tmp', 'w') as f:
+            json.dump(index, f, indent=4)
+        os.replace(index_path + '.tmp', index_path)
+
+    print (f'scanning for exr files in {args.dataset_path}...')
+    folders = sorted(find_folders_with_exr(args.dataset_path))
+    print (f'found {len(folders)} clip folders.')
+
+    start_time = time.time()
+    cached_frames = 0
+    for folder_index, folder_path in enumerate(folders):
+        exr_files = sorted([os.path.abspath(os.path.join(folder_path, f)) for f in os.listdir(folder_path) if f.endswith('.exr')])
+        clip_key = f'clip_{folder_index:05}'
+        cached_clip = next((k for k, c in index['clips'].items() if c['folder'] == os.path.abspath(folder_path)), None)
+        if cached_clip and index['clips'][cached_clip]['files'] == exr_files:
+            continue
+        if cached_clip:
+            clip_key = cached_clip
+        elif clip_key in index['clips']:
+            clip_key = f'clip_{len(index["clips"]):05}'
+
+        try:
+            shards = cache_clip(folder_path, exr_files, cache_folder, clip_key, scale_levels)
+        except Exception as e:
+            print (f'\nError caching {folder_path}: {e}')
+            continue
+
+        index['clips'][clip_key] = {
+            'folder': os.path.abspath(folder_path),
+            'files': exr_files,
+            'shards': shards
+        }
+        # saved after each clip so an interrupted run can be resumed
+        save_index()
+        cached_frames += len(exr_files)
+
+    save_index()
+    print (f'Cached {cached_frames} frames at {len(scale_levels)} scale levels in {time.time() - start_time:.1f}s')
+    print (f'Index saved to {index_path}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import os
+import sys
+import argparse
+import fnmatch
+import time
+
+try:
+    import numpy as np
+    import torch
+except:
+    python_executable_path = sys.executable
+    if '.miniconda' in python_executable_path:
+        print ('Unable to import Numpy and PyTorch libraries')
+        print (f'Using {python_executable_path} python interpreter')
+        sys.exit()
+
+precisions = {
+    'fp32': torch.float32,
+    'fp16': torch.float16,
+    'bf16': torch.bfloat16,
+}
+
+block_columns = ['encode', 'block0', 'block1', 'block2', 'block3']
+
+def list_models(models_dir, pattern):
+    models_abs_path = os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            models_dir
+        )
+    )
+    files = [f for f in os.listdir(models_abs_path) if f.endswith('.py')]
+    return sorted([f for f in files if fnmatch.fnmatch(f, pattern)])
+
+def import_model(model_file):
+    import importlib
+    module_name = model_file[:-3]  # Remove '.py' from filename to get module name
+    module = importlib.import_module(f'models.{module_name}')
+    return getattr(module, 'Model')
+
+def pad_to(size, multiple=64):
+    return ((size - 1) // multiple + 1) * multiple
+
+def sync(device):
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    elif device.type == 'mps':
+        torch.mps.synchronize()
+
+def count_flops(net, img0, img1):
+    """
+    Counts forward FLOPs for the whole model and for each of its
+    direct submodules (encode, block0 etc).
+
+    :return: Tuple of total FLOPs and {submodule name: FLOPs} dictionary.
+    """
+
+    from torch.utils.flop_counter import FlopCounterMode
+
+    flop_counter = FlopCounterMode(display=False)
+    with flop_counter:
+        net(img0, img1, 0.5)
+
+    per_block = {}
+    for module_name, counts in flop_counter.get_flop_counts().items():
+        # module names come as "FlownetCas.block0.conv0.0"
+        parts = module_name.split('.')
+        if len(parts) == 2:
+            per_block[parts[1]] = per_block.get(parts[1], 0) + sum(counts.values())
+    return flop_counter.get_total_flops(), per_block
+
+def measure_latency(net, img0, img1, device, warmup, runs):
+    for _ in range(warmup):
+        net(img0, img1, 0.5)
+    sync(device)
+
+    timings = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        net(img0, img1, 0.5)
+        sync(device)
+        timings.append((time.perf_counter() - start_time) * 1000)
+    return np.percentile(timings, [50, 90, 99])
+
+def measure_peak_memory(net, img0, img1, device):
+    """
+    Returns peak memory in bytes allocated during a single forward pass.
+
+    On CUDA it comes from the caching allocator. On other devices the
+    memory events recorded by torch.profiler are replayed in order and
+    the highest running total is taken, so it is an approximation that
+    does not include memory held before the call.
+    """
+
+    if device.type == 'cuda':
+        sync(device)
+        torch.cuda.reset_peak_memory_stats(device)
+        base_memory = torch.cuda.memory_allocated(device)
+        net(img0, img1, 0.5)
+        sync(device)
+        return torch.cuda.max_memory_allocated(device) - base_memory
+
+    from torch.profiler import profile, ProfilerActivity
+
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        net(img0, img1, 0.5)
+
+    events = sorted(prof.events(), key=lambda e: e.time_range.start)
+    current_memory = 0
+    peak_memory = 0
+    for event in events:
+        current_memory += event.self_cpu_memory_usage
+        peak_memory = max(peak_memory, current_memory)
+    return peak_memory
+
+def print_table(rows, columns):
+    widths = {c: max(len(c), max(len(str(row.get(c, ''))) for row in rows)) for c in columns}
+    print (' '.join(f'{c:>{widths[c]}}' for c in columns))
+    for row in rows:
+        print (' '.join(f'{str(row.get(c, "")):>{widths[c]}}' for c in columns))
+
+def main():
+    parser = argparse.ArgumentParser(description='Profile cost of the models in pytorch/models.')
+    parser.add_argument('--models', type=str, default='flownet4_v001*', help='Model file name pattern (default: flownet4_v001*)')
+    parser.add_argument('--frame_sizes', type=str, default='960x540,1920x1080', help='Comma separated frame sizes (default: 960x540,1920x1080)')
+    parser.add_argument('--precisions', type=str, default='fp32,bf16', help='Comma separated precisions: fp32, fp16, bf16 (default: fp32,bf16)')
+    parser.add_argument('--device', type=str, default='cpu', help='Torch device (default: cpu)')
+    parser.add_argument('--warmup', type=int, default=2, help='Untimed runs per configuration (default: 2)')
+    parser.add_argument('--runs', type=int, default=10, help='Timed runs per configuration (default: 10)')
+    parser.add_argument('--threads', type=int, default=None, help='Number of CPU threads (default: torch default)')
+    parser.add_argument('--sort', type=str, default='model', help='Column to sort the table by, i.e. p50_ms or gflops (default: model)')
+    parser.add_argument('--csv', type=str, default=None, help='Save results to csv file')
+
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    frame_sizes = []
+    for frame_size in args.frame_sizes.split(','):
+        w, h = frame_size.split('x')
+        frame_sizes.append((int(w), int(h)))
+
+    rows = []
+    for model_file in list_models('models', args.models):
+        try:
+            Net = import_model(model_file)
+            net = Net().get_model()().to(device)
+            net.eval()
+        except Exception as e:
+            print (f'Unable to create {model_file}: {e}')
+            continue
+
+        # warp grid cache inside the model is not keyed by dtype
+        # so each precision gets its own instance
+        nets = {'fp32': net}
+        for precision in args.precisions.split(','):
+            if precision not in nets:
+                nets[precision] = Net().get_model()().to(device=device, dtype=precisions[precision])
+                nets[precision].eval()
+
+        params = sum(p.numel() for p in net.parameters())
+        print (f'{Net.get_name()}: {params / 1e6:.2f}M parameters')
+
+        for w, h in frame_sizes:
+            shape = (1, 3, pad_to(h), pad_to(w))
+            generator = torch.Generator().manual_seed(42)
+            img0 = torch.rand(shape, generator=generator).to(device)
+            img1 = torch.rand(shape, generator=generator).to(device)
+
+            with torch.no_grad():
+                try:
+                    total_flops, block_flops = count_flops(net, img0, img1)
+                except Exception as e:
+                    print (f'Unable to count FLOPs for {model_file} at {w}x{h}: {e}')
+                    total_flops, block_flops = 0, {}
+
+                for precision in args.precisions.split(','):
+                    row = {
+                        'model': Net.get_name(),
+                        'params_m': round(params / 1e6, 3),
+                        'frame_size': f'{w}x{h}',
+                        'precision': precision,
+                        'gflops': round(total_flops / 1e9, 2),
+                    }
+                    for block_name in block_columns:
+                        row[block_name] = round(block_flops.get(block_name, 0) / 1e9, 2)
+                    row['other'] = round((total_flops - sum(block_flops.get(b, 0) for b in block_columns)) / 1e9, 2)
+
+                    dtype = precisions[precision]
+                    try:
+                        p50, p90, p99 = measure_latency(
+                            nets[precision],
+                            img0.to(dtype),
+                            img1.to(dtype),
+                            device,
+                            args.warmup,
+                            args.runs
+                        )
+                        peak_memory = measure_peak_memory(nets[precision], img0.to(dtype), img1.to(dtype), device)
+                        row['p50_ms'] = round(p50, 2)
+                        row['p90_ms'] = round(p90, 2)
+                        row['p99_ms'] = round(p99, 2)
+                        row['peak_mb'] = round(peak_memory / (1024 ** 2), 1)
+                    except Exception as e:
+                        print (f'Unable to run {model_file} at {w}x{h} {precision}: {e}')
+                        row['p50_ms'] = row['p90_ms'] = row['p99_ms'] = row['peak_mb'] = None
+
+                    rows.append(row)
+                    print (f'  {w}x{h} {precision}: {row["gflops"]} GFLOPs, p50 {row["p50_ms"]} ms, peak {row["peak_mb"]} MB')
+
+        del net, nets
+        if device.type == 'cuda':
+            torch.cuda.empty_cache()
+
+    if not rows:
+        print (f'No models matching "{args.models}"')
+        return
+
+    columns = list(rows[0].keys())
+    if args.sort not in columns:
+        print (f'Unknown sort column "{args.sort}", available: {", ".join(columns)}')
+        args.sort = 'model'
+
+    # rows that failed to run go to the end
+    rows.sort(key=lambda row: (row[args.sort] is None, row[args.sort] if row[args.sort] is not None else 0))
+
+    print ('')
+    print_table(rows, columns)
+
+    if args.csv:
+        import csv
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(row)
+        print (f'Results saved to {args.csv}')
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,9 @@ import threading
 import time
 import platform
 
+from device_pool import parse_devices, shard_by_pairs, run_device_pool
+from checkpoint_io import load_checkpoint
+
 try:
     import numpy as np
     import torch
@@ -490,6 +493,7 @@ def save_frames(save_queue):
             time.sleep(timeout)
             continue
         if item is None:
+            save_queue.task_done()
             time.sleep(timeout)
             continue
         try:
@@ -499,6 +503,8 @@ def save_frames(save_queue):
         except Exception as e:
             print (f'unable to save frame {output_path}: {e}')
             time.sleep(timeout)
+        # lets render_frames wait for the last frames to be written
+        save_queue.task_done()
 
         time.sleep(timeout)
 
@@ -537,40 +543,11 @@ def warp(tenInput, tenFlow):
 
     return result.detach().to(device=input_device, dtype=input_dtype)
 
-
-def main():
-    parser = argparse.ArgumentParser(description='Retime script.')
-    # Required argument
-    parser.add_argument('src_path', type=str, help='Path to the source tree')
-    parser.add_argument('dst_path', type=str, help='Path to the destination folder')
-    parser.add_argument('--speed', type=float, required=True, help='Speed factor for retime in percents')
-    # Optional arguments
-    default_model_path = os.path.join(
-        os.path.abspath(os.path.dirname(__file__)),
-        'models',
-        'flownet.pkl'
-    )
-    parser.add_argument('--model_path', type=str, default=default_model_path, help='Path to the pre-trained model (optional)')
-    parser.add_argument('--iterations', type=int, default=1, help='Run each refinement pass for N iterations (default: 1)')
-    parser.add_argument('--device', type=int, default=0, help='Graphics card index (default: 0)')
-
-    args = parser.parse_args()
-
-    folders_with_exr = find_folders_with_exr(args.src_path)
-    common_path = os.path.commonpath(folders_with_exr)
-    
-    all_frame_descriptions = []
-
-    for folder_index, folder_path in enumerate(sorted(folders_with_exr)):
-        print (f'\rScanning folder {folder_index + 1} of {len(folders_with_exr)}', end='')
-        folder_frames_map = compose_frames_map_speed(folder_path, common_path, args.dst_path, args.speed)
-        for key in sorted(folder_frames_map.keys()):
-            all_frame_descriptions.append(folder_frames_map[key])
-    print ('')
-
+def render_frames(device, frame_descriptions, progress, model_path, iterations = 1):
+    # renders given frames on a single device, also used as a device pool worker
     print ('starting frame read thread...')
     frames_queue = queue.Queue(maxsize=8)
-    frame_read_thread = threading.Thread(target=read_frames, args=(all_frame_descriptions, frames_queue))
+    frame_read_thread = threading.Thread(target=read_frames, args=(frame_descriptions, frames_queue))
     frame_read_thread.daemon = True
     frame_read_thread.start()
 
@@ -580,14 +557,13 @@ def main():
     frame_save_thread.daemon = True
     frame_save_thread.start()
 
-    print ('loading model...')
-    device = torch.device("mps") if platform.system() == 'Darwin' else torch.device(f'cuda:{args.device}')
+    print (f'loading model on {device}...')
+    device = torch.device(device)
     try:
-        checkpoint = torch.load(args.model_path, map_location=device)
+        checkpoint = load_checkpoint(model_path)
         print('loaded previously saved model checkpoint')
     except Exception as e:
-        print (f'unable to load saved model checkpoint: {e}')
-        sys.exit()
+        raise Exception(f'unable to load saved model checkpoint: {e}')
 
     model_info = checkpoint.get('model_info')
     model_file = model_info.get('file')
@@ -595,14 +571,14 @@ def main():
     model = Flownet().get_model()().to(device)
 
     model.load_state_dict(checkpoint['flownet_state_dict'])
-    if 'mps' not in str(device):
-        model.half()
+    del checkpoint
+    # half precision is only used on cuda, it is slow or not supported on cpu and mps
+    dtype = torch.float16 if device.type == 'cuda' else torch.float32
+    model.to(dtype = dtype)
     
     model.eval()
 
-    for frame_idx in range(len(all_frame_descriptions)):
-        print (f'\rProcessing frame {frame_idx + 1} of {len(all_frame_descriptions)}', end='')
-
+    for frame_idx in range(len(frame_descriptions)):
         with torch.no_grad():
             frame_data = frames_queue.get()
             if frame_data['ratio'] == 0:
@@ -611,17 +587,11 @@ def main():
                 result = frame_data['outgoing_data']
             else:
                 img0 = torch.from_numpy(frame_data['incoming_data'].copy())
-                if 'mps' not in str(device):
-                    img0 = img0.to(device = device, dtype = torch.float16, non_blocking = True)
-                else:
-                    img0 = img0.to(device = device, dtype = torch.float32, non_blocking = True)
+                img0 = img0.to(device = device, dtype = dtype, non_blocking = True)
                 img0 = img0.permute(2, 0, 1).unsqueeze(0)
 
                 img1 = torch.from_numpy(frame_data['outgoing_data'].copy())
-                if 'mps' not in str(device):
-                    img1 = img1.to(device = device, dtype = torch.float16, non_blocking = True)
-                else:
-                    img1 = img1.to(device = device, dtype = torch.float32, non_blocking = True)
+                img1 = img1.to(device = device, dtype = dtype, non_blocking = True)
                 img1 = img1.permute(2, 0, 1).unsqueeze(0)
 
                 img0_ref = normalize(img0)
@@ -639,7 +609,7 @@ def main():
                     img0_ref, 
                     img1_ref, 
                     frame_data['ratio'], 
-                    iterations = args.iterations
+                    iterations = iterations
                     )
 
                 result = warp(img0, flow_list[3][:, :2, :h, :w]) * mask_list[3][:, :, :h, :w] + warp(img1, flow_list[3][:, 2:4, :h, :w]) * (1 - mask_list[3][:, :, :h, :w])
@@ -651,12 +621,81 @@ def main():
                 del img0, img1, flow_list, mask_list, merged
 
             output_path = frame_data['destination']
-            if not os.path.isdir(os.path.dirname(output_path)):
-                os.makedirs(os.path.dirname(output_path))
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
             save_queue.put((result, output_path))
+            progress(1)
 
             del frame_data, result
 
+    save_queue.join()
+
+def main():
+    parser = argparse.ArgumentParser(description='Retime script.')
+    # Required argument
+    parser.add_argument('src_path', type=str, help='Path to the source tree')
+    parser.add_argument('dst_path', type=str, help='Path to the destination folder')
+    parser.add_argument('--speed', type=float, required=True, help='Speed factor for retime in percents')
+    # Optional arguments
+    default_model_path = os.path.join(
+        os.path.abspath(os.path.dirname(__file__)),
+        'models',
+        'flownet.pkl'
+    )
+    parser.add_argument('--model_path', type=str, default=default_model_path, help='Path to the pre-trained model (optional)')
+    parser.add_argument('--iterations', type=int, default=1, help='Run each refinement pass for N iterations (default: 1)')
+    parser.add_argument('--device', type=int, default=0, help='Graphics card index (default: 0)')
+    parser.add_argument('--devices', type=str, default=None, help='Comma separated devices to split frames between, i.e. 0,1 or cpu,cpu (default: --device)')
+
+    args = parser.parse_args()
+
+    folders_with_exr = find_folders_with_exr(args.src_path)
+    common_path = os.path.commonpath(folders_with_exr)
+    
+    all_frame_descriptions = []
+
+    for folder_index, folder_path in enumerate(sorted(folders_with_exr)):
+        print (f'\rScanning folder {folder_index + 1} of {len(folders_with_exr)}', end='')
+        folder_frames_map = compose_frames_map_speed(folder_path, common_path, args.dst_path, args.speed)
+        for key in sorted(folder_frames_map.keys()):
+            all_frame_descriptions.append(folder_frames_map[key])
+    print ('')
+
+    if args.devices:
+        devices = parse_devices(args.devices)
+    else:
+        devices = ['mps' if platform.system() == 'Darwin' else f'cuda:{args.device}']
+
+    if len(devices) > 1:
+        # contiguous shard per device, runs of frames sharing
+        # the same source pair are kept on the same device
+        shards = shard_by_pairs(
+            all_frame_descriptions,
+            lambda description: (description['incoming'], description['outgoing']),
+            len(devices)
+        )
+        success, _ = run_device_pool(
+            render_frames,
+            devices,
+            shards,
+            worker_args = (args.model_path, args.iterations),
+            desc = 'Processing'
+        )
+        if not success:
+            print ('some of the frames failed to render')
+            sys.exit(1)
+        return
+
+    def progress(count = 1):
+        progress.frames_done += count
+        print (f'\rProcessing frame {progress.frames_done} of {len(all_frame_descriptions)}', end='')
+    progress.frames_done = 0
+
+    try:
+        render_frames(devices[0], all_frame_descriptions, progress, args.model_path, args.iterations)
+    except Exception as e:
+        print (f'{e}')
+        sys.exit()
+
     print ('\n')
 
 if __name__ == "__main__":